@@ -1,17 +1,23 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from flask_cors import CORS
-from chat import get_response
-import requests
-import sqlite3
+from chat import get_response, load_csv_tier, load_csv_matcher, load_csv_semantic
 import os
-from datetime import datetime
+import json
 from dotenv import load_dotenv
-from handbook_rag import init_rag, get_rag_context
-from urllib.parse import quote
+from handbook_rag import (init_rag, get_rag_context, reindex_handbook, current_index_version,
+                          reload_current_index, ensure_index_watch, get_embedding_model)
+from pipeline import (
+    get_smart_response, get_groq_response, stream_answer, add_contact_link,
+    response_cache, semantic_cache
+)
+from async_pipeline import answer_messages_async, run_in_background_loop
+import chat as chat_module
+import handbook_rag
+import metrics
+import warmup
+from history_store import HistoryStore, parse_limit
 
 load_dotenv('.env')
-API_KEY = os.getenv('API_KEY')
-API_URL = "https://api.groq.com/openai/v1/chat/completions"
 
 app = Flask(__name__, template_folder='C:/Staff_Chatbot/static') 
 CORS(app)
@@ -21,165 +27,59 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 
 HANDBOOK_PDF_PATH = "HandbookQA.pdf"
-if os.path.exists(HANDBOOK_PDF_PATH):
-    init_rag(HANDBOOK_PDF_PATH)
-
-CSV_CONFIDENCE_THRESHOLD = 0.30
-RAG_CONFIDENCE_THRESHOLD = 0.30
-
-# Add your support ticket URL here
-SUPPORT_TICKET_URL = "https://support.greenspringsschool.com/"  # Replace with actual URL
-
-# future refernce-Add emails here with keywords that will trigger them
-CONTACT_EMAILS = {
-    'hr': {
-        'email': 'request.lekki@greenspringsschool.com',
-        'subject': 'HR Request',
-        'keywords': ['hr', 'human resources', 'request', 'staff request', 'personnel']
-    }
-}
-
-def should_add_contact_link(message, response):
-    message_lower = message.lower()
-    response_lower = response.lower() if response else ""
-    
-    triggers = ['more information', 'contact', 'email', 'request', 'how do i', 'reach out']
-    
-    for trigger in triggers:
-        if trigger in message_lower or trigger in response_lower:
-            return True
-    return False
+# Further policy PDFs (IT, safeguarding, ...) are indexed from this directory
+HANDBOOK_DIR = os.getenv('HANDBOOK_DIR', 'handbooks')
+handbook_sources = [path for path in (HANDBOOK_PDF_PATH, HANDBOOK_DIR) if os.path.exists(path)]
 
-def get_relevant_contact(message):
-    message_lower = message.lower()
-    
-    for contact_type, contact_info in CONTACT_EMAILS.items():
-        for keyword in contact_info['keywords']:
-            if keyword in message_lower:
-                return contact_type, contact_info
-    
-    return 'hr', CONTACT_EMAILS['hr']
+def warm_rag():
+    """
+    Load the handbook index and watch for artifacts activated later
+    A prebuilt artifact from build_index.py takes precedence over indexing
+    the PDFs at startup. Either way the watcher hot-swaps to any artifact
+    build_index.py --activate makes current while the server runs.
+    """
+    if current_index_version() and reload_current_index():
+        ready = True
+    else:
+        ready = bool(handbook_sources) and init_rag(handbook_sources)
+    # Started after init_rag, so the PDF index can't replace an artifact that went live meanwhile
+    ensure_index_watch()
+    return ready
 
-def add_contact_link(response, message):
-    if not should_add_contact_link(message, response):
-        return response
-    
-    contact_type, contact_info = get_relevant_contact(message)
-    email = contact_info['email']
-    subject = contact_info['subject']
-    
-    # Create Gmail web link only
-    gmail_link = f"https://mail.google.com/mail/?view=cm&fs=1&to={email}&su={quote(subject)}"
-    
-    # Simple contact section without border
-    contact_section = f'''
+# Cheapest first: the CSV tier answers while MiniLM and the index load
+WARMUP_STEPS = [
+    ('csv', load_csv_tier),
+    ('csv_tfidf', load_csv_matcher),
+    ('embeddings', lambda: get_embedding_model() is not None),
+    ('csv_semantic', load_csv_semantic),
+    ('rag', warm_rag),
+]
+warmup.start(WARMUP_STEPS)
 
-<div style="margin-top: 10px;">
-    <a href="{gmail_link}" target="_blank" style="color: #1a73e8; text-decoration: none; font-weight: 500;">📧 Open in Gmail</a>
-</div>'''
-    
-    return response + contact_section
-
-def is_greeting(message):
-    greetings = ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 
-                 'good evening', 'greetings', 'howdy', 'sup', 'what\'s up']
-    msg_lower = message.lower().strip()
-    return any(greeting in msg_lower for greeting in greetings) and len(msg_lower.split()) <= 3
-
-def get_groq_response(message, context=None, is_greeting=False):
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    current_date = datetime.now().strftime("%B %Y")
-    
-    if is_greeting:
-        system_content = f"""You are Greeny G, a friendly support assistant for Greensprings School.
-Respond to greetings warmly and briefly introduce yourself as Greeny G. Keep it to 1-2 sentences.
-Then add this exact HTML on a new line:
-<div style="margin-top: 10px; padding: 8px; background-color: #f0f7ff; border-radius: 4px;">
-    <span style="font-size: 14px;">Need more help? </span>
-    <a href="{SUPPORT_TICKET_URL}" target="_blank" style="color: #1a73e8; text-decoration: none; font-weight: 500;"> - To raise a Ticket for Assistance</a>
-</div>"""
-        
-    elif context:
-        system_content = f"""You are Greeny G, a support assistant for Greensprings School.
-Current date: {current_date}
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# Largest batch /predict accepts
+PREDICT_BATCH_MAX = int(os.getenv('PREDICT_BATCH_MAX', '500'))
 
-HANDBOOK CONTEXT:
-{context}
+# History rows are written in batches by a background thread
+history = HistoryStore(
+    db_path=os.getenv('CHAT_HISTORY_DB', 'chat_history.db'),
+    max_queue=int(os.getenv('CHAT_HISTORY_QUEUE_SIZE', '10000'))
+)
 
-Answer ONLY what was asked in under 50 words. Be direct and concise."""
-    else:
-        system_content = f"""You are Greeny G, a support assistant for Greensprings School.
-Current date: {current_date}
+def after_fork():
+    """
+    Called in each worker forked from a parent that imported the app
+    (gunicorn.conf.py post_fork). The loaded tiers are inherited; threads,
+    locks held by them and SQLite connections are not safe to inherit.
+    """
+    chat_module.after_fork()
+    handbook_rag.after_fork()
+    response_cache.after_fork()
+    history.after_fork()
+    warmup.resume(WARMUP_STEPS)
 
-Answer in 1-2 sentences maximum (under 50 words). Be direct and helpful."""
-    
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": [
-            {"role": "system", "content": system_content},
-            {"role": "user", "content": message}
-        ],
-        "temperature": 0.3,
-        "max_tokens": 150,
-        "top_p": 0.8
-    }
-    
-    try:
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=30)
-        if response.status_code == 200:
-            return response.json()['choices'][0]['message']['content'].strip()
-        return None
-    except:
-        return None
-
-def is_weak_response(response):
-    if not response or len(response.strip()) < 10:
-        return True
-    
-    weak_phrases = ['i do not understand', 'i don\'t understand', 'i don\'t know',
-                    'not sure', 'i can\'t help', 'unclear']
-    
-    return any(phrase in response.lower() for phrase in weak_phrases)
-
-def get_smart_response(user_message):
-    base_response = None
-    
-    if is_greeting(user_message):
-        base_response = get_groq_response(user_message, is_greeting=True)
-    
-    if not base_response:
-        try:
-            result = get_response(user_message)
-            if isinstance(result, tuple):
-                csv_response, csv_confidence = result
-                if csv_response and csv_confidence >= CSV_CONFIDENCE_THRESHOLD and not is_weak_response(csv_response):
-                    base_response = csv_response
-        except:
-            pass
-    
-    if not base_response:
-        try:
-            handbook_context, rag_confidence, handbook_pages = get_rag_context(user_message)
-            if handbook_context and len(handbook_context.strip()) > 10:
-                groq_response = get_groq_response(user_message, context=handbook_context)
-                if groq_response and not is_weak_response(groq_response):
-                    base_response = groq_response
-        except:
-            pass
-    
-    if not base_response:
-        groq_response = get_groq_response(user_message)
-        if groq_response and not is_weak_response(groq_response):
-            base_response = groq_response
-    
-    if not base_response:
-        base_response = "I'm sorry, I couldn't find a specific answer. Please contact Greensprings School support."
-    
-    return add_contact_link(base_response, user_message)
+def is_admin_request():
+    return bool(ADMIN_TOKEN) and request.headers.get('X-Admin-Token') == ADMIN_TOKEN
 
 @app.route("/", methods=["GET"])
 def index_get():
@@ -196,46 +96,133 @@ def chat():
             return jsonify({"reply": "Please enter a message."})
         
         bot_response = get_smart_response(user_message)
-        
-        conn = sqlite3.connect('chat_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO conversations (user_id, message, response)
-            VALUES (?, ?, ?)
-        ''', (user_id, user_message, bot_response))
-        conn.commit()
-        conn.close()
+        save_conversation(user_id, user_message, bot_response)
         
         return jsonify({"reply": bot_response})
         
     except Exception as e:
         return jsonify({"reply": "Sorry, I'm experiencing technical difficulties."})
 
+def save_conversation(user_id, user_message, bot_response):
+    history.save(user_id, user_message, bot_response)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Server-Sent Events version of /chat
+    Events: 'token' {text} while the answer is produced, 'contact' {html}
+    with the contact link when one applies, then 'done' {tier}.
+    History is written once the answer is complete.
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id", "guest")
+    user_message = data.get("message", "").strip()
+    
+    def generate():
+        if not user_message:
+            yield sse_event('token', {"text": "Please enter a message."})
+            yield sse_event('done', {"tier": None})
+            return
+        
+        try:
+            parts = []
+            tier = None
+            for event, value in stream_answer(user_message):
+                if event == 'token':
+                    parts.append(value)
+                    yield sse_event('token', {"text": value})
+                else:
+                    tier = value
+            
+            response = ''.join(parts)
+            bot_response = add_contact_link(response, user_message)
+            if len(bot_response) > len(response):
+                yield sse_event('contact', {"html": bot_response[len(response):]})
+            
+            save_conversation(user_id, user_message, bot_response)
+            yield sse_event('done', {"tier": tier})
+        except Exception as e:
+            print(f" Stream error: {e}")
+            yield sse_event('error', {"text": "Sorry, I'm experiencing technical difficulties."})
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def fetch_history(user_id, limit=None, cursor=None):
+    """One page of history: (rows, next_cursor)"""
+    return history.fetch(user_id, parse_limit(limit), cursor)
+
+def ndjson_history(user_id, limit=None, cursor=None):
+    """
+    History as NDJSON lines, read from SQLite a page at a time
+    Without a limit this is the whole history; with one, a final
+    {"next_cursor": ...} line follows when more rows remain.
+    """
+    pages = history.iter_pages(user_id, cursor, parse_limit(limit, default=None))
+    
+    def generate():
+        next_cursor = None
+        for rows, next_cursor in pages:
+            for row in rows:
+                yield json.dumps(row) + "\n"
+        if next_cursor:
+            yield json.dumps({"next_cursor": next_cursor}) + "\n"
+    
+    return generate()
+
+def wants_ndjson(format_param, accept_header):
+    return format_param == 'ndjson' or 'application/x-ndjson' in (accept_header or '')
+
 @app.route("/chat/<user_id>", methods=["GET"])
 def get_history(user_id):
+    """
+    Newest first, one page at a time
+    ?limit=N (default 50, at most 500) and ?cursor=<next_cursor of the previous page>.
+    With ?format=ndjson (or Accept: application/x-ndjson) rows are streamed
+    one JSON object per line instead.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
     try:
-        conn = sqlite3.connect('chat_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT message, response, timestamp 
-            FROM conversations 
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-        ''', (user_id,))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        history = [{"message": row[0], "response": row[1], "timestamp": row[2]} for row in rows]
-        return jsonify({"history": history})
-        
+        if wants_ndjson(request.args.get('format'), request.headers.get('Accept')):
+            return Response(ndjson_history(user_id, limit, cursor), mimetype='application/x-ndjson')
+        rows, next_cursor = fetch_history(user_id, limit, cursor)
+        return jsonify({"history": rows, "next_cursor": next_cursor})
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
     except:
         return jsonify({"error": "Could not fetch history"})
 
+def batch_messages(data):
+    """
+    The messages of a batch /predict body ({"messages": [...]}), stripped
+    Raises: ValueError when they aren't a list of at most PREDICT_BATCH_MAX strings
+    """
+    messages = data.get("messages")
+    if not isinstance(messages, list) or not all(isinstance(message, str) for message in messages):
+        raise ValueError("messages must be an array of strings")
+    if len(messages) > PREDICT_BATCH_MAX:
+        raise ValueError(f"At most {PREDICT_BATCH_MAX} messages per request")
+    return [message.strip() for message in messages]
+
+def batch_reply(answers):
+    return {"answers": [{"answer": answer, "tier": tier} for answer, tier in answers]}
+
 @app.route("/predict", methods=["POST"])
 def predict():
     try:
         data = request.get_json()
+        # A batch: {"messages": [...]} is answered with {"answers": [{"answer", "tier"}, ...]} in order
+        if "messages" in data:
+            try:
+                messages = batch_messages(data)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify(batch_reply(run_in_background_loop(answer_messages_async(messages))))
+
         text = data.get("message", "").strip()
         
         if not text:
@@ -247,6 +234,75 @@ def predict():
     except:
         return jsonify({"answer": "Sorry, I'm experiencing technical difficulties."})
 
+def readiness():
+    """(body, status): ready once the CSV tier can answer, with every tier's warm-up state"""
+    tiers = warmup.status()
+    ready = warmup.is_warm('csv')
+    return {"ready": ready, "warm": all(tier["state"] == warmup.READY for tier in tiers.values()),
+            "tiers": tiers}, 200 if ready else 503
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    body, status = readiness()
+    return jsonify(body), status
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
+@app.route("/admin/cache", methods=["GET"])
+def cache_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(response_cache.stats())
+
+@app.route("/admin/cache/invalidate", methods=["POST"])
+def invalidate_cache():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    data = request.get_json(silent=True) or {}
+    removed = response_cache.invalidate(message=data.get("message"), tier=data.get("tier"))
+    if not data.get("message") and data.get("tier") in (None, 'rag', 'llm'):
+        semantic_cache.clear()
+    return jsonify({"removed": removed})
+
+@app.route("/admin/rag/reindex", methods=["POST"])
+def reindex_rag():
+    """Re-embed the handbook chunks that changed; body {"force": true} re-reads an unchanged PDF"""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    data = request.get_json(silent=True) or {}
+    stats = reindex_handbook(force=bool(data.get("force")))
+    if stats is None:
+        return jsonify({"error": "RAG is not initialized"}), 409
+    
+    # Answers built on the old passages may now be wrong
+    if any(source["added"] or source["deleted"] for source in stats):
+        response_cache.invalidate(tier='rag')
+        semantic_cache.clear()
+    return jsonify({"sources": stats})
+
+@app.route("/admin/rag/reload", methods=["POST"])
+def reload_rag():
+    """Swap to the index artifact named by indexes/CURRENT without waiting for the next poll"""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    version = current_index_version()
+    if version is None:
+        return jsonify({"error": "No index artifact is active"}), 409
+    
+    swapped = reload_current_index()
+    if handbook_rag.active_index_version != version:
+        return jsonify({"error": f"Could not load index {version}"}), 500
+    
+    if swapped:
+        response_cache.invalidate(tier='rag')
+        semantic_cache.clear()
+    return jsonify({"version": version, "swapped": swapped})
+
 @app.route("/test-groq", methods=["GET"])
 def test_groq():
     test_response = get_groq_response("What year is it now?")
@@ -260,11 +316,11 @@ def test_csv():
 @app.route("/test-rag")
 def test_rag():
     test_question = "Can PE staff wear their sportswear throughout the day?"
-    context, confidence, pages = get_rag_context(test_question)
+    context, confidence, citations = get_rag_context(test_question)
     
     if context:
         concise_response = get_groq_response(test_question, context=context)
-        return f"RAG working. Confidence: {confidence:.2%}, Response: {concise_response}"
+        return f"RAG working. Confidence: {confidence:.2%}, Sources: {'; '.join(citations)}, Response: {concise_response}"
     return "RAG found nothing"
 
 @app.route("/test-all")
@@ -278,7 +334,7 @@ def test_all():
         results.append("CSV: Failed")
     
     try:
-        context, conf, pages = get_rag_context("test")
+        context, conf, citations = get_rag_context("test")
         results.append(f"RAG: Working ({conf:.2%})")
     except:
         results.append("RAG: Failed")
@@ -0,0 +1,257 @@
+"""
+ASGI serving mode for the chatbot API
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Serves /chat, /chat/stream, /predict and /chat/<user_id> with the same
+request and response bodies as the Flask app, but runs the answer tiers
+with async_pipeline, so one process can keep hundreds of chats waiting on
+Groq without a worker thread each. The page at / and /static/* are served
+from the Flask app's template and static folders.
+"""
+import asyncio
+import json
+import mimetypes
+import os
+from urllib.parse import parse_qs
+
+from flask import render_template
+
+import metrics
+from app import (app as flask_app, fetch_history, ndjson_history, wants_ndjson, save_conversation, history, readiness,
+                 batch_messages, batch_reply)
+from pipeline import add_contact_link
+from async_pipeline import answer_messages_async, get_smart_response_async, stream_answer_async
+from llm_client import close_async_llm_client
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+
+async def read_json(receive):
+    """Request body as JSON, or None when it is missing or invalid"""
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        data = json.loads(body or b"null")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def send_response(send, body, status=200, content_type=b"application/json"):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type),
+                    (b"content-length", str(len(body)).encode("ascii"))] + CORS_HEADERS,
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def chat(receive, send):
+    try:
+        data = await read_json(receive) or {}
+        user_id = data.get("user_id", "guest")
+        user_message = data.get("message", "").strip()
+
+        if not user_message:
+            return await send_response(send, {"reply": "Please enter a message."})
+
+        bot_response = await get_smart_response_async(user_message)
+        await asyncio.to_thread(save_conversation, user_id, user_message, bot_response)
+
+        await send_response(send, {"reply": bot_response})
+
+    except Exception as e:
+        print(f" Chat error: {e}")
+        await send_response(send, {"reply": "Sorry, I'm experiencing technical difficulties."})
+
+
+async def chat_stream(receive, send):
+    """Same events as the Flask /chat/stream route"""
+    data = await read_json(receive) or {}
+    user_id = data.get("user_id", "guest")
+    user_message = data.get("message", "").strip()
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")] + CORS_HEADERS,
+    })
+
+    async def emit(event, payload):
+        await send({"type": "http.response.body", "body": sse_event(event, payload), "more_body": True})
+
+    try:
+        if not user_message:
+            await emit('token', {"text": "Please enter a message."})
+            await emit('done', {"tier": None})
+        else:
+            parts = []
+            tier = None
+            async for event, value in stream_answer_async(user_message):
+                if event == 'token':
+                    parts.append(value)
+                    await emit('token', {"text": value})
+                else:
+                    tier = value
+
+            response = ''.join(parts)
+            bot_response = add_contact_link(response, user_message)
+            if len(bot_response) > len(response):
+                await emit('contact', {"html": bot_response[len(response):]})
+
+            await asyncio.to_thread(save_conversation, user_id, user_message, bot_response)
+            await emit('done', {"tier": tier})
+    except Exception as e:
+        print(f" Stream error: {e}")
+        await emit('error', {"text": "Sorry, I'm experiencing technical difficulties."})
+
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def predict(receive, send):
+    try:
+        data = await read_json(receive)
+        if "messages" in data:
+            try:
+                messages = batch_messages(data)
+            except ValueError as e:
+                return await send_response(send, {"error": str(e)}, status=400)
+            return await send_response(send, batch_reply(await answer_messages_async(messages)))
+
+        text = data.get("message", "").strip()
+
+        if not text:
+            return await send_response(send, {"answer": "Please enter a message."})
+
+        response = await get_smart_response_async(text)
+        await send_response(send, {"answer": response})
+
+    except Exception:
+        await send_response(send, {"answer": "Sorry, I'm experiencing technical difficulties."})
+
+
+async def get_history(user_id, scope, send):
+    """Same query parameters and NDJSON mode as the Flask route"""
+    params = {name: values[0] for name, values in parse_qs(scope["query_string"].decode("latin-1")).items()}
+    accept = dict(scope["headers"]).get(b"accept", b"").decode("latin-1")
+    limit = params.get("limit")
+    cursor = params.get("cursor")
+
+    try:
+        if wants_ndjson(params.get("format"), accept):
+            lines = await asyncio.to_thread(ndjson_history, user_id, limit, cursor)
+            return await stream_ndjson(lines, send)
+        rows, next_cursor = await asyncio.to_thread(fetch_history, user_id, limit, cursor)
+        await send_response(send, {"history": rows, "next_cursor": next_cursor})
+    except ValueError:
+        await send_response(send, {"error": "Invalid limit or cursor"}, status=400)
+    except Exception:
+        await send_response(send, {"error": "Could not fetch history"})
+
+
+async def stream_ndjson(lines, send):
+    """Send lines from a sync generator, reading each in a worker thread"""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/x-ndjson")] + CORS_HEADERS,
+    })
+    while True:
+        chunk = await asyncio.to_thread(next_lines, lines)
+        if not chunk:
+            break
+        await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def next_lines(lines, count=200):
+    """Up to count lines from the generator joined together; '' once it is exhausted"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= count:
+            break
+    return ''.join(chunk)
+
+
+async def index(send):
+    def render():
+        with flask_app.test_request_context('/'):
+            return render_template("base.html")
+
+    html = await asyncio.to_thread(render)
+    await send_response(send, html.encode("utf-8"), content_type=b"text/html; charset=utf-8")
+
+
+async def static_file(relative_path, send):
+    static_root = os.path.realpath(flask_app.static_folder)
+    path = os.path.realpath(os.path.join(static_root, relative_path))
+    if not path.startswith(static_root + os.sep) or not os.path.isfile(path):
+        return await send_response(send, {"error": "Not found"}, status=404)
+
+    with open(path, "rb") as file:
+        body = file.read()
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    await send_response(send, body, content_type=content_type.encode("ascii"))
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_llm_client()
+            await asyncio.to_thread(history.close)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    method = scope["method"]
+    path = scope["path"].rstrip("/") or "/"
+
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        return await send({"type": "http.response.body", "body": b""})
+
+    if method == "POST" and path == "/chat":
+        return await chat(receive, send)
+    if method == "POST" and path == "/chat/stream":
+        return await chat_stream(receive, send)
+    if method == "POST" and path == "/predict":
+        return await predict(receive, send)
+    if method == "GET" and path.startswith("/chat/") and path.count("/") == 2:
+        return await get_history(path[len("/chat/"):], scope, send)
+    if method == "GET" and path == "/ready":
+        return await send_response(send, *readiness())
+    if method == "GET" and path == "/metrics":
+        return await send_response(send, metrics.snapshot())
+    if method == "GET" and path == "/":
+        return await index(send)
+    if method == "GET" and path.startswith("/static/"):
+        return await static_file(path[len("/static/"):], send)
+
+    await send_response(send, {"error": "Not found"}, status=404)
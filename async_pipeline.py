@@ -0,0 +1,415 @@
+"""
+Async versions of the answer tiers in pipeline.py, for the ASGI app (asgi.py)
+Groq calls go through the AsyncLLMClient, so a request waiting on the LLM
+holds no thread. CSV scoring, embedding and Chroma retrieval are CPU or
+SQLite bound and run in the default thread pool.
+
+answer_message_speculative overlaps the tiers instead of running them one
+after another; the Flask app reaches it through run_in_background_loop.
+"""
+import asyncio
+import os
+import threading
+
+import metrics
+
+from llm_client import chat_completion_async, stream_chat_completion_async
+from pipeline import (
+    GROQ_PARAMS, FALLBACK_MESSAGE, UNCACHED_TIERS, SPECULATIVE_TIERS, SPECULATIVE_LLM_DELAY,
+    build_system_prompt, groq_stage, is_greeting, is_weak_response, fallback_answer,
+    get_csv_tier_answer, get_csv_tier_answers, get_handbook_context, embed_message, embed_messages,
+    add_contact_link, response_cache, semantic_cache, COALESCE_REQUESTS, in_flight,
+    coalesce_timeout, coalesce_fallback
+)
+from single_flight import FollowerTimeout
+from response_cache import normalize_message
+from deadline import request_deadline
+
+# Groq calls a batch /predict request keeps in flight at once
+PREDICT_BATCH_CONCURRENCY = int(os.getenv('PREDICT_BATCH_CONCURRENCY', '8'))
+
+_background_loop = None
+_background_lock = threading.Lock()
+
+
+async def get_groq_response_async(message, context=None, is_greeting=False, deadline=None):
+    """Async get_groq_response, cancelled when its stage budget runs out"""
+    stage = groq_stage(context, is_greeting)
+    if deadline is not None and not deadline.allows(stage):
+        return None
+    stage_deadline = deadline.for_stage(stage) if deadline is not None else None
+
+    system_content = build_system_prompt(context, is_greeting)
+    request = chat_completion_async(system_content, message, deadline=stage_deadline, **GROQ_PARAMS)
+    try:
+        if stage_deadline is None:
+            return await request
+        response = await asyncio.wait_for(request, stage_deadline.remaining())
+    except asyncio.TimeoutError:
+        deadline.cut_short(stage)
+        return None
+    except Exception as e:
+        print(f" Groq error: {e}")
+        return None
+    if response is None and stage_deadline.expired:
+        deadline.cut_short(stage)
+    return response
+
+
+async def stream_groq_response_async(message, context=None, is_greeting=False, deadline=None):
+    """Async stream_groq_response: yields text fragments"""
+    system_content = build_system_prompt(context, is_greeting)
+    try:
+        async for fragment in stream_chat_completion_async(system_content, message,
+                                                          deadline=deadline, **GROQ_PARAMS):
+            yield fragment
+    except Exception as e:
+        print(f" Groq stream error: {e}")
+
+
+async def run_stage(stage, coro, deadline):
+    """
+    Await coro for at most the stage's budget
+    Returns: its result, or None when the stage is skipped or cut short.
+    Work running in a thread is abandoned, not interrupted.
+    """
+    if deadline is None:
+        return await coro
+    if not deadline.allows(stage):
+        coro.close()
+        return None
+    try:
+        return await asyncio.wait_for(coro, deadline.budget(stage))
+    except asyncio.TimeoutError:
+        deadline.cut_short(stage)
+        return None
+
+
+async def get_csv_tier_answer_async(user_message, deadline=None):
+    return await run_stage('csv', asyncio.to_thread(get_csv_tier_answer, user_message), deadline)
+
+
+async def get_handbook_context_async(user_message, deadline=None):
+    return await run_stage('retrieval', asyncio.to_thread(get_handbook_context, user_message), deadline)
+
+
+async def embed_message_async(user_message, deadline=None):
+    return await run_stage('embed', asyncio.to_thread(embed_message, user_message), deadline)
+
+
+async def answer_message_async(user_message, deadline=None):
+    """
+    Async answer_message: same tier order and results
+    Returns: (response, tier)
+    """
+    if is_greeting(user_message):
+        greeting_response = await get_groq_response_async(user_message, is_greeting=True, deadline=deadline)
+        if greeting_response:
+            return greeting_response, 'greeting'
+
+    csv_response = await get_csv_tier_answer_async(user_message, deadline)
+    if csv_response:
+        return csv_response, 'csv'
+
+    query_vector = await embed_message_async(user_message, deadline)
+    if query_vector is not None:
+        cached = semantic_cache.lookup(query_vector)
+        if cached:
+            return cached
+
+    return await answer_llm_tiers_async(user_message, query_vector, deadline)
+
+
+async def answer_llm_tiers_async(user_message, query_vector=None, deadline=None):
+    """
+    The Groq tiers of answer_message_async: handbook RAG, then plain Groq
+    query_vector: the message's embedding, to add the answer to the semantic cache
+    Returns: (response, tier)
+    """
+    partial = None
+    handbook_context = await get_handbook_context_async(user_message, deadline)
+    if handbook_context:
+        groq_response = await get_groq_response_async(user_message, context=handbook_context, deadline=deadline)
+        if groq_response and not is_weak_response(groq_response):
+            if query_vector is not None:
+                semantic_cache.add(query_vector, groq_response, 'rag')
+            return groq_response, 'rag'
+        partial = groq_response
+
+    groq_response = await get_groq_response_async(user_message, deadline=deadline)
+    if groq_response and not is_weak_response(groq_response):
+        if query_vector is not None:
+            semantic_cache.add(query_vector, groq_response, 'llm')
+        return groq_response, 'llm'
+
+    return fallback_answer(partial or groq_response, deadline)
+
+
+async def answer_message_speculative(user_message, llm_delay=None, deadline=None):
+    """
+    answer_message with the tiers overlapped in time; same priority and results
+    CSV scoring, the semantic cache lookup and handbook retrieval start
+    together, and the RAG Groq call starts as soon as retrieval returns.
+    The context-free Groq fallback starts after llm_delay seconds, or at once
+    when every higher tier has failed. Answers are still taken in priority
+    order, and the branches still running are cancelled once one wins.
+    deadline: optional deadline.Deadline bounding every branch
+    Returns: (response, tier)
+    """
+    if llm_delay is None:
+        llm_delay = SPECULATIVE_LLM_DELAY
+    higher_tiers_failed = asyncio.Event()
+
+    async def semantic_branch():
+        query_vector = await embed_message_async(user_message, deadline)
+        cached = semantic_cache.lookup(query_vector) if query_vector is not None else None
+        return query_vector, cached
+
+    async def rag_branch():
+        handbook_context = await get_handbook_context_async(user_message, deadline)
+        if not handbook_context:
+            return None
+        return await get_groq_response_async(user_message, context=handbook_context, deadline=deadline)
+
+    async def llm_branch():
+        try:
+            await asyncio.wait_for(higher_tiers_failed.wait(), llm_delay)
+        except asyncio.TimeoutError:
+            metrics.increment('speculative.llm_early_starts')
+        return await get_groq_response_async(user_message, deadline=deadline)
+
+    tasks = {}
+    if is_greeting(user_message):
+        tasks['greeting'] = asyncio.create_task(
+            get_groq_response_async(user_message, is_greeting=True, deadline=deadline))
+    tasks['csv'] = asyncio.create_task(get_csv_tier_answer_async(user_message, deadline))
+    tasks['semantic'] = asyncio.create_task(semantic_branch())
+    tasks['rag'] = asyncio.create_task(rag_branch())
+    tasks['llm'] = asyncio.create_task(llm_branch())
+
+    try:
+        if 'greeting' in tasks:
+            greeting_response = await tasks['greeting']
+            if greeting_response:
+                return _speculative_win(greeting_response, 'greeting')
+
+        csv_response = await tasks['csv']
+        if csv_response:
+            return _speculative_win(csv_response, 'csv')
+
+        query_vector, cached = await tasks['semantic']
+        if cached:
+            return _speculative_win(*cached)
+
+        partial = await tasks['rag']
+        if partial and not is_weak_response(partial):
+            if query_vector is not None:
+                semantic_cache.add(query_vector, partial, 'rag')
+            return _speculative_win(partial, 'rag')
+
+        higher_tiers_failed.set()
+        groq_response = await tasks['llm']
+        if groq_response and not is_weak_response(groq_response):
+            if query_vector is not None:
+                semantic_cache.add(query_vector, groq_response, 'llm')
+            return _speculative_win(groq_response, 'llm')
+
+        return _speculative_win(*fallback_answer(partial or groq_response, deadline))
+    finally:
+        # Threads behind to_thread can't be interrupted; their results are dropped
+        for name, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                metrics.increment(f'speculative.cancelled.{name}')
+
+
+async def answer_messages_async(user_messages, concurrency=None):
+    """
+    Answer a batch of messages (e.g. queued helpdesk tickets)
+    Cached answers are taken first. The rest are CSV-scored in one pass and
+    the CSV misses embedded in one encoder call and checked against the
+    semantic cache; only what is left goes to Groq, at most concurrency
+    (default PREDICT_BATCH_CONCURRENCY) messages at a time, each with its own
+    request deadline. Repeated messages are answered once.
+    Returns: [(response, tier)] in input order, tier 'empty' for blank messages
+    """
+    concurrency = concurrency or PREDICT_BATCH_CONCURRENCY
+    unique = [message for message in dict.fromkeys(user_messages) if message]
+    answers = {}
+
+    cached = await asyncio.to_thread(lambda: [response_cache.get(message) for message in unique])
+    answers.update((message, hit) for message, hit in zip(unique, cached) if hit)
+    pending = [message for message in unique if message not in answers]
+
+    greetings = [message for message in pending if is_greeting(message)]
+    lookups = [message for message in pending if not is_greeting(message)]
+    csv_answers = await asyncio.to_thread(get_csv_tier_answers, lookups)
+    answers.update((message, (answer, 'csv')) for message, answer in zip(lookups, csv_answers) if answer)
+
+    lookups = [message for message in lookups if message not in answers]
+    query_vectors = dict(zip(lookups, await asyncio.to_thread(embed_messages, lookups)))
+    for message in lookups:
+        hit = semantic_cache.lookup(query_vectors[message]) if query_vectors[message] is not None else None
+        if hit:
+            answers[message] = hit
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(message):
+        async with semaphore:
+            deadline = request_deadline()
+            if message in query_vectors:
+                return await answer_llm_tiers_async(message, query_vectors[message], deadline)
+            return await answer_message_async(message, deadline)
+
+    remaining = greetings + [message for message in lookups if message not in answers]
+    for message, result in zip(remaining, await asyncio.gather(*map(answer, remaining), return_exceptions=True)):
+        if isinstance(result, Exception):
+            print(f" Batch answer failed: {result}")
+            result = (FALLBACK_MESSAGE, 'fallback')
+        answers[message] = result
+
+    new_answers = [(message, *answers[message]) for message in pending if answers[message][1] not in UNCACHED_TIERS]
+    await asyncio.to_thread(lambda: [response_cache.put(*entry) for entry in new_answers])
+
+    metrics.increment('predict_batch.requests')
+    metrics.increment('predict_batch.messages', len(user_messages))
+    metrics.increment('predict_batch.llm_messages', len(remaining))
+    return [(add_contact_link(answers[message][0], message), answers[message][1]) if message
+            else ("Please enter a message.", 'empty')
+            for message in user_messages]
+
+
+def _speculative_win(response, tier):
+    metrics.increment(f'speculative.wins.{tier}')
+    return response, tier
+
+
+def run_in_background_loop(coro):
+    """
+    Run a coroutine from synchronous code (Flask request threads) and wait for it
+    All callers share one event loop on a daemon thread, so they also share
+    its AsyncLLMClient connection pool.
+    """
+    global _background_loop
+
+    with _background_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name='pipeline-loop', daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop).result()
+
+
+async def get_smart_response_async(user_message, deadline=None):
+    """Async get_smart_response, sharing the same response cache"""
+    if deadline is None:
+        deadline = request_deadline()
+
+    cached = await asyncio.to_thread(response_cache.get, user_message)
+    if cached:
+        base_response, tier = cached
+    elif COALESCE_REQUESTS:
+        try:
+            base_response, tier = await in_flight.do_async(
+                normalize_message(user_message), answer_and_cache_async, user_message, deadline,
+                timeout=coalesce_timeout(deadline))
+        except FollowerTimeout:
+            base_response, tier = coalesce_fallback(deadline)
+    else:
+        base_response, tier = await answer_and_cache_async(user_message, deadline)
+
+    return add_contact_link(base_response, user_message)
+
+
+async def answer_and_cache_async(user_message, deadline):
+    """Async pipeline.answer_and_cache"""
+    if SPECULATIVE_TIERS:
+        base_response, tier = await answer_message_speculative(user_message, deadline=deadline)
+    else:
+        base_response, tier = await answer_message_async(user_message, deadline)
+    if tier not in UNCACHED_TIERS:
+        await asyncio.to_thread(response_cache.put, user_message, base_response, tier)
+    return base_response, tier
+
+
+async def stream_answer_async(user_message, deadline=None):
+    """
+    Async stream_answer: yields ('token', text) events, then ('done', tier)
+    """
+    if deadline is None:
+        deadline = request_deadline()
+
+    cached = await asyncio.to_thread(response_cache.get, user_message)
+    if cached:
+        yield 'token', cached[0]
+        yield 'done', cached[1]
+        return
+
+    if is_greeting(user_message):
+        async for event in _stream_groq_tier_async(user_message, 'greeting', None, deadline):
+            yield event
+            if event[0] == 'done':
+                return
+
+    csv_response = await get_csv_tier_answer_async(user_message, deadline)
+    if csv_response:
+        await asyncio.to_thread(response_cache.put, user_message, csv_response, 'csv')
+        yield 'token', csv_response
+        yield 'done', 'csv'
+        return
+
+    query_vector = await embed_message_async(user_message, deadline)
+    if query_vector is not None:
+        cached = semantic_cache.lookup(query_vector)
+        if cached:
+            yield 'token', cached[0]
+            yield 'done', cached[1]
+            return
+
+    groq_tiers = [('llm', None)]
+    handbook_context = await get_handbook_context_async(user_message, deadline)
+    if handbook_context:
+        groq_tiers.insert(0, ('rag', handbook_context))
+
+    for tier, context in groq_tiers:
+        async for event in _stream_groq_tier_async(user_message, tier, context, deadline, query_vector):
+            yield event
+            if event[0] == 'done':
+                return
+
+    yield 'token', FALLBACK_MESSAGE
+    yield 'done', 'fallback'
+
+
+async def _stream_groq_tier_async(user_message, tier, context, deadline, query_vector=None):
+    """
+    Async pipeline._stream_groq_tier
+    Yields ('token', text) events, then ('done', tier) unless Groq sent nothing.
+    """
+    if deadline is not None and not deadline.allows(tier):
+        return
+    stage_deadline = deadline.for_stage(tier) if deadline is not None else None
+
+    parts = []
+    async for fragment in stream_groq_response_async(user_message, context=context,
+                                                     is_greeting=tier == 'greeting', deadline=stage_deadline):
+        parts.append(fragment)
+        yield 'token', fragment
+
+    if stage_deadline is not None and stage_deadline.expired:
+        deadline.cut_short(tier)
+        if parts:
+            metrics.increment('deadline.partial_answers')
+            yield 'done', 'partial'
+            return
+    if not parts:
+        return
+
+    groq_response = ''.join(parts).strip()
+    if tier == 'greeting':
+        await asyncio.to_thread(response_cache.put, user_message, groq_response, tier)
+    elif not is_weak_response(groq_response):
+        await asyncio.to_thread(response_cache.put, user_message, groq_response, tier)
+        if query_vector is not None:
+            semantic_cache.add(query_vector, groq_response, tier)
+    yield 'done', tier
@@ -0,0 +1,127 @@
+"""
+Benchmark the indexed and TF-IDF CSV lookups against the original linear scan
+Usage: python bench_csv_lookup.py [sizes...]
+Default sizes: 173 (the real QA bank), 1000, 10000, 100000
+"""
+import contextlib
+import io
+import random
+import string
+import sys
+import time
+from difflib import SequenceMatcher
+
+from chat import load_csv_qa, extract_keywords, build_csv_index, find_csv_answer
+from csv_tfidf import build_tfidf_matcher
+
+QUERIES = [
+    "How do I reset my wifi password?",
+    "What is the student portal login?",
+    "Where can I find my grades?",
+    "How to access email?",
+    "printer problems",
+    "The projector in my classroom is not working",
+    "my laptop won't turn on",
+    "How do I connect to the school WiFi?",
+]
+
+
+def linear_find_csv_answer(user_input, qa_pairs, threshold=0.5):
+    """The original O(N) scan, kept as the reference implementation"""
+    user_input_clean = user_input.lower().strip()
+    user_keywords = extract_keywords(user_input)
+
+    best_match = None
+    best_score = 0
+
+    for qa_pair in qa_pairs:
+        similarity = SequenceMatcher(None, user_input_clean, qa_pair['question']).ratio()
+
+        keyword_score = 0
+        if user_keywords and qa_pair['keywords']:
+            matching_keywords = set(user_keywords) & set(qa_pair['keywords'])
+            keyword_score = len(matching_keywords) / max(len(user_keywords), len(qa_pair['keywords']))
+
+        phrase_score = 0
+        user_phrases = user_input_clean.split()
+        qa_phrases = qa_pair['question'].split()
+
+        for user_phrase in user_phrases:
+            if len(user_phrase) > 3:
+                for qa_phrase in qa_phrases:
+                    if user_phrase in qa_phrase or qa_phrase in user_phrase:
+                        phrase_score += 0.1
+
+        combined_score = (similarity * 0.4) + (keyword_score * 0.4) + (min(phrase_score, 1.0) * 0.2)
+
+        if combined_score > best_score and combined_score > threshold:
+            best_score = combined_score
+            best_match = qa_pair
+
+    if best_match:
+        return best_match['answer'], best_score
+    return None, 0
+
+
+def synthetic_bank(base_pairs, size, seed=42):
+    """Grow the real QA bank to `size` rows by swapping keywords for new terms"""
+    rng = random.Random(seed)
+    pairs = list(base_pairs)
+    vocabulary = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+                  for _ in range(max(size // 2, 100))]
+
+    while len(pairs) < size:
+        source = rng.choice(base_pairs)
+        words = [rng.choice(vocabulary) if word in source['keywords'] and rng.random() < 0.6 else word
+                 for word in source['question'].split()]
+        question = ' '.join(words)
+        keywords = extract_keywords(question)
+        pairs.append({
+            'question': question,
+            'answer': source['answer'],
+            'keywords': keywords,
+            'keyword_set': set(keywords),
+            'words': question.split()
+        })
+    return pairs[:size]
+
+
+def time_per_query(fn, queries):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [fn(query) for query in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def main(sizes):
+    base_pairs = load_csv_qa('school_it_qa.csv')
+    print(f"{'rows':>8} {'linear ms':>10} {'indexed ms':>11} {'tfidf ms':>9} {'build s':>8} "
+          f"{'index':>6} {'tfidf':>6}")
+    print("-" * 66)
+
+    for size in sizes:
+        qa_pairs = synthetic_bank(base_pairs, size)
+
+        start = time.perf_counter()
+        index = build_csv_index(qa_pairs)
+        matcher = build_tfidf_matcher(qa_pairs)
+        build_time = time.perf_counter() - start
+
+        # The linear scan gets very slow at 100k rows, so sample fewer queries
+        queries = QUERIES if size <= 10000 else QUERIES[:3]
+        linear_time, expected = time_per_query(
+            lambda q: linear_find_csv_answer(q, qa_pairs), queries)
+        indexed_time, indexed = time_per_query(
+            lambda q: find_csv_answer(q, qa_pairs=qa_pairs, index=index), queries)
+        tfidf_time, tfidf = time_per_query(
+            lambda q: find_csv_answer(q, qa_pairs=qa_pairs, index=index, matcher=matcher), queries)
+
+        # Share of queries answered exactly like the linear scan
+        index_agree = sum(a == b for a, b in zip(expected, indexed)) / len(queries)
+        tfidf_agree = sum(a == b for a, b in zip(expected, tfidf)) / len(queries)
+        print(f"{size:>8} {linear_time * 1000:>10.2f} {indexed_time * 1000:>11.2f} "
+              f"{tfidf_time * 1000:>9.2f} {build_time:>8.2f} {index_agree:>6.0%} {tfidf_agree:>6.0%}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [173, 1000, 10000, 100000])
@@ -0,0 +1,100 @@
+"""
+Benchmark the embedding runtimes: accuracy and latency against torch
+Usage: python encoder.py export && python bench_encoder.py [--pdf HandbookQA.pdf] [--repeat 20]
+
+The torch encoder (sentence-transformers, what the app uses by default) is
+the reference. For the ONNX float32 and int8 models written by
+encoder.py export it reports:
+- accuracy: cosine similarity of each query vector to the torch one, the
+  handbook top-3 overlap (recall@3) when searching the live export with it,
+  and how often the best CSV question match is the same
+- latency: median single-query embedding time, and bulk throughput over the
+  handbook passages (what indexing does)
+and finally what a query-cache hit costs.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import chat
+from bench_quantization import heading_queries, recall
+from bench_vector_store import QUERIES, live_persist_dir, median_ms
+from csv_embeddings import normalize_rows
+from encoder import ENCODER_DIR, CachedEmbeddings, OnnxEmbeddings
+from handbook_index import indexed_chunk_ids, load_manifest
+from handbook_rag import _load_embedding_model
+from vector_store import NumpyVectorIndex, load_passages
+
+
+def load_runtimes():
+    runtimes = {"torch": _load_embedding_model()}
+    for name, quantized in (("onnx", False), ("onnx-int8", True)):
+        try:
+            runtimes[name] = OnnxEmbeddings(ENCODER_DIR, quantized=quantized)
+        except Exception as e:
+            print(f" Skipping {name}: {e} (run python encoder.py export)")
+    return runtimes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pdf', default='HandbookQA.pdf')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--bulk', type=int, default=256, help="passages embedded for the throughput test")
+    args = parser.parse_args()
+
+    runtimes = load_runtimes()
+    if runtimes["torch"] is None:
+        print(" Could not load the torch encoder")
+        return
+
+    queries = QUERIES + heading_queries(args.pdf)
+    chat.load_csv_tier()
+    questions = [qa_pair['question'] for qa_pair in chat.csv_qa_pairs]
+    vectors = {name: normalize_rows(encoder.embed_documents(queries)) for name, encoder in runtimes.items()}
+
+    persist_dir = live_persist_dir()
+    chunk_ids = indexed_chunk_ids(load_manifest(persist_dir) or {"sources": {}})
+    loaded = load_passages(persist_dir, chunk_ids) if chunk_ids else None
+    index = NumpyVectorIndex(*loaded, None) if loaded else None
+    if index is None:
+        print(f" No vector export at {persist_dir} - handbook recall skipped (run build_index.py)")
+    csv_matrix = normalize_rows(runtimes["torch"].embed_documents(questions)) if questions else None
+
+    def top3(query_vectors):
+        return [[row for row, _ in index.search(vector, 3)] for vector in query_vectors]
+
+    def best_question(query_vectors):
+        return np.argmax(query_vectors @ csv_matrix.T, axis=1)
+
+    print(f"\n Accuracy against torch over {len(queries)} queries")
+    print(f"   {'runtime':<10} {'mean cos':>9} {'min cos':>9} {'recall@3':>9} {'same CSV match':>15}")
+    for name, query_vectors in vectors.items():
+        cosines = np.einsum('ij,ij->i', query_vectors, vectors["torch"])
+        handbook = f"{recall(top3(vectors['torch']), top3(query_vectors)):9.3f}" if index else f"{'-':>9}"
+        csv_same = (f"{np.mean(best_question(query_vectors) == best_question(vectors['torch'])):15.3f}"
+                    if csv_matrix is not None else f"{'-':>15}")
+        print(f"   {name:<10} {cosines.mean():9.5f} {cosines.min():9.5f} {handbook} {csv_same}")
+
+    passages = (loaded[1]["documents"] if loaded else questions)[:args.bulk]
+    print(f"\n Latency (single query: median of {args.repeat * len(QUERIES)}; bulk: {len(passages)} passages)")
+    baseline_ms = None
+    for name, encoder in runtimes.items():
+        query_ms = median_ms(encoder.embed_query, QUERIES, args.repeat)
+        started = time.perf_counter()
+        encoder.embed_documents(passages)
+        per_second = len(passages) / (time.perf_counter() - started)
+        baseline_ms = baseline_ms or query_ms
+        print(f"   {name:<10} query {query_ms:8.2f} ms ({baseline_ms / query_ms:4.1f}x)   "
+              f"bulk {per_second:8.1f} passages/s")
+
+    cached = CachedEmbeddings(runtimes["torch"])
+    for query in QUERIES:
+        cached.embed_query(query)
+    hit_ms = median_ms(cached.embed_query, [f"  {query.upper()} " for query in QUERIES], args.repeat)
+    print(f"\n Query cache hit (normalized text): {hit_ms:.4f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark compact embedding storage: memory and recall@3 against float32
+Usage: python bench_quantization.py [--pdf HandbookQA.pdf] [--factors 1 4 8]
+
+Queries are the numbered section headings of the handbook PDF, asked as
+questions ("What is the policy on dress code?"). For each precision the
+NumPy index over the live handbook export is searched with the compact
+copy, keeping a shortlist of k * factor candidates that is re-scored in
+float32 (factor 1 is the compact ranking alone); recall@3 is the overlap
+with the float32 top 3. Memory is the vector bytes each query scans, per
+process.
+"""
+import argparse
+import re
+
+import numpy as np
+
+import chat
+from bench_vector_store import live_persist_dir
+from handbook_index import extract_pages, file_hash, indexed_chunk_ids, load_manifest
+from handbook_rag import get_embedding_model, open_vector_store
+from quantize import nearest, quantize
+from vector_store import NumpyVectorIndex, export_vectors, load_passages
+
+HEADING = re.compile(r"^\s*\d+(?:\.\d+)*\.?\s+([A-Z][A-Z ,&/’'()-]{5,})\s*$")
+
+
+def heading_queries(pdf_path):
+    """One question per numbered section heading of the PDF"""
+    queries = []
+    for _, pages in extract_pages([pdf_path], {pdf_path: file_hash(pdf_path)}, workers=1):
+        for text in pages:
+            for line in text.splitlines():
+                match = HEADING.match(line)
+                if match:
+                    queries.append(f"What is the policy on {match.group(1).strip().lower()}?")
+    return list(dict.fromkeys(queries))
+
+
+def recall(expected, actual):
+    return np.mean([len(set(a) & set(e)) / len(e) for e, a in zip(expected, actual)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pdf', default='HandbookQA.pdf')
+    parser.add_argument('--factors', type=int, nargs='*', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    persist_dir = live_persist_dir()
+    embeddings = get_embedding_model()
+    chunk_ids = indexed_chunk_ids(load_manifest(persist_dir) or {"sources": {}})
+    if not chunk_ids:
+        print(f" No handbook index at {persist_dir} - run build_index.py first")
+        return
+    loaded = load_passages(persist_dir, chunk_ids)
+    if loaded is None:
+        export_vectors(open_vector_store(embeddings, persist_dir), persist_dir, chunk_ids)
+        loaded = load_passages(persist_dir, chunk_ids)
+    matrix, info = loaded
+    matrix = np.asarray(matrix)
+
+    queries = heading_queries(args.pdf)
+    vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+    baseline = NumpyVectorIndex(matrix, info, embeddings)
+    expected = [[row for row, _ in baseline.search(vector, 3)] for vector in vectors]
+
+    print(f"\n {len(queries)} queries from {args.pdf} against {len(matrix)} chunks "
+          f"({matrix.shape[1]}-d)")
+    print(f"   {'precision':<10} {'bytes scanned':>14} {'vs float32':>10}  "
+          + "  ".join(f"{f'recall x{factor}':>11}" for factor in args.factors))
+    print(f"   {'float32':<10} {baseline.resident_bytes():>14,} {'1.00x':>10}  "
+          + "  ".join(f"{1.0:>11.3f}" for _ in args.factors))
+
+    for precision in ('float16', 'int8'):
+        index = NumpyVectorIndex(matrix, info, embeddings, quantize(matrix, precision))
+        recalls = [recall(expected, [[row for row, _ in nearest(matrix, index.row_norms, index.compact, vector, 3, factor)]
+                                     for vector in vectors])
+                   for factor in args.factors]
+        print(f"   {precision:<10} {index.resident_bytes():>14,} "
+              f"{baseline.resident_bytes() / index.resident_bytes():>9.2f}x  "
+              + "  ".join(f"{value:>11.3f}" for value in recalls))
+
+    # The CSV question matrix is small, so only its footprint is reported
+    if chat.load_csv_semantic():
+        questions = np.asarray(chat.csv_question_embeddings)
+        sizes = [f"float32 {questions.nbytes:,}"]
+        for precision in ('float16', 'int8'):
+            codes, scales = quantize(questions, precision)
+            sizes.append(f"{precision} {codes.nbytes + (scales.nbytes if scales is not None else 0):,}")
+        print(f"\n CSV question embeddings ({len(questions)} questions), bytes: {', '.join(sizes)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark process start: import cost of each module and time to /ready
+Usage: python bench_startup.py [--runs 3] [--budget 1.5] [--top 15]
+
+Every module is imported in a fresh interpreter (so nothing is shared
+between measurements) and the median wall time is reported, along with
+the heaviest imports underneath the app from python -X importtime. The
+app is then imported once more with the warm-up running to time how long
+each tier takes to become warm. Exits non-zero when importing app takes
+longer than --budget seconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULES = [
+    'metrics', 'deadline', 'warmup', 'llm_client', 'response_cache', 'semantic_cache',
+    'history_store', 'csv_embeddings', 'csv_tfidf', 'chat', 'handbook_index',
+    'handbook_rag', 'pipeline', 'async_pipeline', 'app', 'asgi',
+]
+
+# Results go to a file named by argv[1], as the warm-up thread prints to stdout
+TIMED_IMPORT = """
+import sys, time
+started = time.perf_counter()
+import {module}
+with open(sys.argv[1], 'w') as file:
+    file.write(str(time.perf_counter() - started))
+"""
+
+READY_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+import warmup
+warmup.wait({timeout})
+with open(sys.argv[1], 'w') as file:
+    json.dump({{"import": imported, "total": time.perf_counter() - started, "tiers": warmup.status()}}, file)
+"""
+
+
+def run_probe(code):
+    """Run code in a fresh interpreter; returns what it wrote to its result file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'result')
+        result = subprocess.run([sys.executable, '-c', code, path], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        with open(path) as file:
+            return file.read()
+
+
+def import_seconds(module, runs):
+    """Median seconds to import module in a fresh interpreter"""
+    timings = []
+    for _ in range(runs):
+        timings.append(float(run_probe(TIMED_IMPORT.format(module=module))))
+    return statistics.median(timings)
+
+
+def heaviest_imports(module, top):
+    """(cumulative seconds, name) of the slowest imports under module, from -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # A package is listed once, at its slowest (outermost) import
+        package = name.strip().split('.')[0]
+        packages[package] = max(packages.get(package, 0.0), int(cumulative) / 1e6)
+    return sorted(((seconds, name) for name, seconds in packages.items()), reverse=True)[:top]
+
+
+def time_to_ready(timeout):
+    return json.loads(run_probe(READY_PROBE.format(timeout=timeout)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=1.5, help='seconds allowed for import app')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--ready-timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    print(f"\n Import time per module (median of {args.runs} fresh interpreters)")
+    app_seconds = None
+    for module in MODULES:
+        try:
+            seconds = import_seconds(module, args.runs)
+        except RuntimeError as e:
+            print(f"   {module:<16} failed: {e}")
+            continue
+        if module == 'app':
+            app_seconds = seconds
+        print(f"   {module:<16} {seconds * 1000:8.1f} ms")
+
+    print("\n Heaviest imports under app (cumulative)")
+    for seconds, name in heaviest_imports('app', args.top):
+        print(f"   {name:<28} {seconds * 1000:8.1f} ms")
+
+    print("\n Warm-up after import app")
+    try:
+        ready = time_to_ready(args.ready_timeout)
+        print(f"   import app       {ready['import'] * 1000:8.1f} ms")
+        for tier, info in ready['tiers'].items():
+            seconds = f"{info['seconds'] * 1000:8.1f} ms" if info['seconds'] is not None else "       -"
+            print(f"   {tier:<16} {seconds}  {info['state']}")
+        print(f"   all tiers        {ready['total'] * 1000:8.1f} ms")
+    except RuntimeError as e:
+        print(f"   failed: {e}")
+
+    if app_seconds is not None and app_seconds > args.budget:
+        print(f"\n import app took {app_seconds:.2f}s, over the {args.budget:.2f}s budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
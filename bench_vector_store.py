@@ -0,0 +1,173 @@
+"""
+Benchmark handbook retrieval: Chroma against the in-process vector indexes
+Usage: python bench_vector_store.py [--repeat 50] [--sizes 10000 100000]
+
+On the live handbook index (indexes/CURRENT, else ./chroma_db) it checks
+that the NumPy and HNSW indexes return the same top-3 passages and scores
+as Chroma, then times a search with a precomputed query vector and a full
+similarity_search_with_score (query embedding included) on each. Random
+384-d corpora of --sizes chunks then compare the exact NumPy scan with
+HNSW (build time, latency and recall@3 against the exact scan).
+
+The hybrid section times the BM25 search and the extra cost of hybrid
+retrieval over a dense top-3 search, and shows whether exact-term queries
+reach the handbook page holding the term.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+
+from handbook_index import indexed_chunk_ids, load_manifest
+from bm25 import open_keyword_index
+from handbook_rag import (INDEX_DIR, PERSIST_DIR, current_index_version, get_embedding_model, hybrid_search,
+                          open_vector_store)
+from vector_store import HnswVectorIndex, NumpyVectorIndex, export_vectors, load_passages
+
+QUERIES = [
+    "How many days of annual leave do staff get?",
+    "What is the dress code for teachers?",
+    "Who do I report harassment to?",
+    "What happens if I am late to work?",
+    "How do I apply for maternity leave?",
+    "Can I use the school vehicle for personal trips?",
+    "What is the probation period for new employees?",
+    "How are salaries paid?",
+]
+
+# Queries hinging on one exact term, with the text that must be retrieved
+EXACT_TERM_QUERIES = [
+    ("What should PE staff wear?", "sportswear"),
+    ("sportswear", "sportswear"),
+    ("long service award", "LONG SERVICE AWARD"),
+    ("hiring of relatives", "HIRING OF RELATIVES"),
+]
+
+
+def live_persist_dir():
+    version = current_index_version()
+    return os.path.join(INDEX_DIR, version, "chroma") if version else PERSIST_DIR
+
+
+def median_ms(function, arguments, repeat):
+    timings = []
+    for _ in range(repeat):
+        for argument in arguments:
+            started = time.perf_counter()
+            function(argument)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def compare_handbook(repeat):
+    persist_dir = live_persist_dir()
+    embeddings = get_embedding_model()
+    vector_db = open_vector_store(embeddings, persist_dir)
+    chunk_ids = indexed_chunk_ids(load_manifest(persist_dir) or {"sources": {}})
+    if not chunk_ids:
+        print(f" No handbook index at {persist_dir} - run build_index.py first")
+        return
+
+    # The same export the app serves from, written first if missing
+    loaded = load_passages(persist_dir, chunk_ids)
+    if loaded is None:
+        export_vectors(vector_db, persist_dir, chunk_ids)
+        loaded = load_passages(persist_dir, chunk_ids)
+    matrix, info = loaded
+    indexes = {
+        "numpy": NumpyVectorIndex(matrix, info, embeddings),
+        "hnsw": HnswVectorIndex(matrix, info, embeddings),
+    }
+
+    print(f"\n Handbook index: {len(chunk_ids)} chunks from {persist_dir}")
+    vectors = [embeddings.embed_query(query) for query in QUERIES]
+
+    for name, index in indexes.items():
+        worst = 0.0
+        mismatches = 0
+        for vector in vectors:
+            expected = vector_db.similarity_search_by_vector_with_relevance_scores(vector, k=3)
+            actual = [(index.passages[row], distance) for row, distance in index.search(vector, 3)]
+            if [doc.page_content for doc, _ in expected] != [passage.page_content for passage, _ in actual]:
+                mismatches += 1
+            worst = max([worst] + [abs(a - b) for (_, a), (_, b) in zip(expected, actual)])
+        print(f"   {name:<6} top-3 differs from Chroma on {mismatches}/{len(vectors)} queries, "
+              f"largest score difference {worst:.2e}")
+
+    print(f"\n Search with a query vector (median of {repeat * len(vectors)})")
+    chroma_ms = median_ms(lambda vector: vector_db.similarity_search_by_vector_with_relevance_scores(vector, k=3),
+                          vectors, repeat)
+    print(f"   {'chroma':<8} {chroma_ms:8.3f} ms")
+    for name, index in indexes.items():
+        index_ms = median_ms(lambda vector: index.search(vector, 3), vectors, repeat)
+        print(f"   {name:<8} {index_ms:8.3f} ms  ({chroma_ms / index_ms:.0f}x)")
+
+    print(f"\n similarity_search_with_score, embedding included (median of {repeat * len(QUERIES)})")
+    for name, store in [("chroma", vector_db)] + list(indexes.items()):
+        print(f"   {name:<8} {median_ms(lambda query: store.similarity_search_with_score(query, k=3), QUERIES, repeat):8.3f} ms")
+
+    compare_hybrid(vector_db, persist_dir, chunk_ids, indexes["numpy"], repeat)
+
+
+def compare_hybrid(vector_db, persist_dir, chunk_ids, index, repeat):
+    keywords = open_keyword_index(vector_db, persist_dir, chunk_ids)
+    queries = QUERIES + [query for query, _ in EXACT_TERM_QUERIES]
+
+    print(f"\n Hybrid retrieval (numpy index, median of {repeat * len(queries)})")
+    bm25_ms = median_ms(lambda query: keywords.search(query, 10), queries, repeat)
+    dense_ms = median_ms(lambda query: index.similarity_search_with_score(query, k=3), queries, repeat)
+    hybrid_ms = median_ms(lambda query: hybrid_search(index, keywords, query, k=3), queries, repeat)
+    print(f"   bm25 alone   {bm25_ms:8.3f} ms")
+    print(f"   dense top-3  {dense_ms:8.3f} ms")
+    print(f"   hybrid       {hybrid_ms:8.3f} ms  (+{hybrid_ms - dense_ms:.3f} ms)")
+
+    print("\n Exact-term queries: is the passage with the term in the top 3?")
+    for query, term in EXACT_TERM_QUERIES:
+        dense = any(term in doc.page_content for doc, _ in index.similarity_search_with_score(query, k=3))
+        hybrid = any(term in doc.page_content for doc, _, _ in hybrid_search(index, keywords, query, k=3))
+        print(f"   {query:<32} dense {'yes' if dense else 'no ':<4} hybrid {'yes' if hybrid else 'no'}")
+
+
+def compare_synthetic(sizes, dim=384, latent_dim=16, queries=200):
+    if not sizes:
+        return
+    rng = np.random.default_rng(0)
+    # Sentence embeddings lie near a low-dimensional subspace; uniformly random
+    # vectors would have no meaningful 2nd and 3rd nearest neighbours
+    projection = rng.standard_normal((latent_dim, dim), dtype=np.float32)
+    print(f"\n Random {dim}-d corpora ({latent_dim}-d structure plus noise), {queries} queries")
+    for size in sizes:
+        matrix = rng.standard_normal((size, latent_dim), dtype=np.float32) @ projection
+        matrix += 0.1 * rng.standard_normal((size, dim), dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        info = {"ids": [str(i) for i in range(size)], "documents": [""] * size, "metadatas": [None] * size}
+        vectors = rng.standard_normal((queries, latent_dim), dtype=np.float32) @ projection
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        exact = NumpyVectorIndex(matrix, info, None)
+        started = time.perf_counter()
+        hnsw = HnswVectorIndex(matrix, info, None)
+        build_seconds = time.perf_counter() - started
+
+        recall = np.mean([len({row for row, _ in exact.search(vector, 3)} & {row for row, _ in hnsw.search(vector, 3)}) / 3
+                          for vector in vectors])
+        numpy_ms = median_ms(lambda vector: exact.search(vector, 3), vectors, 1)
+        hnsw_ms = median_ms(lambda vector: hnsw.search(vector, 3), vectors, 1)
+        print(f"   {size:>8} chunks: numpy {numpy_ms:7.3f} ms, hnsw {hnsw_ms:7.3f} ms "
+              f"(recall@3 {recall:.3f}, built in {build_seconds:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000])
+    args = parser.parse_args()
+
+    compare_handbook(args.repeat)
+    compare_synthetic(args.sizes)
+
+
+if __name__ == "__main__":
+    main()
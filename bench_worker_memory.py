@@ -0,0 +1,161 @@
+"""
+Measure per-worker memory of the gunicorn deployment, preloaded or not
+Usage: python bench_worker_memory.py [--workers 1 4 16] [--modes preload separate] [--requests 50]
+
+For each mode and worker count it starts gunicorn with gunicorn.conf.py on
+a free local port (PRELOAD_APP=1 for 'preload', 0 for 'separate'; warm-up
+inline in both, so every process has loaded every tier), sends --requests
+CSV questions to /predict so the workers have served traffic, waits for
+memory to settle and reads /proc/<pid>/smaps_rollup of the master and each
+worker:
+- RSS: resident pages, counting shared ones in full in every process
+- PSS: shared pages split between the processes sharing them; the sum over
+  master and workers is what the deployment really costs
+- USS: pages only this process has (private), what a worker adds
+
+Linux only. Start an embedding server or set EMBEDDING_MODEL/INDEX_DIR in
+the environment as for the app; they are passed through.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from chat import CSV_FILE_PATH, load_csv_qa
+
+MODES = {"preload": "1", "separate": "0"}
+
+
+def log_path(mode, workers):
+    return os.path.join(tempfile.gettempdir(), f"bench_worker_memory.{mode}.{workers}.log")
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as file:
+            return [int(child) for child in file.read().split()]
+    except OSError:
+        return []
+
+
+def memory_kb(pid):
+    """{'rss', 'pss', 'uss'} in kB from smaps_rollup"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return {"rss": fields["Rss"], "pss": fields["Pss"],
+            "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)}
+
+
+def wait_until_settled(master, workers, timeout, interval=2.0):
+    """Wait for all workers to exist and their RSS to stop growing; False on timeout"""
+    deadline = time.monotonic() + timeout
+    previous = None
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        pids = children(master)
+        if len(pids) != workers:
+            previous = None
+            continue
+        try:
+            current = {pid: memory_kb(pid)["rss"] for pid in pids}
+        except OSError:
+            previous = None
+            continue
+        if previous is not None and previous.keys() == current.keys() and all(
+                abs(current[pid] - previous[pid]) <= 0.01 * previous[pid] for pid in pids):
+            return True
+        previous = current
+    return False
+
+
+def send_requests(port, questions, count):
+    answered = 0
+    for i in range(count):
+        body = json.dumps({"message": questions[i % len(questions)]}).encode('utf-8')
+        request = urllib.request.Request(f"http://127.0.0.1:{port}/predict", body,
+                                         {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                answered += response.status == 200
+        except OSError:
+            pass
+    return answered
+
+
+def measure(mode, workers, questions, requests, timeout):
+    port = free_port()
+    env = dict(os.environ, PRELOAD_APP=MODES[mode], WEB_CONCURRENCY=str(workers), GUNICORN_THREADS="1",
+               GUNICORN_BIND=f"127.0.0.1:{port}", WARMUP_BACKGROUND="0", TOKENIZERS_PARALLELISM="false")
+    log = open(log_path(mode, workers), 'w')
+    master = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                              env=env, stdout=log, stderr=subprocess.STDOUT)
+    started = time.monotonic()
+    try:
+        if not wait_until_settled(master.pid, workers, timeout):
+            return None
+        boot_seconds = time.monotonic() - started
+        answered = send_requests(port, questions, requests)
+        wait_until_settled(master.pid, workers, timeout)
+
+        worker_memory = [memory_kb(pid) for pid in children(master.pid)]
+        master_memory = memory_kb(master.pid)
+        return {
+            "boot_seconds": boot_seconds,
+            "answered": answered,
+            "master_rss": master_memory["rss"],
+            "worker": {key: sum(memory[key] for memory in worker_memory) / len(worker_memory)
+                       for key in ("rss", "pss", "uss")},
+            "total_pss": master_memory["pss"] + sum(memory["pss"] for memory in worker_memory),
+        }
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 4, 16])
+    parser.add_argument('--modes', nargs='*', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=600, help="seconds to wait for the workers to boot")
+    args = parser.parse_args()
+
+    questions = [qa_pair['question'] for qa_pair in load_csv_qa(CSV_FILE_PATH)] or ["hello"]
+    mb = 1024
+    print(f"\n {'mode':<9} {'workers':>7} {'boot s':>7} {'master RSS':>11} {'worker RSS':>11} "
+          f"{'worker PSS':>11} {'worker USS':>11} {'total PSS':>10}   (MB)")
+    for mode in args.modes:
+        for workers in args.workers:
+            result = measure(mode, workers, questions, args.requests, args.timeout)
+            if result is None:
+                print(f" {mode:<9} {workers:>7}  did not settle within {args.timeout:.0f}s "
+                      f"(see {log_path(mode, workers)})")
+                continue
+            worker = result["worker"]
+            print(f" {mode:<9} {workers:>7} {result['boot_seconds']:7.1f} {result['master_rss'] / mb:11.0f} "
+                  f"{worker['rss'] / mb:11.0f} {worker['pss'] / mb:11.0f} {worker['uss'] / mb:11.0f} "
+                  f"{result['total_pss'] / mb:10.0f}   ({result['answered']}/{args.requests} answered)")
+
+
+if __name__ == "__main__":
+    main()
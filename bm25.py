@@ -0,0 +1,131 @@
+"""
+BM25 keyword index over the handbook passages
+Dense MiniLM search misses queries that hinge on an exact term (a form
+number, "PE staff", "sportswear"). This index is built from the same
+export as the vector index (vectors/passages.json, same row order), saved
+as vectors/bm25.json, and searched next to the dense index; the two
+rankings are merged with reciprocal-rank fusion in handbook_rag.
+
+Each term's postings hold the rows containing it and their precomputed
+BM25 term weights, so scoring a query is a few array additions.
+"""
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+from vector_store import VECTORS_DIR, Passage, chunk_ids_hash, export_vectors, load_passages
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how',
+    'i', 'if', 'in', 'is', 'it', 'my', 'of', 'on', 'or', 'our', 'the', 'their', 'this', 'to',
+    'we', 'what', 'when', 'where', 'which', 'who', 'why', 'will', 'with', 'you', 'your',
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def build_postings(documents):
+    """{term: (rows, weights)} with weight = idf * saturated, length-normalized tf"""
+    tokenized = [tokenize(document or "") for document in documents]
+    lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+    average_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+
+    counts = {}
+    for row, tokens in enumerate(tokenized):
+        for token in tokens:
+            per_row = counts.setdefault(token, {})
+            per_row[row] = per_row.get(row, 0) + 1
+
+    postings = {}
+    for term, per_row in counts.items():
+        idf = math.log(1 + (len(documents) - len(per_row) + 0.5) / (len(per_row) + 0.5))
+        rows = np.fromiter(per_row, dtype=np.int32, count=len(per_row))
+        tf = np.fromiter(per_row.values(), dtype=np.float32, count=len(per_row))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / average_length)
+        postings[term] = (rows, (idf * tf * (BM25_K1 + 1) / (tf + norm)).astype(np.float32))
+    return postings
+
+
+class BM25Index:
+    def __init__(self, postings, passages):
+        """
+        postings: {term: (rows, weights)} from build_postings
+        passages: Passage per row, in the vector export's order
+        """
+        self.postings = postings
+        self.passages = passages
+
+    def __len__(self):
+        return len(self.passages)
+
+    def search(self, query, k=10):
+        """(row, BM25 score) of the k best-scoring rows, best first; rows without a query term are left out"""
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return [(int(row), float(scores[row])) for row in matched]
+
+
+def save_keyword_index(persist_dir, info):
+    """Write vectors/bm25.json for the export described by info (from load_passages)"""
+    postings = build_postings(info["documents"])
+    data = {
+        "chunk_ids_hash": info["chunk_ids_hash"],
+        "postings": {term: [rows.tolist(), weights.tolist()] for term, (rows, weights) in postings.items()},
+    }
+    path = os.path.join(persist_dir, VECTORS_DIR, "bm25.json")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def open_keyword_index(vector_db, persist_dir, chunk_ids):
+    """
+    BM25 index over the exported passages, building and saving it first if needed
+    Returns: a BM25Index, or None when it can't be built
+    """
+    try:
+        loaded = load_passages(persist_dir, chunk_ids)
+        if loaded is None:
+            export_vectors(vector_db, persist_dir, chunk_ids)
+            loaded = load_passages(persist_dir, chunk_ids)
+        _, info = loaded
+
+        path = os.path.join(persist_dir, VECTORS_DIR, "bm25.json")
+        data = None
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                data = json.load(file)
+        if data is None or data.get("chunk_ids_hash") != chunk_ids_hash(chunk_ids):
+            save_keyword_index(persist_dir, info)
+            with open(path, encoding='utf-8') as file:
+                data = json.load(file)
+
+        postings = {term: (np.asarray(rows, dtype=np.int32), np.asarray(weights, dtype=np.float32))
+                    for term, (rows, weights) in data["postings"].items()}
+        passages = [Passage(document, metadata or {})
+                    for document, metadata in zip(info["documents"], info["metadatas"])]
+
+    except Exception as e:
+        print(f" Could not open the BM25 index, using dense retrieval only: {e}")
+        return None
+
+    print(f" BM25 index: {len(postings)} terms over {len(passages)} passages")
+    return BM25Index(postings, passages)
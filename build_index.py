@@ -0,0 +1,188 @@
+"""
+Build the handbook index offline as a versioned artifact
+Usage: python build_index.py [PDF or directory ...] [--activate] [--force] [--keep 5]
+       python build_index.py --activate VERSION    (switch to, or back to, a built version)
+       python build_index.py --list
+
+Each build writes INDEX_DIR/<version>/ with the Chroma store in chroma/
+and an index.json describing it (embedding model, chunking, source file
+hashes, chunk count). A build starts from a copy of the live artifact, so
+only changed PDFs are embedded again; the live artifact itself is never
+written to. The artifact is assembled under a temporary name and renamed
+into place once complete.
+
+--activate points INDEX_DIR/CURRENT at the new version. Running servers
+poll CURRENT (or take POST /admin/rag/reload) and swap to it without a
+restart; queries already in progress finish on the old store.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from importlib import metadata
+
+from handbook_index import CHUNK_OVERLAP, CHUNK_SIZE, collect_pdfs, indexed_chunk_ids, sync_index
+from bm25 import save_keyword_index
+from quantize import VECTOR_PRECISION
+from vector_store import VECTORS_DIR, HnswVectorIndex, choose_backend, export_vectors, load_compact, load_passages
+from handbook_rag import (INDEX_DIR, current_index_version, embedding_key, get_embedding_model,
+                          open_vector_store, read_index_info, usable_pdfs)
+
+# Same corpus app.py indexes at startup
+DEFAULT_SOURCES = ["HandbookQA.pdf", os.getenv('HANDBOOK_DIR', 'handbooks')]
+
+
+def new_version(manifest):
+    """Sortable version name: build time plus a short hash of what was indexed"""
+    content = json.dumps({source: entry["file_hash"] for source, entry in manifest["sources"].items()},
+                         sort_keys=True)
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:8]}"
+
+
+def list_versions(index_dir=INDEX_DIR):
+    """Complete artifacts, oldest first"""
+    if not os.path.isdir(index_dir):
+        return []
+    return sorted(name for name in os.listdir(index_dir)
+                  if not name.startswith('.') and os.path.isfile(os.path.join(index_dir, name, "index.json")))
+
+
+def activate(version, index_dir=INDEX_DIR):
+    """Atomically point CURRENT at version"""
+    if version not in list_versions(index_dir):
+        raise ValueError(f"no complete index artifact named {version!r} in {index_dir}")
+    temp_path = os.path.join(index_dir, "CURRENT.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(version + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, os.path.join(index_dir, "CURRENT"))
+    print(f" {version} is now CURRENT")
+
+
+def build(pdf_paths, index_dir=INDEX_DIR, force=False):
+    """
+    Build a new artifact from the corpus
+    Returns: the new version name
+    """
+    corpus = usable_pdfs(collect_pdfs(pdf_paths))
+    if not corpus:
+        raise ValueError(f"no usable PDF in {pdf_paths}")
+
+    embeddings = get_embedding_model()
+    if embeddings is None:
+        raise RuntimeError("could not load the embeddings model")
+
+    os.makedirs(index_dir, exist_ok=True)
+    staging = os.path.join(index_dir, f".building-{os.getpid()}")
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+
+    base = current_index_version(index_dir)
+    persist_dir = os.path.join(staging, "chroma")
+    try:
+        started = time.perf_counter()
+        # Seed from the live artifact so unchanged PDFs aren't embedded again
+        if base and not force:
+            print(f" Starting from {base}")
+            shutil.copytree(os.path.join(index_dir, base, "chroma"), persist_dir)
+        else:
+            os.makedirs(persist_dir)
+
+        vector_db = open_vector_store(embeddings, persist_dir)
+        manifest, stats = sync_index(vector_db, persist_dir, corpus, embedding_key(), force=force)
+        chunk_ids = indexed_chunk_ids(manifest)
+        chunk_count = len(chunk_ids)
+        if chunk_count == 0:
+            raise ValueError("no chunks indexed - image-only or encrypted PDFs?")
+
+        # The vectors the server memory-maps, the HNSW graph or compact copy
+        # it will need, and the BM25 index over the same passages
+        export_vectors(vector_db, persist_dir, chunk_ids)
+        matrix, passages = load_passages(persist_dir, chunk_ids)
+        if choose_backend(chunk_count) == 'hnsw':
+            HnswVectorIndex(matrix, passages, embeddings, os.path.join(persist_dir, VECTORS_DIR, "hnsw.bin"))
+        elif VECTOR_PRECISION != 'float32':
+            load_compact(persist_dir, matrix, VECTOR_PRECISION)
+        save_keyword_index(persist_dir, passages)
+        del vector_db
+
+        version = new_version(manifest)
+        info = {
+            "version": version,
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "base_version": None if force else base,
+            "embedding_model": embedding_key(),
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "chunk_count": chunk_count,
+            "vector_precision": VECTOR_PRECISION,
+            "sources": {source: {"file_hash": entry["file_hash"], "pages": len(entry["pages"])}
+                        for source, entry in manifest["sources"].items()},
+            "chromadb_version": metadata.version("chromadb"),
+            "build_seconds": round(time.perf_counter() - started, 1),
+        }
+        with open(os.path.join(staging, "index.json"), 'w', encoding='utf-8') as file:
+            json.dump(info, file, indent=2)
+
+        os.replace(staging, os.path.join(index_dir, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    for stat in stats:
+        print(f"   {stat}")
+    print(f" Built {version}: {chunk_count} chunks from {len(info['sources'])} PDF(s) "
+          f"in {info['build_seconds']}s")
+    return version
+
+
+def prune(keep, index_dir=INDEX_DIR):
+    """Delete all but the newest keep artifacts, never the CURRENT one"""
+    current = current_index_version(index_dir)
+    for version in list_versions(index_dir)[:-keep]:
+        if version != current:
+            shutil.rmtree(os.path.join(index_dir, version))
+            print(f" Removed {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('sources', nargs='*', help='PDFs or directories of PDFs (default: the app\'s corpus)')
+    parser.add_argument('--activate', nargs='?', const='', metavar='VERSION',
+                        help='make the new build (or VERSION, without building) CURRENT')
+    parser.add_argument('--force', action='store_true', help='re-embed every PDF from scratch')
+    parser.add_argument('--keep', type=int, help='artifacts to keep after building')
+    parser.add_argument('--list', action='store_true', help='list built artifacts')
+    args = parser.parse_args()
+
+    if args.list:
+        current = current_index_version()
+        for version in list_versions():
+            info = read_index_info(version)
+            marker = '*' if version == current else ' '
+            print(f" {marker} {version}  {info['chunk_count']} chunks  {', '.join(info['sources'])}")
+        return
+
+    if args.activate:
+        activate(args.activate)
+        return
+
+    sources = args.sources or [path for path in DEFAULT_SOURCES if os.path.exists(path)]
+    try:
+        version = build(sources, force=args.force)
+    except (ValueError, RuntimeError) as e:
+        print(f" ERROR: {e}")
+        sys.exit(1)
+
+    if args.activate is not None:
+        activate(version)
+    if args.keep:
+        prune(args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,28 @@ import os
 import csv
 from difflib import SequenceMatcher
 import re
-import requests 
+import threading
+from collections import defaultdict
 from dotenv import load_dotenv
+from csv_embeddings import load_question_embeddings, load_compact_questions, best_matches
+from llm_client import chat_completion
 
 load_dotenv('.env')
-API_KEY = os.getenv('API_KEY')
-API_URL = "https://api.groq.com/openai/v1/chat/completions"
 
 bot_name = "Greeny G"
 
+# 'index' scores every question the inverted keyword index can reach (exact),
+# 'tfidf' shortlists CSV_TOP_K candidates with the sparse TF-IDF matcher
+# (a batch shares one sparse product). Single and batch lookups use the same one.
+CSV_MATCHER = os.getenv('CSV_MATCHER', 'index')
+CSV_TOP_K = int(os.getenv('CSV_TOP_K', '10'))
+
+# Paraphrases the lexical strategies miss are matched on MiniLM embeddings
+# of the CSV questions; the returned confidence is the cosine similarity
+CSV_EMBEDDINGS = os.getenv('CSV_EMBEDDINGS', '1') == '1'
+CSV_EMBEDDING_THRESHOLD = float(os.getenv('CSV_EMBEDDING_THRESHOLD', '0.75'))
+CSV_FILE_PATH = 'school_it_qa.csv'
+
 
 def load_csv_qa(csv_file_path):
     """
@@ -31,10 +44,13 @@ def load_csv_qa(csv_file_path):
                     if row_num == 1 and question.lower() in ['question', 'q', 'questions']:
                         continue
                     
+                    keywords = extract_keywords(question)
                     qa_pairs.append({
                         'question': question.lower(),
                         'answer': answer,
-                        'keywords': extract_keywords(question)
+                        'keywords': keywords,
+                        'keyword_set': set(keywords),
+                        'words': question.lower().split()
                     })
                     
         print(f" Loaded {len(qa_pairs)} Q&A pairs from CSV")
@@ -56,52 +72,233 @@ def extract_keywords(text):
     
     return keywords
 
-# Load your CSV file
-csv_qa_pairs = load_csv_qa('school_it_qa.csv')
-
-def find_csv_answer(user_input, threshold=0.5):
+def build_csv_index(qa_pairs):
     """
-    Enhanced CSV matching with multiple strategies
-    Returns: (answer, confidence_score) or (None, 0)
+    Build inverted indexes over the Q&A questions
+    - keywords: extract_keywords token -> ids of questions containing it
+    - words: whitespace word -> {question id: occurrences}
+    - substrings: every substring (4+ chars) of a word -> words containing it
     """
-    user_input_clean = user_input.lower().strip()
-    user_keywords = extract_keywords(user_input)
-    
-    best_match = None
-    best_score = 0
-    
-    for qa_pair in csv_qa_pairs:
-        # Strategy 1: Direct string similarity
-        similarity = SequenceMatcher(None, user_input_clean, qa_pair['question']).ratio()
-        
-        # Strategy 2: Keyword matching score
+    keyword_index = defaultdict(set)
+    word_index = defaultdict(dict)
+    substring_index = defaultdict(set)
+
+    for idx, qa_pair in enumerate(qa_pairs):
+        qa_pair.setdefault('keyword_set', set(qa_pair['keywords']))
+        qa_pair.setdefault('words', qa_pair['question'].split())
+
+        for keyword in qa_pair['keyword_set']:
+            keyword_index[keyword].add(idx)
+
+        for word in qa_pair['words']:
+            postings = word_index[word]
+            postings[idx] = postings.get(idx, 0) + 1
+
+    # A user word only counts for phrase matching when it is 4+ chars long,
+    # so shorter substrings can never be looked up
+    for word in word_index:
+        for start in range(len(word) - 3):
+            for end in range(start + 4, len(word) + 1):
+                substring_index[word[start:end]].add(word)
+
+    return {
+        'keywords': keyword_index,
+        'words': word_index,
+        'substrings': substring_index
+    }
+
+
+def load_csv_embeddings(csv_file_path, qa_pairs):
+    """Memory-mapped question embeddings for the CSV, or None when disabled/unavailable"""
+    if not CSV_EMBEDDINGS:
+        return None
+    try:
+        from handbook_rag import get_embedding_model, embedding_key
+        questions = [qa_pair['question'] for qa_pair in qa_pairs]
+        return load_question_embeddings(csv_file_path, questions, embedding_key(), get_embedding_model)
+    except Exception as e:
+        print(f" Could not load CSV question embeddings: {e}")
+        return None
+
+
+# The CSV bank is loaded on first use or by the warm-up thread, in three
+# steps: the keyword index (enough to answer), the TF-IDF matcher (sklearn
+# is slow to import) and the question embeddings (need MiniLM)
+csv_qa_pairs = []
+csv_index = None
+csv_matcher = None
+csv_question_embeddings = None
+csv_question_compact = None
+_csv_lock = threading.Lock()
+
+
+def load_csv_tier():
+    """Parse the CSV and build its keyword index, once; True when there are Q&A pairs"""
+    global csv_qa_pairs, csv_index
+
+    with _csv_lock:
+        if csv_index is None:
+            qa_pairs = load_csv_qa(CSV_FILE_PATH)
+            index = build_csv_index(qa_pairs)
+            csv_qa_pairs = qa_pairs
+            csv_index = index
+    return bool(csv_qa_pairs)
+
+
+def load_csv_matcher():
+    """Build the TF-IDF matcher; until then lookups use the keyword index"""
+    global csv_matcher
+
+    from csv_tfidf import build_tfidf_matcher
+    load_csv_tier()
+    csv_matcher = build_tfidf_matcher(csv_qa_pairs)
+    return csv_matcher is not None
+
+
+def load_csv_semantic():
+    """Load the CSV question embeddings; until then paraphrases aren't matched"""
+    global csv_question_embeddings, csv_question_compact
+
+    load_csv_tier()
+    matrix = load_csv_embeddings(CSV_FILE_PATH, csv_qa_pairs)
+    # With VECTOR_PRECISION float16/int8 the compact copy is scanned and the
+    # float32 matrix only read for the best few questions
+    csv_question_compact = load_compact_questions(matrix) if matrix is not None else None
+    csv_question_embeddings = matrix
+    return matrix is not None
+
+
+def after_fork():
+    """In a forked worker: a parent's warm-up thread may have died holding the CSV lock"""
+    global _csv_lock
+    _csv_lock = threading.Lock()
+
+
+def _phrase_words(user_word, index):
+    """Question words that are a substring of user_word or contain it"""
+    word_index = index['words']
+    matches = set(index['substrings'].get(user_word, ()))
+    for start in range(len(user_word)):
+        for end in range(start + 1, len(user_word) + 1):
+            if user_word[start:end] in word_index:
+                matches.add(user_word[start:end])
+    return matches
+
+
+def _phrase_score(match_count):
+    # Accumulate exactly like the original pairwise loop so confidences are
+    # bit-for-bit identical (ten additions of 0.1 stay just below 1.0)
+    phrase_score = 0
+    for _ in range(min(match_count, 11)):
+        phrase_score += 0.1
+    return phrase_score
+
+
+def _csv_candidates_from_index(user_input_clean, user_keywords, qa_pairs, index, threshold):
+    """Keyword and phrase scores for every question the inverted index can reach"""
+    # Strategy 2 inputs: matching keyword count per question
+    keyword_hits = defaultdict(int)
+    for keyword in set(user_keywords):
+        for idx in index['keywords'].get(keyword, ()):
+            keyword_hits[idx] += 1
+
+    # Strategy 3 inputs: matching (user word, question word) pairs per question
+    phrase_hits = defaultdict(int)
+    for user_phrase in user_input_clean.split():
+        if len(user_phrase) > 3:
+            for word in _phrase_words(user_phrase, index):
+                for idx, occurrences in index['words'][word].items():
+                    phrase_hits[idx] += occurrences
+
+    # Without keyword or phrase overlap a question scores at most 0.4
+    # (similarity alone), so it can only win when the threshold is below that
+    if threshold < 0.4:
+        candidates = range(len(qa_pairs))
+    else:
+        candidates = set(keyword_hits) | set(phrase_hits)
+
+    scored = []
+    for idx in candidates:
+        qa_pair = qa_pairs[idx]
+        keyword_score = 0
+        if user_keywords and qa_pair['keywords'] and keyword_hits.get(idx):
+            keyword_score = keyword_hits[idx] / max(len(user_keywords), len(qa_pair['keywords']))
+        phrase_score = _phrase_score(phrase_hits.get(idx, 0))
+        scored.append((idx, keyword_score, phrase_score))
+    return scored
+
+
+def _csv_candidates_from_ids(user_input_clean, user_keywords, qa_pairs, candidate_ids):
+    """Keyword and phrase scores for a short list of candidate questions"""
+    user_keyword_set = set(user_keywords)
+    user_phrases = [phrase for phrase in user_input_clean.split() if len(phrase) > 3]
+
+    scored = []
+    for idx in candidate_ids:
+        qa_pair = qa_pairs[idx]
         keyword_score = 0
         if user_keywords and qa_pair['keywords']:
-            matching_keywords = set(user_keywords) & set(qa_pair['keywords'])
+            matching_keywords = user_keyword_set & qa_pair['keyword_set']
             keyword_score = len(matching_keywords) / max(len(user_keywords), len(qa_pair['keywords']))
-        
-        # Strategy 3: Partial phrase matching
-        phrase_score = 0
-        user_phrases = user_input_clean.split()
-        qa_phrases = qa_pair['question'].split()
-        
+
+        match_count = 0
         for user_phrase in user_phrases:
-            if len(user_phrase) > 3:
-                for qa_phrase in qa_phrases:
-                    if user_phrase in qa_phrase or qa_phrase in user_phrase:
-                        phrase_score += 0.1
-        
+            for qa_phrase in qa_pair['words']:
+                if user_phrase in qa_phrase or qa_phrase in user_phrase:
+                    match_count += 1
+        scored.append((int(idx), keyword_score, _phrase_score(match_count)))
+    return scored
+
+
+def _best_csv_match(user_input, user_input_clean, scored, qa_pairs, threshold):
+    """
+    Run the string similarity strategy over scored candidates and pick the best
+    scored: (question index, keyword score, phrase score) tuples
+    """
+    ranked = []
+    for idx, keyword_score, phrase_score in scored:
+        partial_score = (keyword_score * 0.4) + (min(phrase_score, 1.0) * 0.2)
+        if partial_score + 0.4 > threshold:
+            ranked.append((partial_score, idx, keyword_score, phrase_score))
+
+    # Most promising candidates first so the similarity bounds prune the rest
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+
+    best_match = None
+    best_idx = None
+    best_score = 0
+
+    for partial_score, idx, keyword_score, phrase_score in ranked:
+        if partial_score + 0.4 < best_score:
+            break
+
+        qa_pair = qa_pairs[idx]
+
+        # Strategy 1: Direct string similarity, bounded cheaply first
+        matcher = SequenceMatcher(None, user_input_clean, qa_pair['question'])
+        upper_bound = partial_score + matcher.real_quick_ratio() * 0.4
+        if upper_bound <= threshold or upper_bound < best_score:
+            continue
+        upper_bound = partial_score + matcher.quick_ratio() * 0.4
+        if upper_bound <= threshold or upper_bound < best_score:
+            continue
+        similarity = matcher.ratio()
+
         # Combine scores with weights
         combined_score = (similarity * 0.4) + (keyword_score * 0.4) + (min(phrase_score, 1.0) * 0.2)
-        
+
         if combined_score > 0.3:
             print(f"   Matching '{user_input[:50]}' with '{qa_pair['question'][:50]}'")
             print(f"   Combined score: {combined_score:.2f}")
-        
-        if combined_score > best_score and combined_score > threshold:
+
+        # Ties go to the earlier question, as in a front-to-back scan
+        if combined_score > threshold and (
+                combined_score > best_score
+                or (best_match is not None and combined_score == best_score and idx < best_idx)):
             best_score = combined_score
             best_match = qa_pair
-    
+            best_idx = idx
+
     if best_match:
         print(f" Best CSV match (score: {best_score:.2f}): {best_match['question'][:80]}")
         return best_match['answer'], best_score
@@ -109,14 +306,110 @@ def find_csv_answer(user_input, threshold=0.5):
         print(f"  No CSV match found above threshold {threshold}")
         return None, 0
 
+
+def find_csv_answer(user_input, threshold=0.5, qa_pairs=None, index=None, matcher=None):
+    """
+    Enhanced CSV matching with multiple strategies
+    Candidates come from the TF-IDF matcher (top CSV_TOP_K) or, without one,
+    from the inverted index; the three strategies only run on those candidates
+    Returns: (answer, confidence_score) or (None, 0)
+    """
+    use_embeddings = qa_pairs is None
+    if qa_pairs is None:
+        load_csv_tier()
+        qa_pairs = csv_qa_pairs
+        matcher = csv_matcher if CSV_MATCHER == 'tfidf' else None
+    if index is None:
+        index = csv_index if qa_pairs is csv_qa_pairs else build_csv_index(qa_pairs)
+
+    user_input_clean = user_input.lower().strip()
+    user_keywords = extract_keywords(user_input)
+
+    if matcher is not None:
+        candidate_ids, _ = matcher.top_k(user_input_clean, CSV_TOP_K)
+        scored = _csv_candidates_from_ids(user_input_clean, user_keywords, qa_pairs, candidate_ids)
+    else:
+        scored = _csv_candidates_from_index(user_input_clean, user_keywords, qa_pairs, index, threshold)
+
+    answer, confidence = _best_csv_match(user_input, user_input_clean, scored, qa_pairs, threshold)
+    if answer is None and use_embeddings:
+        return find_csv_answer_semantic(user_input)
+    return answer, confidence
+
+
+def find_csv_answer_semantic(user_input, threshold=None):
+    """
+    Match against the precomputed question embeddings with a single dot product
+    Returns: (answer, cosine_similarity) or (None, 0)
+    """
+    return find_csv_answers_semantic([user_input], threshold)[0]
+
+
+def find_csv_answers_semantic(user_inputs, threshold=None):
+    """Batch version of find_csv_answer_semantic: one embedding call, one matrix product"""
+    if threshold is None:
+        threshold = CSV_EMBEDDING_THRESHOLD
+    if csv_question_embeddings is None or not user_inputs:
+        return [(None, 0) for _ in user_inputs]
+
+    from handbook_rag import get_embedding_model
+    embeddings_model = get_embedding_model()
+    if embeddings_model is None:
+        return [(None, 0) for _ in user_inputs]
+
+    # Through the query cache, so the semantic cache and the handbook search reuse these vectors
+    query_vectors = embeddings_model.embed_queries(list(user_inputs))
+    results = []
+    for user_input, (idx, similarity) in zip(user_inputs, best_matches(query_vectors, csv_question_embeddings, csv_question_compact)):
+        if similarity >= threshold:
+            qa_pair = csv_qa_pairs[idx]
+            print(f" Semantic CSV match (similarity: {similarity:.2f}): {qa_pair['question'][:80]}")
+            results.append((qa_pair['answer'], similarity))
+        else:
+            results.append((None, 0))
+    return results
+
+
+def find_csv_answers(user_inputs, threshold=0.5):
+    """
+    Batch version of find_csv_answer, with the same matcher choice
+    With CSV_MATCHER 'tfidf' all queries are scored against the TF-IDF
+    matrix in one sparse product
+    Returns: list of (answer, confidence_score) in input order
+    """
+    load_csv_tier()
+    cleaned = [user_input.lower().strip() for user_input in user_inputs]
+    keywords = [extract_keywords(user_input) for user_input in user_inputs]
+
+    matcher = csv_matcher if CSV_MATCHER == 'tfidf' else None
+    if matcher is not None:
+        scored = [_csv_candidates_from_ids(user_input_clean, user_keywords, csv_qa_pairs, candidate_ids)
+                  for user_input_clean, user_keywords, (candidate_ids, _) in zip(
+                      cleaned, keywords, matcher.top_k_batch(cleaned, CSV_TOP_K))]
+    else:
+        scored = [_csv_candidates_from_index(user_input_clean, user_keywords, csv_qa_pairs, csv_index, threshold)
+                  for user_input_clean, user_keywords in zip(cleaned, keywords)]
+
+    results = [_best_csv_match(user_input, user_input_clean, candidates, csv_qa_pairs, threshold)
+               for user_input, user_input_clean, candidates in zip(user_inputs, cleaned, scored)]
+
+    # Embed all lexical misses in one call
+    misses = [i for i, (answer, _) in enumerate(results) if answer is None]
+    for i, result in zip(misses, find_csv_answers_semantic([user_inputs[i] for i in misses])):
+        results[i] = result
+    return results
+
 #groq Api call
 
-def get_groq_response(message, context=None, is_greeting=False):
-    """Get response from Groq API as Greeny G"""
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
+def get_groq_response(message, context=None, is_greeting=False, deadline=None):
+    """
+    Get response from Groq API as Greeny G
+    deadline: optional deadline.Deadline bounding the call, retries included
+    """
+    stage = 'greeting' if is_greeting else 'rag' if context else 'llm'
+    if deadline is not None and not deadline.allows(stage):
+        return None
+    stage_deadline = deadline.for_stage(stage) if deadline is not None else None
     
     # Build system prompt based on context type
     if is_greeting:
@@ -144,29 +437,17 @@ Instructions:
 Answer questions clearly and concisely. Keep responses under 150 words.
 Be helpful, professional, and accurate. If you don't know something, say so and suggest contacting support."""
     
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": [
-            {"role": "system", "content": system_content},
-            {"role": "user", "content": message}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 250 if is_greeting else 300,
-        "top_p": 0.9
-    }
-    
     try:
         print(f" Asking Greeny G: {message[:60]}...")
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=30)
+        answer = chat_completion(system_content, message, temperature=0.7,
+                                 max_tokens=250 if is_greeting else 300, top_p=0.9,
+                                 deadline=stage_deadline)
         
-        if response.status_code == 200:
-            result = response.json()
-            answer = result['choices'][0]['message']['content'].strip()
+        if answer:
             print(f" Greeny G responded ({len(answer)} chars)")
-            return answer
-        else:
-            print(f" Groq error: {response.status_code}")
-            return None
+        elif stage_deadline is not None and stage_deadline.expired:
+            deadline.cut_short(stage)
+        return answer
             
     except Exception as e:
         print(f" Groq error: {e}")
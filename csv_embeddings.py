@@ -0,0 +1,114 @@
+"""
+Precomputed MiniLM embeddings of the CSV questions
+The question matrix is embedded once, saved as a float32 .npy file keyed by
+a hash of the CSV contents and memory-mapped on startup, so the corpus is
+only re-embedded when the CSV (or the embedding model) changes.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+from quantize import VECTOR_PRECISION, approximate_dots, load_quantized, save_quantized, shortlist
+
+EMBEDDINGS_DIR = "./csv_embeddings"
+
+
+def csv_content_hash(csv_file_path, model_name):
+    """Hash of the CSV bytes plus the model name, so either change forces a rebuild"""
+    digest = hashlib.sha256(model_name.encode('utf-8'))
+    with open(csv_file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def normalize_rows(vectors):
+    """L2-normalize so a dot product is the cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def load_question_embeddings(csv_file_path, questions, model_name, get_model):
+    """
+    Memory-map the question matrix for this CSV, embedding it first if needed
+    get_model is only called when the matrix has to be (re)built
+    Returns: read-only (len(questions), dim) float32 matrix, or None on failure
+    """
+    csv_file_path = Path(csv_file_path)
+    if not questions or not csv_file_path.exists():
+        return None
+
+    content_hash = csv_content_hash(csv_file_path, model_name)
+    matrix_path = Path(EMBEDDINGS_DIR) / f"{csv_file_path.stem}-{content_hash}.npy"
+
+    if matrix_path.exists():
+        matrix = np.load(matrix_path, mmap_mode='r')
+        if matrix.shape[0] == len(questions):
+            print(f" Memory-mapped {matrix.shape[0]} CSV question embeddings from {matrix_path}")
+            return matrix
+        print(f" CSV embeddings at {matrix_path} have the wrong shape, rebuilding...")
+
+    embeddings_model = get_model()
+    if embeddings_model is None:
+        return None
+
+    print(f" Embedding {len(questions)} CSV questions...")
+    matrix = normalize_rows(embeddings_model.embed_documents(questions))
+
+    # Write to a temporary file first so other workers never map a partial file
+    matrix_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = matrix_path.with_name(f"{matrix_path.stem}.{os.getpid()}.tmp.npy")
+    np.save(tmp_path, matrix)
+    os.replace(tmp_path, matrix_path)
+
+    # Drop embeddings of older versions of this CSV
+    for stale_path in matrix_path.parent.glob(f"{csv_file_path.stem}-*.npy"):
+        if stale_path != matrix_path:
+            try:
+                stale_path.unlink()
+            except OSError:
+                pass
+
+    print(f" Saved CSV question embeddings to {matrix_path}")
+    return np.load(matrix_path, mmap_mode='r')
+
+
+def load_compact_questions(matrix, precision=VECTOR_PRECISION):
+    """
+    float16 / int8 copy of a question matrix from load_question_embeddings,
+    saved next to it; None at float32 precision
+    """
+    if precision == 'float32' or getattr(matrix, 'filename', None) is None:
+        return None
+    path_stem = os.path.splitext(matrix.filename)[0]
+    compact = load_quantized(path_stem, precision, len(matrix))
+    if compact is None:
+        save_quantized(path_stem, matrix, precision)
+        compact = load_quantized(path_stem, precision, len(matrix))
+    return compact
+
+
+def best_matches(query_vectors, matrix, compact=None):
+    """
+    Cosine-match normalized query vectors against the question matrix
+    compact: (codes, scales) from load_compact_questions; the best few
+    questions by it are re-scored against matrix
+    Returns: (best question index, similarity) per query
+    """
+    queries = normalize_rows(query_vectors)
+    if compact is None:
+        similarities = queries @ matrix.T
+        best = similarities.argmax(axis=1)
+        return [(int(idx), float(row[idx])) for idx, row in zip(best, similarities)]
+
+    results = []
+    for query, rows in zip(queries, shortlist(-approximate_dots(*compact, queries), 1)):
+        rows = np.sort(rows)
+        similarities = np.asarray(matrix[rows], dtype=np.float32) @ query
+        best = int(similarities.argmax())
+        results.append((int(rows[best]), float(similarities[best])))
+    return results
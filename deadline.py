@@ -0,0 +1,82 @@
+"""
+Request deadlines for the answer pipeline
+A Deadline is started when a chat request arrives and passed down through
+the tiers. Each stage runs for at most its budget (and never past the end
+of the request), and is skipped when too little time is left to be useful,
+so a slow Chroma search or Groq call can't hold a reply for minutes.
+"""
+import os
+import time
+
+import metrics
+
+# Whole-request budget in seconds; 0 disables deadlines
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '15'))
+
+# Longest each stage may run, in seconds
+STAGE_BUDGETS = {
+    'greeting': 5.0,
+    'csv': 2.0,
+    'embed': 2.0,
+    'retrieval': 3.0,
+    'rag': 8.0,
+    'llm': 8.0,
+}
+
+# A stage isn't started with less than this many seconds left
+STAGE_MINIMUMS = {
+    'greeting': 1.0,
+    'csv': 0.05,
+    'embed': 0.05,
+    'retrieval': 0.3,
+    'rag': 1.0,
+    'llm': 1.0,
+}
+
+
+class Deadline:
+    def __init__(self, seconds, parent=None):
+        """
+        seconds: time from now until the deadline
+        parent: enclosing Deadline; this one never ends after it
+        """
+        self.expires_at = time.monotonic() + seconds
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+        # Stages skipped or stopped because time ran out
+        self.cut_stages = []
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def budget(self, stage):
+        """Seconds stage may run: its own budget, bounded by what is left"""
+        return min(STAGE_BUDGETS.get(stage, REQUEST_DEADLINE), self.remaining())
+
+    def for_stage(self, stage):
+        """A Deadline ending when stage runs out of budget"""
+        return Deadline(STAGE_BUDGETS.get(stage, REQUEST_DEADLINE), parent=self)
+
+    def allows(self, stage):
+        """Whether there is enough time left to start stage; counts a skip when not"""
+        if self.remaining() >= STAGE_MINIMUMS.get(stage, 0.0):
+            return True
+        print(f" Deadline: skipping {stage} ({self.remaining():.2f}s left)")
+        metrics.increment(f'deadline.skipped.{stage}')
+        self.cut_stages.append(stage)
+        return False
+
+    def cut_short(self, stage):
+        """Record that a running stage was stopped by its deadline"""
+        print(f" Deadline: {stage} cut short")
+        metrics.increment(f'deadline.cut.{stage}')
+        self.cut_stages.append(stage)
+
+
+def request_deadline():
+    """Deadline for a new chat request, or None when REQUEST_DEADLINE is 0"""
+    return Deadline(REQUEST_DEADLINE) if REQUEST_DEADLINE > 0 else None
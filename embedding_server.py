@@ -0,0 +1,308 @@
+"""
+Shared embedding server over a Unix socket
+Usage: python embedding_server.py [--socket PATH] [--max-batch 64] [--wait-ms 2]
+
+Every worker process that loads MiniLM keeps its own few hundred MB of
+weights. This server loads the encoder once (EMBEDDING_RUNTIME applies, see
+encoder.py) and workers send it their texts instead. Requests arriving
+within --wait-ms of each other, or while the previous batch is running,
+are encoded together as one micro-batch of up to --max-batch texts.
+
+handbook_rag.get_embedding_model connects when EMBEDDING_SOCKET exists and
+the server runs the same model, so the CSV question embeddings, the
+semantic cache and get_rag_context all go through it; otherwise, and for
+any call the server can't answer, the model is loaded in-process.
+
+Protocol: each message is a 4-byte big-endian length and a JSON object.
+{"op": "info"} is answered with the model name and runtime; {"op": "embed",
+"texts": [...]} with a JSON header {"shape": [n, dim]} followed by the
+n * dim float32 vectors as raw bytes (the header says how many bytes).
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+EMBEDDING_SOCKET = os.getenv('EMBEDDING_SOCKET', '/tmp/staff_chatbot_embeddings.sock')
+EMBEDDING_SOCKET_TIMEOUT = float(os.getenv('EMBEDDING_SOCKET_TIMEOUT', '10'))
+EMBED_MAX_BATCH = int(os.getenv('EMBED_MAX_BATCH', '64'))
+EMBED_BATCH_WAIT_MS = float(os.getenv('EMBED_BATCH_WAIT_MS', '2'))
+
+_LENGTH = struct.Struct('>I')
+
+
+def encode_message(header, body=b""):
+    data = json.dumps(header).encode('utf-8')
+    return _LENGTH.pack(len(data)) + data + body
+
+
+class MicroBatcher:
+    def __init__(self, encoder, max_batch=EMBED_MAX_BATCH, wait_ms=EMBED_BATCH_WAIT_MS):
+        """
+        encoder: anything with embed_documents
+        max_batch: texts per forward pass; one larger request still runs alone
+        wait_ms: how long the first request of a batch waits for company
+        """
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # One encoding at a time: torch already uses every core for a batch
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self.stats = {"requests": 0, "texts": 0, "batches": 0}
+
+    async def embed(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def _collect(self):
+        pending = [await self.queue.get()]
+        count = len(pending[0][0])
+        deadline = time.monotonic() + self.wait
+        while count < self.max_batch:
+            # Requests that queued up during the last batch are taken without waiting
+            if self.queue.empty():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            pending.append(item)
+            count += len(item[0])
+        return pending
+
+    def _encode(self, texts):
+        return np.asarray(self.encoder.embed_documents(texts), dtype=np.float32)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = await self._collect()
+            texts = [text for request_texts, _ in pending for text in request_texts]
+            try:
+                vectors = await loop.run_in_executor(self.executor, self._encode, texts)
+            except Exception as e:
+                print(f" Embedding batch of {len(texts)} failed: {e}")
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats["requests"] += len(pending)
+            self.stats["texts"] += len(texts)
+            self.stats["batches"] += 1
+            offset = 0
+            for request_texts, future in pending:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+
+async def serve(encoder, info, socket_path, max_batch, wait_ms):
+    batcher = MicroBatcher(encoder, max_batch, wait_ms)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    length = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))[0]
+                    request = json.loads(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    if request.get("op") == "info":
+                        reply = encode_message(dict(info, stats=batcher.stats))
+                    elif request.get("op") == "embed":
+                        vectors = await batcher.embed([str(text) for text in request["texts"]])
+                        reply = encode_message({"shape": list(vectors.shape)}, vectors.tobytes())
+                    else:
+                        reply = encode_message({"error": f"unknown op {request.get('op')!r}"})
+                except Exception as e:
+                    reply = encode_message({"error": str(e)})
+                writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            # Client gone, garbage on the wire, or the server shutting down
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    batch_task = asyncio.create_task(batcher.run())
+    # Stop on SIGTERM too, so the socket file is removed
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    print(f" Embedding server listening on {socket_path} "
+          f"({info['runtime']}, batches of up to {max_batch}, {wait_ms} ms window)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class RemoteEmbeddings:
+    def __init__(self, socket_path, fallback=None, timeout=EMBEDDING_SOCKET_TIMEOUT):
+        """
+        socket_path: where embedding_server.py listens
+        fallback: returns an in-process encoder, called once the first time
+        the server can't answer
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._fallback = fallback
+        self._fallback_encoder = None
+        self._fallback_lock = threading.Lock()
+        # One connection per thread, kept open between calls
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(self.socket_path)
+            except OSError:
+                connection.close()
+                raise
+            self._local.connection = connection
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            connection.close()
+
+    def reset(self):
+        """Forget connections inherited from a parent process; each process opens its own"""
+        self._local = threading.local()
+        self._fallback_lock = threading.Lock()
+
+    def _receive(self, connection, size):
+        data = bytearray()
+        while len(data) < size:
+            block = connection.recv(size - len(data))
+            if not block:
+                raise ConnectionError("embedding server closed the connection")
+            data += block
+        return bytes(data)
+
+    def call(self, request):
+        """Send one request; Returns: (header, body bytes)"""
+        connection = self._connection()
+        try:
+            connection.sendall(encode_message(request))
+            header = json.loads(self._receive(connection, _LENGTH.unpack(self._receive(connection, _LENGTH.size))[0]))
+            if "error" in header:
+                raise RuntimeError(f"embedding server: {header['error']}")
+            body = b""
+            if "shape" in header:
+                rows, dim = header["shape"]
+                body = self._receive(connection, rows * dim * 4)
+            return header, body
+        except (OSError, ValueError):
+            # Out of step with the server, or it went away: start over next time
+            self._close()
+            raise
+
+    def info(self):
+        return self.call({"op": "info"})[0]
+
+    def _local_encoder(self):
+        if self._fallback_encoder is None:
+            with self._fallback_lock:
+                if self._fallback_encoder is None:
+                    self._fallback_encoder = self._fallback()
+        return self._fallback_encoder
+
+    def _embed(self, texts):
+        for attempt in range(2):
+            try:
+                header, body = self.call({"op": "embed", "texts": texts})
+                return np.frombuffer(body, dtype=np.float32).reshape(header["shape"])
+            except (OSError, RuntimeError, ValueError) as e:
+                error = e
+                # A reused connection may have been closed by a server restart; retry on a new one
+                if not isinstance(e, OSError) or isinstance(e, TimeoutError):
+                    break
+
+        if self._fallback is None:
+            raise error
+        print(f" Embedding server unavailable, encoding in-process: {error}")
+        encoder = self._local_encoder()
+        if encoder is None:
+            raise error
+        return np.asarray(encoder.embed_documents(texts), dtype=np.float32)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        return self._embed(texts).tolist() if texts else []
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
+
+
+def connect(model_name, fallback=None, socket_path=None):
+    """
+    Client for a running embedding server of model_name
+    Returns: (RemoteEmbeddings, server's runtime), or None when there is no
+    server at socket_path (default EMBEDDING_SOCKET) or it runs another model
+    """
+    socket_path = EMBEDDING_SOCKET if socket_path is None else socket_path
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    try:
+        remote = RemoteEmbeddings(socket_path, fallback)
+        info = remote.info()
+    except Exception as e:
+        print(f" Embedding server at {socket_path} not answering: {e}")
+        return None
+    if info.get("model_name") != model_name:
+        print(f" Embedding server at {socket_path} runs {info.get('model_name')}, not {model_name}")
+        return None
+    print(f" Embedding through the server at {socket_path} ({info['runtime']})")
+    return remote, info["runtime"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--socket', default=EMBEDDING_SOCKET or '/tmp/staff_chatbot_embeddings.sock')
+    parser.add_argument('--max-batch', type=int, default=EMBED_MAX_BATCH)
+    parser.add_argument('--wait-ms', type=float, default=EMBED_BATCH_WAIT_MS)
+    args = parser.parse_args()
+
+    from encoder import load_encoder
+    from handbook_rag import EMBEDDING_MODEL, _load_embedding_model
+
+    encoder, runtime = load_encoder(EMBEDDING_MODEL, _load_embedding_model)
+    if encoder is None:
+        print(" ERROR: Could not load embeddings model")
+        return
+    info = {"model_name": EMBEDDING_MODEL, "runtime": runtime}
+    try:
+        asyncio.run(serve(encoder, info, args.socket, args.max_batch, args.wait_ms))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    print(" Embedding server stopped")
+
+
+if __name__ == "__main__":
+    main()
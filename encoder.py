@@ -0,0 +1,273 @@
+"""
+Query-embedding cache and optional ONNX Runtime encoder for MiniLM
+- CachedEmbeddings: wraps whichever encoder is loaded and keeps the query
+  vectors of the last QUERY_CACHE_SIZE texts in an LRU keyed on the
+  stripped text. One chat message is embedded by the CSV semantic tier,
+  the semantic cache and the handbook search; with the cache that is one
+  forward pass, and repeated questions cost none.
+- OnnxEmbeddings: the same model exported to ONNX and run by onnxruntime,
+  optionally with dynamically quantized int8 weights. Selected with
+  EMBEDDING_RUNTIME and used for queries and bulk indexing alike.
+
+EMBEDDING_RUNTIME is 'torch' (sentence-transformers, the default), 'onnx'
+or 'onnx-int8'. The ONNX files are written by
+    python encoder.py export
+into ENCODER_DIR; if they are missing the torch encoder is used.
+int8 vectors are close to but not the same as the float32 ones, so indexes
+and CSV embeddings built with it are keyed "<model>+int8" (model_key) and
+are rebuilt rather than mixed with float32 vectors.
+"""
+import argparse
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+RUNTIMES = ('torch', 'onnx', 'onnx-int8')
+EMBEDDING_RUNTIME = os.getenv('EMBEDDING_RUNTIME', 'torch')
+ENCODER_DIR = os.getenv('ENCODER_DIR', './onnx_encoder')
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '2048'))
+ONNX_BATCH_SIZE = 32
+
+
+def model_key(model_name, runtime=None):
+    """Name vectors are stored under: int8 weights give different vectors than float32"""
+    runtime = runtime or EMBEDDING_RUNTIME
+    return f"{model_name}+int8" if runtime == 'onnx-int8' else model_name
+
+
+def normalize_query(text):
+    """
+    Cache key for a query: the text without surrounding whitespace
+    Case is kept: EMBEDDING_MODEL may be a cased model, for which "US" and
+    "us" are different vectors
+    """
+    return text.strip()
+
+
+class CachedEmbeddings:
+    def __init__(self, encoder, max_entries=None):
+        """
+        encoder: anything with embed_query / embed_documents (HuggingFaceEmbeddings, OnnxEmbeddings)
+        max_entries: query vectors kept, least recently used evicted first
+        """
+        self.encoder = encoder
+        self.max_entries = QUERY_CACHE_SIZE if max_entries is None else max_entries
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+        if vector is not None:
+            metrics.increment('query_embeddings.cache_hits')
+            return vector.tolist()
+
+        metrics.increment('query_embeddings.cache_misses')
+        vector = np.asarray(self.encoder.embed_query(text), dtype=np.float32)
+        self._store({key: vector})
+        return vector.tolist()
+
+    def embed_queries(self, texts):
+        """embed_query for many texts, with the uncached ones encoded in one batch"""
+        keys = [normalize_query(text) for text in texts]
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                vector = self._vectors.get(key)
+                if vector is not None:
+                    self._vectors.move_to_end(key)
+                    vectors[key] = vector
+
+        # First text per missing key, so repeats in the batch are encoded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        metrics.increment('query_embeddings.cache_hits', len(keys) - len(missing))
+        if missing:
+            metrics.increment('query_embeddings.cache_misses', len(missing))
+            encoded = np.asarray(self.encoder.embed_documents(list(missing.values())), dtype=np.float32)
+            new_vectors = dict(zip(missing, encoded))
+            self._store(new_vectors)
+            vectors.update(new_vectors)
+        return [vectors[key].tolist() for key in keys]
+
+    def _store(self, vectors):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for key, vector in vectors.items():
+                self._vectors[key] = vector
+                self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+    def embed_documents(self, texts):
+        """Bulk embedding (indexing, CSV questions) goes straight to the encoder"""
+        return self.encoder.embed_documents(texts)
+
+    def reset(self):
+        """After a fork: a new lock, and the wrapped encoder's own reset (new session or connections)"""
+        self._lock = threading.Lock()
+        reset = getattr(self.encoder, 'reset', None)
+        if reset is not None:
+            reset()
+
+    def cache_size(self):
+        return len(self._vectors)
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+
+
+class OnnxEmbeddings:
+    def __init__(self, encoder_dir=None, quantized=False):
+        """
+        encoder_dir: written by export_onnx (model.onnx, model.int8.onnx, tokenizer, encoder.json)
+        quantized: run the int8 model instead of the float32 one
+        """
+        from transformers import AutoTokenizer
+
+        encoder_dir = encoder_dir or ENCODER_DIR
+        with open(os.path.join(encoder_dir, "encoder.json"), encoding='utf-8') as file:
+            self.info = json.load(file)
+        self.tokenizer = AutoTokenizer.from_pretrained(encoder_dir)
+        self.max_length = self.info["max_seq_length"]
+
+        self.model_path = os.path.join(encoder_dir, "model.int8.onnx" if quantized else "model.onnx")
+        self.session = self._open_session()
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _open_session(self):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return onnxruntime.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+
+    def reset(self):
+        """A new session: onnxruntime's thread pool doesn't survive a fork"""
+        self.session = self._open_session()
+
+    def _encode(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                return_tensors='np')
+        feed = {name: tokens[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feed)[0]
+        # Mean pooling over real tokens, then L2 normalization, as the
+        # sentence-transformers pipeline of all-MiniLM-L6-v2 does
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = [self._encode(texts[start:start + ONNX_BATCH_SIZE])
+                   for start in range(0, len(texts), ONNX_BATCH_SIZE)]
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+
+def load_encoder(model_name, load_torch, runtime=None):
+    """
+    Encoder for EMBEDDING_RUNTIME, falling back to load_torch() when the ONNX
+    export is missing or onnxruntime can't load it
+    Returns: the encoder and the runtime actually used
+    """
+    runtime = runtime or EMBEDDING_RUNTIME
+    if runtime in ('onnx', 'onnx-int8'):
+        try:
+            encoder = OnnxEmbeddings(ENCODER_DIR, quantized=runtime == 'onnx-int8')
+            if encoder.info.get("model_name") != model_name:
+                raise ValueError(f"{ENCODER_DIR} holds {encoder.info.get('model_name')}, not {model_name}")
+            print(f" Embedding with onnxruntime ({runtime}) from {ENCODER_DIR}")
+            return encoder, runtime
+        except Exception as e:
+            print(f" Could not load the {runtime} encoder, using torch: {e}")
+    elif runtime != 'torch':
+        print(f" Unknown EMBEDDING_RUNTIME {runtime!r}, using torch")
+    return load_torch(), 'torch'
+
+
+def export_onnx(model_name, encoder_dir=None, quantize=True):
+    """
+    Export the sentence-transformers model's transformer to ONNX
+    Writes model.onnx, model.int8.onnx (dynamic int8 weights, when quantize),
+    the tokenizer files and encoder.json to encoder_dir
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    encoder_dir = encoder_dir or ENCODER_DIR
+    os.makedirs(encoder_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    sample = tokenizer(["export sample"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    class LastHiddenState(torch.nn.Module):
+        # Keyword arguments, since the positional order of forward() differs between transformers versions
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs)), return_dict=True).last_hidden_state
+
+    model_path = os.path.join(encoder_dir, "model.onnx")
+    temp_path = f"{model_path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(LastHiddenState().eval(), tuple(sample[name] for name in input_names), temp_path,
+                          input_names=input_names, output_names=['last_hidden_state'],
+                          dynamic_axes=dynamic_axes, opset_version=14, dynamo=False)
+    os.replace(temp_path, model_path)
+    print(f" Exported {model_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(encoder_dir, "model.int8.onnx")
+        temp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        quantize_dynamic(model_path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, quantized_path)
+        print(f" Wrote int8 weights to {quantized_path}")
+
+    tokenizer.save_pretrained(encoder_dir)
+    info = {"model_name": model_name, "max_seq_length": model.max_seq_length}
+    with open(os.path.join(encoder_dir, "encoder.json"), 'w', encoding='utf-8') as file:
+        json.dump(info, file, indent=2)
+    return encoder_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model for onnxruntime")
+    parser.add_argument('command', choices=['export'])
+    parser.add_argument('--model', default=None, help="default: handbook_rag.EMBEDDING_MODEL")
+    parser.add_argument('--output', default=None, help=f"default: {ENCODER_DIR}")
+    parser.add_argument('--no-int8', action='store_true', help="skip the int8 model")
+    args = parser.parse_args()
+
+    if args.model is None:
+        from handbook_rag import EMBEDDING_MODEL
+        args.model = EMBEDDING_MODEL
+    export_onnx(args.model, args.output, quantize=not args.no_int8)
+
+
+if __name__ == "__main__":
+    main()
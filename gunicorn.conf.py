@@ -0,0 +1,59 @@
+"""
+gunicorn settings for serving app.py with several workers
+Usage: gunicorn -c gunicorn.conf.py app:app
+
+With PRELOAD_APP=1 (the default) the master imports the app and warms every
+tier before forking: the CSV bank, the TF-IDF matcher, MiniLM and the
+handbook index are loaded once and the workers share those pages with the
+master copy-on-write. The handbook vectors and CSV question embeddings are
+memory-mapped .npy files, so they are shared through the page cache in
+either mode.
+
+Sharing only lasts while pages aren't written to. CPython writes to an
+object whenever the cyclic garbage collector scans it, so the collector is
+off in the master while it loads and everything loaded is moved into the
+permanent generation (gc.freeze) before the first fork; workers turn the
+collector back on and only scan what they allocate themselves.
+
+Warm-up runs inline in the master when preloading: a warm-up thread would
+not exist in the forked workers, and a lock it held would stay locked
+there. app.after_fork resumes any step that hadn't finished and resets the
+threads, locks and connections a worker can't share with the master.
+"""
+import gc
+import os
+import sys
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', '4'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+preload_app = os.getenv('PRELOAD_APP', '1') == '1'
+
+if preload_app:
+    os.environ.setdefault('WARMUP_BACKGROUND', '0')
+    # The tokenizers library would otherwise warn in every worker that it forked after using threads
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+    gc.disable()
+
+
+def when_ready(server):
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+        server.log.info(f"Preloaded the app; {gc.get_freeze_count()} objects frozen for sharing")
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    gc.enable()
+
+    # Each worker gets its share of the cores for torch, not all of them
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // server.num_workers))
+
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.after_fork()
@@ -0,0 +1,362 @@
+"""
+Incremental indexing of a corpus of policy PDFs into the Chroma collection
+A manifest in the index directory records the embedding model, the
+splitter settings and, for each source PDF, the hash of every page and of
+every chunk on it. Syncing a PDF re-embeds only chunks whose text is new,
+deletes the vectors of chunks and pages that are gone, and skips parsing
+the PDF at all when its file hash is unchanged. A different model or
+different splitter settings clear the collection and rebuild it.
+
+Page text is extracted in a process pool, in page ranges so one large PDF
+also uses every core, and cached per file hash in TEXT_CACHE_DIR. Each
+PDF is chunked and embedded as soon as its pages are in, while the pool
+carries on with the rest. Chunks carry their source file name and page,
+so retrieval can cite across documents.
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    # requirements.txt pins the older PyPDF2 package name
+    from PyPDF2 import PdfReader
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Chunks embedded and upserted per Chroma call
+ADD_BATCH_SIZE = 128
+
+TEXT_CACHE_DIR = os.getenv('HANDBOOK_TEXT_CACHE', './handbook_text_cache')
+INGEST_WORKERS = int(os.getenv('HANDBOOK_INGEST_WORKERS', '0')) or os.cpu_count() or 1
+# Pages extracted per pool task
+PAGES_PER_TASK = 8
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(persist_dir):
+    """The manifest of an index directory, or None when there is none"""
+    try:
+        with open(os.path.join(persist_dir, MANIFEST_NAME), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(persist_dir, manifest):
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(path + '.tmp', path)
+
+
+def new_manifest(model_name):
+    return {
+        "version": MANIFEST_VERSION,
+        "embedding_model": model_name,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "sources": {}
+    }
+
+
+def manifest_matches(manifest, model_name):
+    """Whether vectors recorded in manifest can be reused with this model and splitter"""
+    expected = new_manifest(model_name)
+    return all(manifest.get(key) == expected[key]
+               for key in ("version", "embedding_model", "chunk_size", "chunk_overlap"))
+
+
+def indexed_chunk_ids(manifest):
+    return [chunk_id
+            for source in manifest["sources"].values()
+            for page in source["pages"].values()
+            for chunk_id in page["chunks"]]
+
+
+def collect_pdfs(paths):
+    """PDF files named by paths, with directories expanded (not recursively), in a stable order"""
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    pdf_paths = []
+    for path in paths:
+        path = str(path)
+        if os.path.isdir(path):
+            pdf_paths.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                             if name.lower().endswith('.pdf'))
+        else:
+            pdf_paths.append(path)
+    return pdf_paths
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Pool task: text of pages [start, stop) of one PDF"""
+    reader = PdfReader(pdf_path)
+    return pdf_path, start, [reader.pages[number].extract_text() or "" for number in range(start, stop)]
+
+
+def _load_cached_text(digest):
+    try:
+        with open(os.path.join(TEXT_CACHE_DIR, f"{digest}.json"), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cached_text(digest, pages):
+    os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+    path = os.path.join(TEXT_CACHE_DIR, f"{digest}.json")
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(pages, file)
+    os.replace(path + '.tmp', path)
+
+
+def _read_failed(pdf_path, error, failed):
+    print(f" ERROR reading {source_name(pdf_path)}: {type(error).__name__}: {error} - skipped")
+    if failed is not None:
+        failed[pdf_path] = f"{type(error).__name__}: {error}"
+
+
+def extract_pages(pdf_paths, digests, workers=INGEST_WORKERS, failed=None):
+    """
+    Page texts of each PDF, yielded as (pdf_path, [page text, ...]) as soon as
+    a whole file is extracted; files whose hash is in the text cache come first
+    digests: {pdf_path: file hash}
+    failed: dict that receives {pdf_path: error} for files that can't be read
+    (corrupt, truncated, encrypted); they are logged and not yielded
+    """
+    pending = {}
+    for pdf_path in pdf_paths:
+        pages = _load_cached_text(digests[pdf_path])
+        if pages is not None:
+            yield pdf_path, pages
+            continue
+        try:
+            pending[pdf_path] = len(PdfReader(pdf_path).pages)
+        except Exception as e:
+            _read_failed(pdf_path, e, failed)
+
+    if not pending:
+        return
+
+    started = time.perf_counter()
+    total_pages = sum(pending.values())
+    tasks = [(pdf_path, start, min(start + PAGES_PER_TASK, page_count))
+             for pdf_path, page_count in pending.items()
+             for start in range(0, page_count, PAGES_PER_TASK)]
+
+    def finish(pdf_path, pages):
+        _save_cached_text(digests[pdf_path], pages)
+        return pdf_path, pages
+
+    if workers <= 1 or len(tasks) == 1:
+        for pdf_path, page_count in pending.items():
+            try:
+                texts = _extract_page_range(pdf_path, 0, page_count)[2]
+            except Exception as e:
+                _read_failed(pdf_path, e, failed)
+                continue
+            yield finish(pdf_path, texts)
+    else:
+        pages = {pdf_path: [None] * page_count for pdf_path, page_count in pending.items()}
+        remaining = {pdf_path: 0 for pdf_path in pending}
+        for pdf_path, _, _ in tasks:
+            remaining[pdf_path] += 1
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = {pool.submit(_extract_page_range, *task): task[0] for task in tasks}
+            for future in as_completed(futures):
+                pdf_path = futures[future]
+                if pdf_path not in pages:
+                    # Another range of this file already failed
+                    continue
+                try:
+                    _, start, texts = future.result()
+                except Exception as e:
+                    _read_failed(pdf_path, e, failed)
+                    del pages[pdf_path]
+                    for other, other_path in futures.items():
+                        if other_path == pdf_path:
+                            other.cancel()
+                    continue
+                pages[pdf_path][start:start + len(texts)] = texts
+                remaining[pdf_path] -= 1
+                if not remaining[pdf_path]:
+                    yield finish(pdf_path, pages.pop(pdf_path))
+
+    elapsed = time.perf_counter() - started
+    print(f" Extracted {total_pages} pages in {elapsed:.2f}s "
+          f"({total_pages / elapsed:.0f} pages/s, {workers} workers)")
+
+
+def make_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        separators=["\n\n", "\n", " ", ""]
+    )
+
+
+def chunk_page(splitter, text, source, page_number):
+    """
+    Split one page into chunks with stable ids
+    An id is made of the source, page and chunk text hash, so unchanged
+    text keeps its id (and its vector) across syncs.
+    Returns: list of (chunk_id, chunk_hash, Document)
+    """
+    chunks = []
+    occurrences = {}
+    metadata = {"source": source, "page": int(page_number)}
+    for doc in splitter.create_documents([text], metadatas=[metadata]):
+        chunk_hash = text_hash(doc.page_content)
+        occurrence = occurrences[chunk_hash] = occurrences.get(chunk_hash, -1) + 1
+        doc.metadata["chunk_hash"] = chunk_hash
+        chunks.append((f"{source}:{page_number}:{chunk_hash[:16]}:{occurrence}", chunk_hash, doc))
+    return chunks
+
+
+def clear_collection(vector_db):
+    """Delete every vector in the collection"""
+    ids = vector_db.get(include=[])["ids"]
+    for start in range(0, len(ids), 5000):
+        vector_db.delete(ids=ids[start:start + 5000])
+    return len(ids)
+
+
+def source_name(pdf_path):
+    """Name a PDF is cited and keyed by in the manifest"""
+    return os.path.basename(str(pdf_path))
+
+
+def unchanged_stats(manifest, source):
+    return {"source": source, "pages": len(manifest["sources"][source]["pages"]),
+            "pages_changed": 0, "added": 0, "deleted": 0}
+
+
+def failed_stats(manifest, source, error):
+    entry = manifest["sources"].get(source)
+    return {"source": source, "pages": len(entry["pages"]) if entry else 0,
+            "pages_changed": 0, "added": 0, "deleted": 0, "error": error}
+
+
+def sync_source(vector_db, manifest, source, digest, pages):
+    """
+    Bring the vectors of one PDF up to date and record it in manifest
+    pages: text of every page, in order
+    Returns: counts of pages changed and chunks added and deleted
+    """
+    entry = manifest["sources"].get(source, {"file_hash": None, "pages": {}})
+    stats = {"source": source, "pages": len(entry["pages"]), "pages_changed": 0, "added": 0, "deleted": 0}
+
+    splitter = make_splitter()
+    new_pages = {}
+    to_add = []
+    to_delete = []
+
+    for index, text in enumerate(pages):
+        page_number = str(index)
+        page_hash = text_hash(text)
+        old_page = entry["pages"].get(page_number)
+        if old_page is not None and old_page["hash"] == page_hash:
+            new_pages[page_number] = old_page
+            continue
+
+        stats["pages_changed"] += 1
+        old_chunks = old_page["chunks"] if old_page is not None else {}
+        page_chunks = {}
+        for chunk_id, chunk_hash, doc in chunk_page(splitter, text, source, page_number):
+            page_chunks[chunk_id] = chunk_hash
+            if chunk_id not in old_chunks:
+                to_add.append((chunk_id, doc))
+        to_delete.extend(chunk_id for chunk_id in old_chunks if chunk_id not in page_chunks)
+        new_pages[page_number] = {"hash": page_hash, "chunks": page_chunks}
+
+    # Pages that are no longer in the PDF
+    for page_number, old_page in entry["pages"].items():
+        if page_number not in new_pages:
+            stats["pages_changed"] += 1
+            to_delete.extend(old_page["chunks"])
+
+    if to_delete:
+        vector_db.delete(ids=to_delete)
+    for start in range(0, len(to_add), ADD_BATCH_SIZE):
+        batch = to_add[start:start + ADD_BATCH_SIZE]
+        vector_db.add_documents([doc for _, doc in batch], ids=[chunk_id for chunk_id, _ in batch])
+
+    manifest["sources"][source] = {"file_hash": digest, "pages": new_pages}
+    stats.update(pages=len(new_pages), added=len(to_add), deleted=len(to_delete))
+    print(f" {source}: {stats['pages_changed']} pages changed, "
+          f"{stats['added']} chunks embedded, {stats['deleted']} removed")
+    return stats
+
+
+def remove_source(vector_db, manifest, source):
+    """Delete the vectors of a PDF that is no longer in the corpus"""
+    chunk_ids = [chunk_id for page in manifest["sources"].pop(source)["pages"].values()
+                 for chunk_id in page["chunks"]]
+    if chunk_ids:
+        vector_db.delete(ids=chunk_ids)
+    print(f" {source}: removed from the corpus, {len(chunk_ids)} chunks deleted")
+    return {"source": source, "pages": 0, "pages_changed": 0, "added": 0, "deleted": len(chunk_ids)}
+
+
+def sync_index(vector_db, persist_dir, pdf_paths, model_name, force=False, workers=INGEST_WORKERS):
+    """
+    Bring the collection up to date with the corpus and save the manifest
+    pdf_paths: the whole corpus; indexed PDFs not among them are removed
+    force: re-read PDFs even when their file hash is unchanged
+    The manifest is only written once every change has reached Chroma, and
+    chunks are upserted by id, so an interrupted sync is simply redone.
+    A PDF that can't be read is skipped with an "error" in its stats.
+    Returns: (manifest, list of per-source stats)
+    """
+    manifest = load_manifest(persist_dir)
+    if manifest is None or not manifest_matches(manifest, model_name):
+        print(" Index manifest missing or made with other settings - rebuilding")
+        clear_collection(vector_db)
+        manifest = new_manifest(model_name)
+
+    sources = {source_name(pdf_path): pdf_path for pdf_path in pdf_paths}
+    if len(sources) < len(pdf_paths):
+        raise ValueError("PDFs in the corpus must have distinct file names")
+
+    stats = [remove_source(vector_db, manifest, source)
+             for source in list(manifest["sources"]) if source not in sources]
+
+    digests = {pdf_path: file_hash(pdf_path) for pdf_path in pdf_paths}
+    stale = []
+    for source, pdf_path in sources.items():
+        if not force and manifest["sources"].get(source, {}).get("file_hash") == digests[pdf_path]:
+            print(f" {source}: unchanged, index is current")
+            stats.append(unchanged_stats(manifest, source))
+        else:
+            stale.append(pdf_path)
+
+    failed = {}
+    for pdf_path, pages in extract_pages(stale, digests, workers, failed):
+        stats.append(sync_source(vector_db, manifest, source_name(pdf_path), digests[pdf_path], pages))
+    # An unreadable PDF keeps whatever was indexed from it before, and is retried next sync
+    for pdf_path, error in failed.items():
+        stats.append(failed_stats(manifest, source_name(pdf_path), error))
+
+    save_manifest(persist_dir, manifest)
+    return manifest, stats
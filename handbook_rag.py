@@ -1,25 +1,85 @@
+import json
 import os
 import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 import shutil
+from handbook_index import sync_index, indexed_chunk_ids, collect_pdfs, load_manifest
+from vector_store import open_vector_index
+from bm25 import open_keyword_index
+from encoder import CachedEmbeddings, load_encoder, model_key
+import embedding_server
 
 # Global variables
+embeddings_model = None
+# Runtime the loaded encoder runs on (encoder.RUNTIMES), None until it is loaded
+embedding_runtime = None
 vector_db = None
+# What queries are served from: the vector_store index over vector_db's vectors, or vector_db itself
+vector_index = None
+# BM25 over the same passages (bm25.py), or None for dense retrieval only
+keyword_index = None
 retriever = None
 chunks = []
+handbook_sources = None
 PERSIST_DIR = "./chroma_db"
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# A sentence-transformers model name, or the path of a local copy
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', "all-MiniLM-L6-v2")
+
+# Prebuilt index artifacts from build_index.py; INDEX_DIR/CURRENT names the live one
+INDEX_DIR = os.getenv('INDEX_DIR', './indexes')
+INDEX_POLL_INTERVAL = float(os.getenv('INDEX_POLL_INTERVAL', '30'))
+active_index_version = None
+# (interval, index_dir) of the running watch_index thread, restarted by after_fork
+_index_watch = None
+
+# Hybrid retrieval: BM25 runs next to the dense search and the two rankings
+# are merged by reciprocal rank (score 1 / (RRF_K + rank) per ranking)
+HYBRID_RETRIEVAL = os.getenv('HYBRID_RETRIEVAL', '1') == '1'
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '10'))
+RRF_K = 60
+_keyword_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+_swap_lock = threading.Lock()
+_model_lock = threading.Lock()
+
+# langchain, sentence-transformers and torch take seconds to import, so they
+# are imported where first used (normally by the warm-up thread), not here
 
 def get_embedding_model():
     """
-    Get embeddings model with automatic SSL handling
+    Get the shared embeddings model, loading it on first use
+    The RAG index and the CSV question embeddings both use this instance;
+    query vectors are cached by text (encoder.CachedEmbeddings). With an
+    embedding server running (embedding_server.py) texts are sent to it
+    and the model is only loaded here if the server stops answering.
+    """
+    global embeddings_model, embedding_runtime
+
+    if embeddings_model is None:
+        with _model_lock:
+            if embeddings_model is None:
+                load_local = lambda: load_encoder(EMBEDDING_MODEL, _load_embedding_model)
+                encoder, runtime = (embedding_server.connect(EMBEDDING_MODEL, lambda: load_local()[0])
+                                    or load_local())
+                if encoder is not None:
+                    embedding_runtime = runtime
+                    embeddings_model = CachedEmbeddings(encoder)
+    return embeddings_model
+
+
+def embedding_key():
+    """Model name stored with indexes and CSV embeddings: EMBEDDING_MODEL, plus the int8 runtime if used"""
+    return model_key(EMBEDDING_MODEL, embedding_runtime)
+
+
+def _load_embedding_model():
+    """
+    Load embeddings model with automatic SSL handling
     Tries normal download first, then disables SSL verification if needed
     """
     print(" Loading embeddings model...")
+    from langchain_huggingface import HuggingFaceEmbeddings
     
     try:
         # Try normal download first
@@ -68,35 +128,22 @@ def get_embedding_model():
             return None
 
 
-def init_rag(pdf_path):
-    """Initialize RAG system with proper persistence handling"""
-    global vector_db, retriever, chunks
+def init_rag(pdf_paths):
+    """
+    Initialize RAG system with proper persistence handling
+    pdf_paths: a PDF, a directory of PDFs, or a list of either
+    """
+    global vector_db, vector_index, keyword_index, retriever, chunks, handbook_sources
     
     print("\n" + "="*60)
     print(" RAG INITIALIZATION DEBUG")
     print("="*60)
     
-    pdf_path = Path(pdf_path)
-    
-    # Step 1: Verify PDF file exists
-    print(f"\n File Path: {pdf_path}")
-    print(f" Absolute Path: {pdf_path.absolute()}")
-    print(f" File Exists: {pdf_path.exists()}")
-    
-    if not pdf_path.exists():
-        print(f" ERROR: PDF not found at {pdf_path.absolute()}")
+    # Steps 1-2: Verify the PDF files exist and aren't empty
+    corpus = usable_pdfs(collect_pdfs(pdf_paths))
+    if not corpus:
+        print(f" ERROR: No usable PDF in {pdf_paths}")
         print(f"   Current working directory: {os.getcwd()}")
-        print(f"   Files in current directory:")
-        for f in os.listdir('.'):
-            print(f"     - {f}")
-        return False
-    
-    # Step 2: Check file size
-    file_size = pdf_path.stat().st_size
-    print(f" File Size: {file_size / 1024:.2f} KB")
-    
-    if file_size == 0:
-        print(" ERROR: PDF file is empty (0 bytes)")
         return False
     
     # Step 3: Load embeddings model with SSL handling
@@ -106,145 +153,290 @@ def init_rag(pdf_path):
         print(" ERROR: Could not load embeddings model")
         return False
     
-    # Step 4: Check if vector store already exists
-    print(f"\n Checking for existing vector store...")
-    if os.path.exists(PERSIST_DIR):
-        print(f" Vector store already exists at {PERSIST_DIR}")
-        print(f"   Loading from disk (faster than rebuilding)...")
-        
-        try:
-            vector_db = Chroma(
-                persist_directory=PERSIST_DIR,
-                embedding_function=embeddings,
-                collection_name="handbook"
-            )
-            retriever = vector_db.as_retriever(search_kwargs={"k": 3})
-            
-            # Test if it actually works
-            test_results = vector_db.similarity_search("test", k=1)
-            
-            if len(test_results) > 0:
-                chunks = [1] * 190  # Dummy list to indicate chunks exist
-                
-                print(f" Vector store loaded successfully")
-                print(f" Contains indexed documents")
-                print("\n" + "="*60)
-                print(f" RAG INITIALIZED (FROM CACHE)")
-                print("="*60 + "\n")
-                return True
-            else:
-                print(f" Vector store exists but appears empty")
-                print(f"   Will rebuild from PDF...")
-                shutil.rmtree(PERSIST_DIR)
-            
-        except Exception as e:
-            print(f" Could not load cached vector store: {e}")
-            print(f" Will rebuild from PDF...")
-            if os.path.exists(PERSIST_DIR):
-                shutil.rmtree(PERSIST_DIR)
-    
-    # Step 5: Load PDF from scratch
-    print(f"\n Step 1: Loading PDF...")
+    # Step 4: Open the vector store (an unreadable one is rebuilt)
+    print(f"\n Opening vector store at {PERSIST_DIR}...")
     try:
-        loader = PyPDFLoader(str(pdf_path))
-        documents = loader.load()
-        print(f" Loaded {len(documents)} pages")
-        
-        if len(documents) == 0:
-            print(" ERROR: PDF loaded but contains 0 pages")
-            print("   This might be an image-only PDF or encrypted PDF")
-            return False
-        
-        first_page = documents[0].page_content[:200]
-        print(f" First page preview: {first_page}...")
-        
+        vector_db = open_vector_store(embeddings)
     except Exception as e:
-        print(f" ERROR loading PDF: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        print(f" Could not load cached vector store: {e}")
+        print(f" Will rebuild from PDF...")
+        if os.path.exists(PERSIST_DIR):
+            shutil.rmtree(PERSIST_DIR)
+        vector_db = open_vector_store(embeddings)
     
-    # Step 6: Split into chunks
-    print(f"\n Step 2: Splitting into chunks...")
+    # Step 5: Re-embed only what changed since the last run
+    print(f"\n Syncing index with {len(corpus)} PDF(s)...")
     try:
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        chunks = splitter.split_documents(documents)
-        print(f" Created {len(chunks)} chunks")
+        manifest, stats = sync_index(vector_db, PERSIST_DIR, corpus, embedding_key())
+        chunks = indexed_chunk_ids(manifest)
         
         if len(chunks) == 0:
-            print(" ERROR: No chunks created after splitting")
+            print(" ERROR: No chunks indexed")
+            print("   This might be an image-only PDF or encrypted PDF")
             return False
         
-        chunk_sizes = [len(c.page_content) for c in chunks]
-        print(f"   Min chunk size: {min(chunk_sizes)} chars")
-        print(f"   Max chunk size: {max(chunk_sizes)} chars")
-        print(f"   Avg chunk size: {sum(chunk_sizes)/len(chunk_sizes):.0f} chars")
+        retriever = vector_db.as_retriever(search_kwargs={"k": 3})
+        vector_index = open_vector_index(vector_db, PERSIST_DIR, chunks, embeddings)
+        keyword_index = open_keyword_index(vector_db, PERSIST_DIR, chunks) if HYBRID_RETRIEVAL else None
+        handbook_sources = pdf_paths
         
     except Exception as e:
-        print(f" ERROR splitting chunks: {e}")
+        print(f" ERROR indexing PDF: {e}")
         import traceback
         traceback.print_exc()
         return False
     
-    # Step 7: Create vector store
-    print(f"\n Step 3: Creating vector store...")
+    print("\n" + "="*60)
+    print(f" RAG INITIALIZED SUCCESSFULLY")
+    print(f"   Total chunks: {len(chunks)}")
+    print(f"   Persisted to: {PERSIST_DIR}")
+    print("="*60 + "\n")
+    
+    return True
+
+
+def open_vector_store(embeddings, persist_dir=PERSIST_DIR):
+    from langchain_community.vectorstores import Chroma
+    return Chroma(
+        persist_directory=persist_dir,
+        embedding_function=embeddings,
+        collection_name="handbook"
+    )
+
+
+def current_index_version(index_dir=INDEX_DIR):
+    """Version named by INDEX_DIR/CURRENT, or None when no artifact was activated"""
     try:
-        print(f"   Creating Chroma vector store...")
-        print(f"   This may take a few minutes...")
+        with open(os.path.join(index_dir, "CURRENT"), encoding='utf-8') as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+
+def read_index_info(version, index_dir=INDEX_DIR):
+    with open(os.path.join(index_dir, version, "index.json"), encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_index(version, index_dir=INDEX_DIR):
+    """
+    Serve a prebuilt index artifact, replacing the current vector store
+    The new store is opened and queried once before the swap; queries
+    already running finish on the store they started with.
+    Returns: True when the artifact is now live
+    """
+    global vector_db, vector_index, keyword_index, retriever, chunks, handbook_sources, active_index_version
+    
+    print(f"\n Loading index artifact {version}...")
+    try:
+        info = read_index_info(version, index_dir)
+        embeddings = get_embedding_model()
+        if embeddings is None:
+            print(" ERROR: Could not load embeddings model")
+            return False
         
-        vector_db = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=PERSIST_DIR,
-            collection_name="handbook"
-        )
-        print(f" Vector store created and persisted")
+        if info.get("embedding_model") != embedding_key():
+            print(f" ERROR: artifact was built with {info.get('embedding_model')}, "
+                  f"this server embeds queries with {embedding_key()}")
+            return False
         
-        retriever = vector_db.as_retriever(search_kwargs={"k": 3})
-        print(f" Retriever initialized")
+        persist_dir = os.path.join(index_dir, version, "chroma")
+        new_db = open_vector_store(embeddings, persist_dir)
+        new_chunks = indexed_chunk_ids(load_manifest(persist_dir))
+        if not new_chunks:
+            print(f" ERROR: artifact {version} is empty")
+            return False
+        new_index = open_vector_index(new_db, persist_dir, new_chunks, embeddings)
+        new_keywords = open_keyword_index(new_db, persist_dir, new_chunks) if HYBRID_RETRIEVAL else None
+        if not new_index.similarity_search_with_score("test", k=1):
+            print(f" ERROR: artifact {version} returned no results")
+            return False
         
     except Exception as e:
-        print(f" ERROR creating vector store: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f" ERROR loading index artifact {version}: {e}")
         return False
     
-    print("\n" + "="*60)
-    print(f" RAG INITIALIZED SUCCESSFULLY")
-    print(f"   Total chunks: {len(chunks)}")
-    print(f"   Persisted to: {PERSIST_DIR}")
-    print("="*60 + "\n")
+    with _swap_lock:
+        vector_db = new_db
+        vector_index = new_index
+        keyword_index = new_keywords
+        retriever = new_db.as_retriever(search_kwargs={"k": 3})
+        chunks = new_chunks
+        # An artifact is rebuilt offline, never re-indexed in place
+        handbook_sources = None
+        active_index_version = version
     
+    print(f" Index {version} is live ({len(new_chunks)} chunks, {len(info.get('sources', {}))} sources)")
     return True
 
 
-def get_rag_context(query):
+def reload_current_index(index_dir=INDEX_DIR):
+    """Swap to the artifact named by CURRENT if it isn't the live one; True when swapped"""
+    version = current_index_version(index_dir)
+    if version is None or version == active_index_version:
+        return False
+    return load_index(version, index_dir)
+
+
+def watch_index(interval=INDEX_POLL_INTERVAL, index_dir=INDEX_DIR):
+    """Poll CURRENT in a daemon thread and hot-swap when build_index.py activates a new artifact"""
+    stop = threading.Event()
+    
+    def poll():
+        while not stop.wait(interval):
+            try:
+                reload_current_index(index_dir)
+            except Exception as e:
+                print(f" Index watch error: {e}")
+    
+    global _index_watch
+    _index_watch = (interval, index_dir)
+    threading.Thread(target=poll, name="index-watch", daemon=True).start()
+    return stop
+
+
+def ensure_index_watch():
+    """Start watch_index unless this process already runs it; True when started"""
+    if _index_watch is not None:
+        return False
+    watch_index()
+    return True
+
+
+def after_fork():
+    """
+    Make state inherited from a pre-forking parent (gunicorn preload_app) safe to use
+    Only the forking thread survives a fork: locks a parent thread held stay
+    held, the bm25 pool and the index watcher have no threads left, and
+    onnxruntime sessions and embedding-server connections can't be shared.
+    The model weights and the memory-mapped vectors are kept as they are.
+    """
+    global _model_lock, _swap_lock, _keyword_pool
+
+    _model_lock = threading.Lock()
+    _swap_lock = threading.Lock()
+    _keyword_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+    if embeddings_model is not None:
+        embeddings_model.reset()
+
+    if _index_watch is not None:
+        watch_index(*_index_watch)
+
+
+def usable_pdfs(pdf_paths):
+    """The PDFs that exist and aren't empty, reporting the others"""
+    usable = []
+    for pdf_path in map(Path, pdf_paths):
+        print(f"\n File Path: {pdf_path.absolute()}")
+        if not pdf_path.exists():
+            print(f" ERROR: PDF not found at {pdf_path.absolute()}")
+        elif pdf_path.stat().st_size == 0:
+            print(" ERROR: PDF file is empty (0 bytes)")
+        else:
+            print(f" File Size: {pdf_path.stat().st_size / 1024:.2f} KB")
+            usable.append(str(pdf_path))
+    return usable
+
+
+def reindex_handbook(force=False):
+    """
+    Bring the running index up to date with the corpus, e.g. after a PDF
+    was edited, added to or removed from the handbook directory
+    force: re-read PDFs even when their file hash is unchanged
+    Returns: per-source stats from handbook_index.sync_index, or None when RAG is not initialized
+    """
+    global chunks, vector_index, keyword_index
+    
+    db, sources = vector_db, handbook_sources
+    if db is None or sources is None:
+        print(" RAG not initialized from PDFs - nothing to re-index")
+        print("   Prebuilt artifacts are rebuilt with build_index.py")
+        return None
+    
+    corpus = usable_pdfs(collect_pdfs(sources))
+    manifest, stats = sync_index(db, PERSIST_DIR, corpus, embedding_key(), force)
+    new_chunks = indexed_chunk_ids(manifest)
+    new_index = open_vector_index(db, PERSIST_DIR, new_chunks, get_embedding_model())
+    new_keywords = open_keyword_index(db, PERSIST_DIR, new_chunks) if HYBRID_RETRIEVAL else None
+    
+    # Swapped together, so a search never mixes two versions of the index
+    with _swap_lock:
+        if vector_db is not db:
+            print(" An index artifact went live during the re-index; keeping it")
+            return stats
+        vector_index = new_index
+        keyword_index = new_keywords
+        chunks = new_chunks
+    return stats
+
+
+def passage_key(passage):
+    return passage.metadata.get("source"), passage.metadata.get("page"), passage.page_content
+
+
+def hybrid_search(index, keywords, query, k=3):
+    """
+    Dense and BM25 search merged by reciprocal-rank fusion
+    BM25 runs in a pool thread while the query is embedded and searched.
+    Returns: [(passage, distance, fused_score)] best first; distance is None
+    for a passage only BM25 found, and fused_score is scaled so a passage
+    ranked first by both searches scores 1.0
+    """
+    keyword_future = _keyword_pool.submit(keywords.search, query, HYBRID_CANDIDATES)
+    dense_results = index.similarity_search_with_score(query, k=HYBRID_CANDIDATES)
+    keyword_results = keyword_future.result()
+    
+    # Dense hits go in first, so ties keep the dense order
+    fused = {}
+    for rank, (passage, distance) in enumerate(dense_results, 1):
+        fused.setdefault(passage_key(passage), [passage, distance, 0.0])[2] += 1.0 / (RRF_K + rank)
+    for rank, (row, _) in enumerate(keyword_results, 1):
+        passage = keywords.passages[row]
+        fused.setdefault(passage_key(passage), [passage, None, 0.0])[2] += 1.0 / (RRF_K + rank)
+    
+    best = sorted(fused.values(), key=lambda entry: -entry[2])[:k]
+    top_score = 2.0 / (RRF_K + 1)
+    return [(passage, distance, score / top_score) for passage, distance, score in best]
+
+
+def get_rag_context(query, deadline=None):
     """
     Get context from handbook RAG
-    Returns: (context_text, confidence_score, page_numbers)
+    deadline: optional deadline.Deadline; the search is skipped when too little time is left
+    Returns: (context_text, confidence_score, citations)
+    Each passage in context_text is headed with its source, e.g.
+    "[HandbookQA.pdf, p. 12]", and citations lists those in result order.
     
-    Chroma returns DISTANCE scores (lower is better)
-    We convert to similarity scores (higher is better)
+    With a BM25 index the confidence is the average fused score of the
+    passages (see hybrid_search); dense-only, it is derived from Chroma's
+    DISTANCE scores (squared L2, lower is better) as 1 / (1 + avg distance)
     """
-    global vector_db, chunks
+    # One read of the globals, under the swap lock so both come from the same
+    # version: a hot-swap or re-index mid-query doesn't affect this query
+    with _swap_lock:
+        index = vector_index
+        keywords = keyword_index
+        indexed_chunks = chunks
     
     print(f"\n RAG Query: '{query}'")
     
-    if vector_db is None:
-        print(" RAG not initialized - vector_db is None")
+    if index is None:
+        print(" RAG not initialized - vector_index is None")
         return None, 0.0, []
     
-    if len(chunks) == 0:
+    if len(indexed_chunks) == 0:
         print(" RAG has 0 chunks")
         return None, 0.0, []
     
+    if deadline is not None and not deadline.allows('retrieval'):
+        return None, 0.0, []
+    
     try:
         # Get results with scores
-        results = vector_db.similarity_search_with_score(query, k=3)
+        if HYBRID_RETRIEVAL and keywords is not None:
+            results = hybrid_search(index, keywords, query, k=3)
+        else:
+            results = [(doc, score, None) for doc, score in index.similarity_search_with_score(query, k=3)]
         
         print(f" Found {len(results)} results")
         
@@ -253,24 +445,32 @@ def get_rag_context(query):
             return None, 0.0, []
         
         context_parts = []
-        pages = set()
+        citations = []
         scores = []
         
         print(f"\n Results breakdown:")
-        for i, (doc, score) in enumerate(results, 1):
+        fused_scores = []
+        for i, (doc, score, fused_score) in enumerate(results, 1):
             print(f"   Result {i}:")
-            print(f"     - Distance score: {score:.4f} (lower is better)")
+            if score is not None:
+                print(f"     - Distance score: {score:.4f} (lower is better)")
+            else:
+                print(f"     - Keyword match only")
+            if fused_score is not None:
+                print(f"     - Fused score: {fused_score:.4f}")
+                fused_scores.append(fused_score)
             print(f"     - Content length: {len(doc.page_content)} chars")
             print(f"     - Preview: {doc.page_content[:100]}...")
             
-            context_parts.append(doc.page_content)
-            scores.append(score)
+            citation = format_citation(doc.metadata)
+            context_parts.append(f"[{citation}]\n{doc.page_content}" if citation else doc.page_content)
+            if score is not None:
+                scores.append(score)
             
-            # Extract page number
-            if "page" in doc.metadata:
-                page_num = doc.metadata["page"]
-                pages.add(page_num)
-                print(f"     - Page: {page_num}")
+            if citation:
+                print(f"     - Source: {citation}")
+                if citation not in citations:
+                    citations.append(citation)
         
         # Combine all context
         context = "\n\n".join(context_parts)
@@ -279,25 +479,34 @@ def get_rag_context(query):
         # Chroma uses L2 distance, lower scores = more similar
         # Typical range: 0.3 (very similar) to 2.0+ (not similar)
         
-        avg_distance = sum(scores) / len(scores)
+        avg_distance = sum(scores) / len(scores) if scores else None
         
-        # Convert distance to similarity (0 to 1 scale, higher is better)
-        avg_similarity = 1.0 / (1.0 + avg_distance)
+        if fused_scores:
+            # Passages both searches rank highly score close to 1
+            avg_similarity = sum(fused_scores) / len(fused_scores)
+        else:
+            # Convert distance to similarity (0 to 1 scale, higher is better)
+            avg_similarity = 1.0 / (1.0 + avg_distance)
         
         print(f"\n Score Analysis:")
         print(f"   Raw scores: {[f'{s:.4f}' for s in scores]}")
-        print(f"   Avg distance: {avg_distance:.4f}")
+        if avg_distance is not None:
+            print(f"   Avg distance: {avg_distance:.4f}")
+        if fused_scores:
+            print(f"   Fused scores: {[f'{s:.4f}' for s in fused_scores]}")
         print(f"   Converted similarity: {avg_similarity:.4f} ({avg_similarity:.2%})")
         
         # Quality check
-        if avg_distance > 1.5:
+        if avg_distance is None:
+            print(f" Keyword matches only")
+        elif avg_distance > 1.5:
             print(f" WARNING: High distance score suggests poor match")
         elif avg_distance < 0.5:
             print(f" Excellent match")
         else:
             print(f" Good match")
         
-        return context, avg_similarity, sorted(list(pages))
+        return context, avg_similarity, citations
         
     except Exception as e:
         print(f" RAG retrieval error: {e}")
@@ -306,6 +515,15 @@ def get_rag_context(query):
         return None, 0.0, []
 
 
+def format_citation(metadata):
+    """'HandbookQA.pdf, p. 12' for a chunk's metadata (pages are stored 0-based)"""
+    source = os.path.basename(str(metadata.get("source", "")))
+    if "page" not in metadata:
+        return source
+    page = f"p. {int(metadata['page']) + 1}"
+    return f"{source}, {page}" if source else page
+
+
 def is_handbook_question(question):
     """Check if question is suitable for handbook lookup"""
     handbook_keywords = [
@@ -331,11 +549,11 @@ def test_rag_search(query):
     print(f"{'='*70}")
     print(f"Query: {query}")
     
-    context, confidence, pages = get_rag_context(query)
+    context, confidence, citations = get_rag_context(query)
     
     print(f"\n Results:")
     print(f"   Confidence: {confidence:.2%}")
-    print(f"   Pages: {pages}")
+    print(f"   Sources: {citations}")
     print(f"   Context length: {len(context) if context else 0} chars")
     
     if context:
@@ -347,7 +565,7 @@ def test_rag_search(query):
     
     print(f"\n{'='*70}\n")
     
-    return context, confidence, pages
+    return context, confidence, citations
 
 
 def reset_vector_store():
@@ -0,0 +1,221 @@
+"""
+Move closed months of chat history out of chat_history.db into Parquet
+Usage: python history_archive.py archive [--keep-months 1] [--vacuum]
+       python history_archive.py query [--user ID] [--start 2025-01-01] [--end 2025-02-01]
+
+Rows of every month before the current one (UTC), less --keep-months, are
+written to zstd-compressed Parquet files under ARCHIVE_DIR, partitioned as
+year=YYYY/month=MM, and then deleted from the conversations table. Each run
+only deletes rows it has just written, so rows arriving late for a month
+end up in another file of the same partition. Reporting reads the archive
+with query_archive, without touching the live database.
+"""
+import argparse
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+HISTORY_DB = os.getenv('CHAT_HISTORY_DB', 'chat_history.db')
+ARCHIVE_DIR = os.getenv('CHAT_HISTORY_ARCHIVE', 'history_archive')
+
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('user_id', pa.string()),
+    ('message', pa.string()),
+    ('response', pa.string()),
+    ('timestamp', pa.timestamp('s')),
+])
+
+# Rows read from SQLite and deleted per statement, so the serving path
+# never waits long on the write lock
+CHUNK_SIZE = 20000
+
+
+def month_start(year, month):
+    return f"{year:04d}-{month:02d}-01 00:00:00"
+
+
+def add_months(year, month, count):
+    index = year * 12 + (month - 1) + count
+    return index // 12, index % 12 + 1
+
+
+def closed_months(conn, keep_months=0, now=None):
+    """(year, month) of every month with rows that ended keep_months or more months ago"""
+    now = now or datetime.now(timezone.utc)
+    cutoff = month_start(*add_months(now.year, now.month, -keep_months))
+    rows = conn.execute('''
+        SELECT DISTINCT substr(timestamp, 1, 7)
+        FROM conversations
+        WHERE timestamp < ?
+        ORDER BY 1
+    ''', (cutoff,)).fetchall()
+    return [(int(value[:4]), int(value[5:7])) for (value,) in rows]
+
+
+def _to_batch(rows):
+    ids, user_ids, messages, responses, timestamps = zip(*rows)
+    return pa.record_batch([
+        pa.array(ids, pa.int64()),
+        pa.array(user_ids, pa.string()),
+        pa.array(messages, pa.string()),
+        pa.array(responses, pa.string()),
+        pa.array([datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S') for value in timestamps],
+                 pa.timestamp('s')),
+    ], schema=SCHEMA)
+
+
+def archive_month(conn, year, month, archive_dir=ARCHIVE_DIR):
+    """
+    Write one month's rows to a new Parquet file in its partition, then delete them
+    Returns: number of rows archived
+    """
+    start = month_start(year, month)
+    end = month_start(*add_months(year, month, 1))
+    partition = os.path.join(archive_dir, f"year={year:04d}", f"month={month:02d}")
+    os.makedirs(partition, exist_ok=True)
+
+    cursor = conn.execute('''
+        SELECT id, user_id, message, response, timestamp
+        FROM conversations
+        WHERE timestamp >= ? AND timestamp < ?
+        ORDER BY id
+    ''', (start, end))
+
+    temp_path = os.path.join(partition, '.part.parquet.tmp')
+    writer = None
+    first_id = last_id = None
+    count = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            if writer is None:
+                writer = pq.ParquetWriter(temp_path, SCHEMA, compression='zstd')
+                first_id = rows[0][0]
+            writer.write_batch(_to_batch(rows))
+            last_id = rows[-1][0]
+            count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not count:
+        return 0
+
+    # The file is complete before any row is deleted
+    os.replace(temp_path, os.path.join(partition, f"part-{first_id}-{last_id}.parquet"))
+
+    while True:
+        with conn:
+            deleted = conn.execute('''
+                DELETE FROM conversations
+                WHERE id IN (
+                    SELECT id FROM conversations
+                    WHERE timestamp >= ? AND timestamp < ? AND id BETWEEN ? AND ?
+                    LIMIT ?
+                )
+            ''', (start, end, first_id, last_id, CHUNK_SIZE)).rowcount
+        if deleted < CHUNK_SIZE:
+            return count
+
+
+def archive_closed_months(db_path=HISTORY_DB, archive_dir=ARCHIVE_DIR, keep_months=0, vacuum=False):
+    """
+    Archive every closed month older than keep_months
+    vacuum: also give the freed pages back to the file system (takes an
+    exclusive lock on the database for the duration)
+    Returns: {(year, month): rows archived}
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    try:
+        archived = {}
+        for year, month in closed_months(conn, keep_months):
+            archived[(year, month)] = archive_month(conn, year, month, archive_dir)
+            print(f" Archived {archived[(year, month)]} rows from {year:04d}-{month:02d}")
+
+        if vacuum and archived:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.execute('VACUUM')
+        return archived
+    finally:
+        conn.close()
+
+
+def query_archive(archive_dir=ARCHIVE_DIR, user_id=None, start=None, end=None, columns=None):
+    """
+    Read archived history for reporting
+    start, end: datetimes bounding the timestamp (end exclusive); only the
+    partitions of the months in range are opened
+    columns: subset of SCHEMA names to read
+    Returns: a pyarrow Table (use .to_pandas() for a DataFrame)
+    """
+    files = []
+    for directory, _, names in os.walk(archive_dir):
+        if _partition_in_range(directory, start, end):
+            files.extend(os.path.join(directory, name) for name in sorted(names) if name.endswith('.parquet'))
+    dataset = ds.dataset(files, format='parquet', schema=SCHEMA)
+
+    condition = None
+    for part in _conditions(user_id, start, end):
+        condition = part if condition is None else condition & part
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def _conditions(user_id, start, end):
+    if user_id is not None:
+        yield ds.field('user_id') == user_id
+    if start is not None:
+        yield ds.field('timestamp') >= pa.scalar(start.replace(tzinfo=None), pa.timestamp('s'))
+    if end is not None:
+        yield ds.field('timestamp') < pa.scalar(end.replace(tzinfo=None), pa.timestamp('s'))
+
+
+def _partition_in_range(directory, start, end):
+    """Whether directory is a year=/month= partition that can hold rows in [start, end)"""
+    parts = dict(part.split('=', 1) for part in directory.replace('\\', '/').split('/') if '=' in part)
+    if 'year' not in parts or 'month' not in parts:
+        return False
+    year, month = int(parts['year']), int(parts['month'])
+    if start is not None and (year, month) < (start.year, start.month):
+        return False
+    if end is not None and datetime(year, month, 1) >= end.replace(tzinfo=None):
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    archive = commands.add_parser('archive', help='move closed months to Parquet')
+    archive.add_argument('--keep-months', type=int, default=0,
+                         help='closed months to keep in the live table')
+    archive.add_argument('--vacuum', action='store_true', help='shrink the database file afterwards')
+
+    query = commands.add_parser('query', help='summarize archived history')
+    query.add_argument('--user')
+    query.add_argument('--start', type=datetime.fromisoformat)
+    query.add_argument('--end', type=datetime.fromisoformat)
+
+    args = parser.parse_args()
+    if args.command == 'archive':
+        archived = archive_closed_months(keep_months=args.keep_months, vacuum=args.vacuum)
+        print(f" Archived {sum(archived.values())} rows in {len(archived)} months")
+    else:
+        table = query_archive(user_id=args.user, start=args.start, end=args.end)
+        print(f" {table.num_rows} archived rows")
+        if table.num_rows:
+            counts = table.group_by('user_id').aggregate([('id', 'count')]).sort_by([('id_count', 'descending')])
+            for user, total in zip(counts['user_id'].to_pylist()[:20], counts['id_count'].to_pylist()[:20]):
+                print(f"   {user}: {total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Chat history in SQLite (chat_history.db) with write-behind logging
+save() only queues the row; a background thread writes whatever is queued
+in one transaction over a single WAL-mode connection, so requests never
+wait on the database write lock or an fsync. The queue is bounded: when
+it is full, save() waits briefly for room and then drops the row.
+Queued rows are flushed on close(), which also runs at interpreter exit.
+
+History is read newest first, a page at a time, with keyset pagination on
+(timestamp, id): a cursor names the last row of the previous page, so a
+page costs the same however far back it is.
+"""
+import atexit
+import base64
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Schema migrations in order; PRAGMA user_version is the number applied
+MIGRATIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        message TEXT,
+        response TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # One user's rows, newest first (id is the rowid, so it rides along in the index)
+    'CREATE INDEX IF NOT EXISTS idx_conversations_user_time ON conversations (user_id, timestamp)',
+]
+
+_STOP = object()
+
+
+def encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    (timestamp, id) of the row a cursor names, or None for no cursor
+    Raises ValueError for a malformed cursor
+    """
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return timestamp, int(row_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE):
+    """
+    Page size from a query string value, capped at MAX_PAGE_SIZE
+    Raises ValueError unless it is a positive integer
+    """
+    if value in (None, ''):
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f"invalid limit: {value!r}")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+class HistoryStore:
+    def __init__(self, db_path='chat_history.db', max_queue=10000, batch_size=500, enqueue_timeout=0.1):
+        """
+        max_queue: rows that may wait for the writer before save() pushes back
+        batch_size: most rows written in one transaction
+        enqueue_timeout: seconds save() waits for room in a full queue before dropping the row
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self):
+        """Read connection of the calling thread, reused across requests"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _init_db(self):
+        """Apply the migrations this database hasn't had yet"""
+        conn = self._connection()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, statement in enumerate(MIGRATIONS[version:], start=version + 1):
+            print(f" Chat history: applying migration {number}")
+            with conn:
+                conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {number}')
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, name='history-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+
+    def after_fork(self):
+        """In a forked worker: drop the parent's connections and writer; the writer starts on the next save"""
+        self._local = threading.local()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+
+    def save(self, user_id, message, response):
+        """
+        Queue a conversation row
+        Returns: False when the queue stayed full and the row was dropped
+        """
+        self._ensure_writer()
+        # Same format as CURRENT_TIMESTAMP, taken now rather than at write time
+        row = (user_id, message, response, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            metrics.increment('history.backpressure_waits')
+            try:
+                self._queue.put(row, timeout=self.enqueue_timeout)
+            except queue.Full:
+                print(" History queue full - dropping row")
+                metrics.increment('history.dropped')
+                return False
+
+        metrics.increment('history.enqueued')
+        metrics.set_gauge('history.queue_depth', self._queue.qsize())
+        return True
+
+    def fetch(self, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        One page of a user's history, newest first; waits briefly for queued rows
+        cursor: next_cursor of the previous page
+        Returns: (rows, next_cursor) where next_cursor is None on the last page
+        """
+        position = decode_cursor(cursor)
+        self.flush(timeout=1.0)
+        return self._fetch_page(user_id, position, limit)
+
+    def iter_pages(self, user_id, cursor=None, limit=None, page_size=200):
+        """
+        A user's history as a generator of (rows, next_cursor) pages, newest
+        first, holding no more than one page in memory
+        limit: most rows in total, or None for the whole history
+        Raises ValueError for a malformed cursor (straight away, not on iteration)
+        """
+        position = decode_cursor(cursor)
+        self.flush(timeout=1.0)
+        return self._iter_pages(user_id, position, limit, page_size)
+
+    def _iter_pages(self, user_id, position, limit, page_size):
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            rows, next_cursor = self._fetch_page(user_id, position, size)
+            yield rows, next_cursor
+            if next_cursor is None:
+                return
+            position = decode_cursor(next_cursor)
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def _fetch_page(self, user_id, position, limit):
+        # Rows are read with fetchall, so no SQLite cursor outlives the call
+        # and a page iterator can be resumed from another thread
+        if position is None:
+            rows = self._connection().execute('''
+                SELECT id, message, response, timestamp
+                FROM conversations
+                WHERE user_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            ''', (user_id, limit + 1)).fetchall()
+        else:
+            rows = self._connection().execute('''
+                SELECT id, message, response, timestamp
+                FROM conversations
+                WHERE user_id = ? AND (timestamp, id) < (?, ?)
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            ''', (user_id, position[0], position[1], limit + 1)).fetchall()
+
+        # The extra row only tells whether another page follows
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+        return [{"message": row[1], "response": row[2], "timestamp": row[3]} for row in rows], next_cursor
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued row has been written
+        Returns: False if rows were still pending after timeout seconds
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def close(self, timeout=10):
+        """Write the remaining rows and stop the writer thread"""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        self._queue.put(_STOP)
+        writer.join(timeout)
+
+    def _run_writer(self):
+        conn = self._connect()
+        stopping = False
+
+        while not stopping:
+            batch = [self._queue.get()]
+            # Take whatever else is already waiting, up to one batch
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if _STOP in batch:
+                stopping = True
+            rows = [row for row in batch if row is not _STOP]
+            if rows:
+                self._write(conn, rows)
+            for _ in batch:
+                self._queue.task_done()
+            metrics.set_gauge('history.queue_depth', self._queue.qsize())
+
+        conn.close()
+
+    def _write(self, conn, rows, attempts=3):
+        for attempt in range(attempts):
+            try:
+                with conn:
+                    conn.executemany('''
+                        INSERT INTO conversations (user_id, message, response, timestamp)
+                        VALUES (?, ?, ?, ?)
+                    ''', rows)
+                metrics.increment('history.batches')
+                metrics.increment('history.rows_written', len(rows))
+                return
+            except sqlite3.Error as e:
+                print(f" History write error: {e}")
+                metrics.increment('history.write_errors')
+                time.sleep(0.1 * (attempt + 1))
+
+        print(f" Dropping {len(rows)} history rows after {attempts} failed writes")
+        metrics.increment('history.dropped', len(rows))
@@ -0,0 +1,368 @@
+"""
+Shared client for the Groq chat completions API (OpenAI-compatible)
+One pooled httpx client per process (plus one AsyncLLMClient per event loop
+for the ASGI app): connections are kept alive between calls (HTTP/2 when
+the h2 package is installed), and 429/5xx responses or connection errors
+are retried with jittered exponential backoff.
+Point LLM_API_URL at a local OpenAI-compatible server (see llm_stub_server.py)
+to exercise it without calling Groq.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv('.env')
+API_KEY = os.getenv('API_KEY')
+API_URL = os.getenv('LLM_API_URL', "https://api.groq.com/openai/v1/chat/completions")
+LLM_MODEL = os.getenv('LLM_MODEL', "llama-3.3-70b-versatile")
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '10'))
+# The ASGI app multiplexes many more in-flight chats over one process
+LLM_ASYNC_POOL_SIZE = int(os.getenv('LLM_ASYNC_POOL_SIZE', '100'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _client_options(api_key, pool_size, timeout):
+    """Keyword arguments shared by the sync and async httpx clients"""
+    return {
+        "http2": http2_available(),
+        "limits": httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                               keepalive_expiry=60),
+        "headers": {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+        "timeout": timeout
+    }
+
+
+def _parse_stream_line(line):
+    """
+    Decode one SSE line of a streaming completion
+    Returns: text fragment, '' for lines without text, or None at [DONE]
+    """
+    if not line.startswith('data:'):
+        return ''
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return None
+    choices = json.loads(data).get('choices') or [{}]
+    return choices[0].get('delta', {}).get('content') or ''
+
+
+def _read_body(response, ends_at):
+    """
+    Read a streamed response body, giving up at ends_at (time.monotonic())
+    httpx timeouts apply to each read, so a body arriving a few bytes at a
+    time could otherwise run past the deadline
+    """
+    body = bytearray()
+    chunks = response.iter_bytes()
+    while True:
+        if time.monotonic() >= ends_at:
+            raise httpx.ReadTimeout("response still arriving when the attempt ran out of time",
+                                    request=response.request)
+        try:
+            body += next(chunks)
+        except StopIteration:
+            return bytes(body)
+
+
+class LLMClient:
+    def __init__(self, api_url=API_URL, api_key=API_KEY, pool_size=LLM_POOL_SIZE,
+                 max_retries=LLM_MAX_RETRIES, timeout=LLM_TIMEOUT, backoff=0.5, max_backoff=8.0):
+        """
+        pool_size: maximum open (and kept-alive) connections to the API host
+        max_retries: extra attempts after a 429/5xx response or connection error
+        backoff, max_backoff: base and cap in seconds for the jittered retry delay
+        """
+        self.api_url = api_url
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._client = self._create_client(api_key, pool_size, timeout)
+
+    def _create_client(self, api_key, pool_size, timeout):
+        return httpx.Client(**_client_options(api_key, pool_size, timeout))
+
+    def build_payload(self, messages, model=None, **params):
+        return {"model": model or LLM_MODEL, "messages": messages, **params}
+
+    def chat(self, messages, model=None, timeout=None, deadline=None, **params):
+        """
+        Send a chat completion request
+        deadline: optional deadline.Deadline; no attempt or retry wait runs past it
+        params: extra payload fields (temperature, max_tokens, top_p, ...)
+        Returns: the reply text, or None on failure
+        """
+        payload = self.build_payload(messages, model, **params)
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            attempt_timeout = self.attempt_timeout(timeout, deadline)
+            if attempt_timeout <= 0:
+                return None
+            attempt_ends = time.monotonic() + attempt_timeout
+            try:
+                with self._client.stream('POST', self.api_url, json=payload,
+                                         timeout=attempt_timeout) as response:
+                    body = _read_body(response, attempt_ends) if response.status_code == 200 else None
+            except httpx.HTTPError as e:
+                print(f" LLM request error: {e}")
+                metrics.increment('llm.errors')
+            else:
+                if response.status_code == 200:
+                    metrics.increment('llm.requests')
+                    return json.loads(body)['choices'][0]['message']['content'].strip()
+
+                print(f" LLM error: {response.status_code}")
+                metrics.increment('llm.errors')
+                if response.status_code not in RETRY_STATUSES:
+                    return None
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                delay = self.retry_delay(attempt, retry_after)
+                if deadline is not None and delay >= deadline.remaining():
+                    return None
+                metrics.increment('llm.retries')
+                time.sleep(delay)
+
+        return None
+
+    def stream_chat(self, messages, model=None, timeout=None, deadline=None, **params):
+        """
+        Send a streaming chat completion request
+        Yields: reply text fragments as they arrive. Retries only happen
+        before the first fragment; a failure mid-stream, or reaching the
+        deadline, just ends it.
+        """
+        payload = self.build_payload(messages, model, stream=True, **params)
+        started = False
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            attempt_timeout = self.attempt_timeout(timeout, deadline)
+            if attempt_timeout <= 0:
+                return
+            attempt_ends = time.monotonic() + attempt_timeout
+            try:
+                with self._client.stream('POST', self.api_url, json=payload,
+                                         timeout=attempt_timeout) as response:
+                    if response.status_code == 200:
+                        metrics.increment('llm.streams')
+                        for line in response.iter_lines():
+                            fragment = _parse_stream_line(line)
+                            if fragment is None:
+                                return
+                            # The read timeout is per line, not for the whole stream
+                            if time.monotonic() >= attempt_ends:
+                                return
+                            if fragment:
+                                started = True
+                                yield fragment
+                        return
+
+                    print(f" LLM stream error: {response.status_code}")
+                    metrics.increment('llm.errors')
+                    if response.status_code not in RETRY_STATUSES:
+                        return
+                    retry_after = response.headers.get('Retry-After')
+            except (httpx.HTTPError, ValueError) as e:
+                print(f" LLM stream error: {e}")
+                metrics.increment('llm.errors')
+                if started:
+                    return
+
+            if attempt < self.max_retries:
+                delay = self.retry_delay(attempt, retry_after)
+                if deadline is not None and delay >= deadline.remaining():
+                    return
+                metrics.increment('llm.retries')
+                time.sleep(delay)
+
+    def attempt_timeout(self, timeout=None, deadline=None):
+        """Timeout for one attempt: the request timeout, cut to what is left of the deadline"""
+        timeout = timeout or self.timeout
+        return min(timeout, deadline.remaining()) if deadline is not None else timeout
+
+    def retry_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header"""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+            except ValueError:
+                pass
+        return delay
+
+    def close(self):
+        self._client.close()
+
+
+class AsyncLLMClient(LLMClient):
+    """LLMClient for asyncio code: waiting on Groq doesn't hold a thread"""
+
+    def _create_client(self, api_key, pool_size, timeout):
+        return httpx.AsyncClient(**_client_options(api_key, pool_size, timeout))
+
+    async def chat(self, messages, model=None, timeout=None, deadline=None, **params):
+        """Async LLMClient.chat: returns the reply text, or None on failure"""
+        payload = self.build_payload(messages, model, **params)
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            attempt_timeout = self.attempt_timeout(timeout, deadline)
+            if attempt_timeout <= 0:
+                return None
+            try:
+                response = await self._client.post(self.api_url, json=payload, timeout=attempt_timeout)
+            except httpx.HTTPError as e:
+                print(f" LLM request error: {e}")
+                metrics.increment('llm.errors')
+            else:
+                if response.status_code == 200:
+                    metrics.increment('llm.requests')
+                    return response.json()['choices'][0]['message']['content'].strip()
+
+                print(f" LLM error: {response.status_code}")
+                metrics.increment('llm.errors')
+                if response.status_code not in RETRY_STATUSES:
+                    return None
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                delay = self.retry_delay(attempt, retry_after)
+                if deadline is not None and delay >= deadline.remaining():
+                    return None
+                metrics.increment('llm.retries')
+                await asyncio.sleep(delay)
+
+        return None
+
+    async def stream_chat(self, messages, model=None, timeout=None, deadline=None, **params):
+        """Async LLMClient.stream_chat: yields reply text fragments"""
+        payload = self.build_payload(messages, model, stream=True, **params)
+        started = False
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            attempt_timeout = self.attempt_timeout(timeout, deadline)
+            if attempt_timeout <= 0:
+                return
+            try:
+                async with self._client.stream('POST', self.api_url, json=payload,
+                                               timeout=attempt_timeout) as response:
+                    if response.status_code == 200:
+                        metrics.increment('llm.streams')
+                        async for line in response.aiter_lines():
+                            fragment = _parse_stream_line(line)
+                            if fragment is None:
+                                return
+                            if deadline is not None and deadline.expired:
+                                return
+                            if fragment:
+                                started = True
+                                yield fragment
+                        return
+
+                    print(f" LLM stream error: {response.status_code}")
+                    metrics.increment('llm.errors')
+                    if response.status_code not in RETRY_STATUSES:
+                        return
+                    retry_after = response.headers.get('Retry-After')
+            except (httpx.HTTPError, ValueError) as e:
+                print(f" LLM stream error: {e}")
+                metrics.increment('llm.errors')
+                if started:
+                    return
+
+            if attempt < self.max_retries:
+                delay = self.retry_delay(attempt, retry_after)
+                if deadline is not None and delay >= deadline.remaining():
+                    return
+                metrics.increment('llm.retries')
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_client = None
+_client_lock = threading.Lock()
+# httpx.AsyncClient connections belong to the loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_llm_client():
+    """The process-wide LLMClient, created on first use"""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
+
+
+def get_async_llm_client():
+    """The AsyncLLMClient of the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncLLMClient(pool_size=LLM_ASYNC_POOL_SIZE)
+    return client
+
+
+async def close_async_llm_client():
+    """Close the running loop's AsyncLLMClient, if it has one"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def build_messages(system_content, message):
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": message}
+    ]
+
+
+def chat_completion(system_content, message, **params):
+    """Ask the LLM with a system prompt and one user message; returns text or None"""
+    return get_llm_client().chat(build_messages(system_content, message), **params)
+
+
+def stream_chat_completion(system_content, message, **params):
+    """Streaming chat_completion: yields reply text fragments"""
+    return get_llm_client().stream_chat(build_messages(system_content, message), **params)
+
+
+async def chat_completion_async(system_content, message, **params):
+    """Async chat_completion"""
+    return await get_async_llm_client().chat(build_messages(system_content, message), **params)
+
+
+def stream_chat_completion_async(system_content, message, **params):
+    """Async stream_chat_completion: an async generator of reply text fragments"""
+    return get_async_llm_client().stream_chat(build_messages(system_content, message), **params)
@@ -0,0 +1,120 @@
+"""
+Local OpenAI-compatible stub for /v1/chat/completions
+Usage: python llm_stub_server.py [--port 8001] [--delay 0.2] [--fail-every 0]
+Then run the app with LLM_API_URL=http://127.0.0.1:8001/v1/chat/completions
+
+The reply echoes the last user message, streamed word by word over SSE when
+the request sets "stream": true. --fail-every N answers every Nth request
+with a 503 to exercise the client's retries; --delay adds latency.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+state = {"requests": 0, "connections": 0}
+state_lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients can reuse connections
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    fail_every = 0
+
+    def setup(self):
+        super().setup()
+        with state_lock:
+            state["connections"] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, request_number, payload, reply):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": f"stub-{request_number}",
+                "object": "chat.completion.chunk",
+                "model": payload.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]
+            }
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(self.delay / max(len(words), 1))
+        self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with state_lock:
+                self.send_json(200, dict(state))
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        with state_lock:
+            state["requests"] += 1
+            request_number = state["requests"]
+
+        if self.fail_every and request_number % self.fail_every == 0:
+            self.send_json(503, {"error": {"message": "stub overloaded"}})
+            return
+
+        time.sleep(self.delay)
+        user_messages = [m["content"] for m in payload.get("messages", []) if m.get("role") == "user"]
+        reply = f"Stub answer to: {user_messages[-1] if user_messages else ''}"
+
+        if payload.get("stream"):
+            self.send_stream(request_number, payload, reply)
+            return
+
+        self.send_json(200, {
+            "id": f"stub-{request_number}",
+            "object": "chat.completion",
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }]
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-every", type=int, default=0)
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    StubHandler.fail_every = args.fail_every
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f" LLM stub listening on http://127.0.0.1:{args.port}/v1/chat/completions")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
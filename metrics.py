@@ -0,0 +1,39 @@
+"""
+Process-wide counters and gauges for the serving path
+Exposed as JSON on the /metrics route
+"""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+
+
+def increment(name, value=1):
+    """Add value to a counter"""
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name, value):
+    """Record the latest value of a gauge"""
+    with _lock:
+        _gauges[name] = value
+
+
+def get_counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot(prefix=None):
+    """Copy of all counters and gauges, optionally only those starting with prefix"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    if prefix:
+        counters = {name: value for name, value in counters.items() if name.startswith(prefix)}
+        gauges = {name: value for name, value in gauges.items() if name.startswith(prefix)}
+    return {"counters": counters, "gauges": gauges}
+
@@ -0,0 +1,439 @@
+"""
+Answer pipeline shared by the Flask app (app.py) and the ASGI app (asgi.py)
+Tiers in priority order: greeting, CSV Q&A, handbook RAG + Groq, plain Groq,
+with the exact-match and semantic answer caches in front of them.
+"""
+import os
+from datetime import datetime
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+
+import metrics
+import warmup
+from chat import get_response, find_csv_answers
+from handbook_rag import get_rag_context, get_embedding_model
+from response_cache import ResponseCache, normalize_message
+from semantic_cache import SemanticCache
+from single_flight import SingleFlight, FollowerTimeout
+from llm_client import chat_completion, stream_chat_completion
+from deadline import request_deadline
+
+load_dotenv('.env')
+
+CSV_CONFIDENCE_THRESHOLD = 0.30
+RAG_CONFIDENCE_THRESHOLD = 0.30
+
+FALLBACK_MESSAGE = "I'm sorry, I couldn't find a specific answer. Please contact Greensprings School support."
+GROQ_PARAMS = {"temperature": 0.3, "max_tokens": 150, "top_p": 0.8}
+
+# Tiers whose answers are not worth caching: the next attempt may do better
+UNCACHED_TIERS = {'fallback', 'partial'}
+
+# Run the tiers concurrently (async_pipeline.answer_message_speculative);
+# the context-free Groq fallback is started after SPECULATIVE_LLM_DELAY
+# seconds even while the handbook tier is still working
+SPECULATIVE_TIERS = os.getenv('SPECULATIVE_TIERS', '1') == '1'
+SPECULATIVE_LLM_DELAY = float(os.getenv('SPECULATIVE_LLM_DELAY', '1.5'))
+
+# Answers are cached per normalized message; LLM answers expire sooner
+# because they are not deterministic and the handbook can be re-indexed
+response_cache = ResponseCache(
+    db_path=os.getenv('RESPONSE_CACHE_DB', 'response_cache.db'),
+    max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '86400')),
+    tier_ttls={'rag': 6 * 3600, 'llm': 3600}
+)
+
+# Paraphrases of questions already answered by Groq reuse that answer
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.85')),
+    max_entries=int(os.getenv('SEMANTIC_CACHE_SIZE', '512')),
+    ttl=int(os.getenv('SEMANTIC_CACHE_TTL', '3600'))
+)
+
+# Identical questions asked while one is being answered wait for that answer
+# instead of running the tiers again (metrics under coalesce.*)
+COALESCE_REQUESTS = os.getenv('COALESCE_REQUESTS', '1') == '1'
+in_flight = SingleFlight('coalesce')
+
+# Add your support ticket URL here
+SUPPORT_TICKET_URL = "https://support.greenspringsschool.com/"  # Replace with actual URL
+
+# future refernce-Add emails here with keywords that will trigger them
+CONTACT_EMAILS = {
+    'hr': {
+        'email': 'request.lekki@greenspringsschool.com',
+        'subject': 'HR Request',
+        'keywords': ['hr', 'human resources', 'request', 'staff request', 'personnel']
+    }
+}
+
+def should_add_contact_link(message, response):
+    message_lower = message.lower()
+    response_lower = response.lower() if response else ""
+    
+    triggers = ['more information', 'contact', 'email', 'request', 'how do i', 'reach out']
+    
+    for trigger in triggers:
+        if trigger in message_lower or trigger in response_lower:
+            return True
+    return False
+
+def get_relevant_contact(message):
+    message_lower = message.lower()
+    
+    for contact_type, contact_info in CONTACT_EMAILS.items():
+        for keyword in contact_info['keywords']:
+            if keyword in message_lower:
+                return contact_type, contact_info
+    
+    return 'hr', CONTACT_EMAILS['hr']
+
+def add_contact_link(response, message):
+    if not should_add_contact_link(message, response):
+        return response
+    
+    contact_type, contact_info = get_relevant_contact(message)
+    email = contact_info['email']
+    subject = contact_info['subject']
+    
+    # Create Gmail web link only
+    gmail_link = f"https://mail.google.com/mail/?view=cm&fs=1&to={email}&su={quote(subject)}"
+    
+    # Simple contact section without border
+    contact_section = f'''
+
+<div style="margin-top: 10px;">
+    <a href="{gmail_link}" target="_blank" style="color: #1a73e8; text-decoration: none; font-weight: 500;">📧 Open in Gmail</a>
+</div>'''
+    
+    return response + contact_section
+
+def is_greeting(message):
+    greetings = ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 
+                 'good evening', 'greetings', 'howdy', 'sup', 'what\'s up']
+    msg_lower = message.lower().strip()
+    return any(greeting in msg_lower for greeting in greetings) and len(msg_lower.split()) <= 3
+
+def build_system_prompt(context=None, is_greeting=False):
+    current_date = datetime.now().strftime("%B %Y")
+    
+    if is_greeting:
+        system_content = f"""You are Greeny G, a friendly support assistant for Greensprings School.
+Respond to greetings warmly and briefly introduce yourself as Greeny G. Keep it to 1-2 sentences.
+Then add this exact HTML on a new line:
+<div style="margin-top: 10px; padding: 8px; background-color: #f0f7ff; border-radius: 4px;">
+    <span style="font-size: 14px;">Need more help? </span>
+    <a href="{SUPPORT_TICKET_URL}" target="_blank" style="color: #1a73e8; text-decoration: none; font-weight: 500;"> - To raise a Ticket for Assistance</a>
+</div>"""
+        
+    elif context:
+        system_content = f"""You are Greeny G, a support assistant for Greensprings School.
+Current date: {current_date}
+
+HANDBOOK CONTEXT:
+{context}
+
+Answer ONLY what was asked in under 50 words. Be direct and concise."""
+    else:
+        system_content = f"""You are Greeny G, a support assistant for Greensprings School.
+Current date: {current_date}
+
+Answer in 1-2 sentences maximum (under 50 words). Be direct and helpful."""
+    
+    return system_content
+
+def groq_stage(context=None, is_greeting=False):
+    """Deadline stage name of a Groq call: 'greeting', 'rag' or 'llm'"""
+    return 'greeting' if is_greeting else 'rag' if context else 'llm'
+
+def get_groq_response(message, context=None, is_greeting=False, deadline=None):
+    """
+    deadline: optional deadline.Deadline; the call, retries included, stays
+    within its stage budget and is skipped when too little time is left
+    """
+    stage = groq_stage(context, is_greeting)
+    if deadline is not None and not deadline.allows(stage):
+        return None
+    stage_deadline = deadline.for_stage(stage) if deadline is not None else None
+    
+    system_content = build_system_prompt(context, is_greeting)
+    try:
+        response = chat_completion(system_content, message, deadline=stage_deadline, **GROQ_PARAMS)
+    except:
+        response = None
+    if response is None and stage_deadline is not None and stage_deadline.expired:
+        deadline.cut_short(stage)
+    return response
+
+def stream_groq_response(message, context=None, is_greeting=False, deadline=None):
+    """
+    Streaming get_groq_response: yields text fragments as Groq produces them
+    deadline: optional deadline.Deadline; the stream just ends when it runs out
+    """
+    system_content = build_system_prompt(context, is_greeting)
+    try:
+        yield from stream_chat_completion(system_content, message, deadline=deadline, **GROQ_PARAMS)
+    except Exception as e:
+        print(f" Groq stream error: {e}")
+
+def is_weak_response(response):
+    if not response or len(response.strip()) < 10:
+        return True
+    
+    weak_phrases = ['i do not understand', 'i don\'t understand', 'i don\'t know',
+                    'not sure', 'i can\'t help', 'unclear']
+    
+    return any(phrase in response.lower() for phrase in weak_phrases)
+
+def embed_message(message, deadline=None):
+    """MiniLM embedding of a message, or None when the model is unavailable"""
+    if deadline is not None and not deadline.allows('embed'):
+        return None
+    # Don't hold a request for the model load; the warm-up thread is on it
+    if warmup.is_warming('embeddings'):
+        return None
+    try:
+        embeddings_model = get_embedding_model()
+        return embeddings_model.embed_query(message) if embeddings_model else None
+    except Exception as e:
+        print(f" Could not embed message: {e}")
+        return None
+
+def answer_message(user_message, deadline=None):
+    """
+    Run the tiers in priority order: greeting, CSV, handbook RAG, plain Groq
+    deadline: optional deadline.Deadline; stages without enough time left are skipped
+    Returns: (response, tier) where tier is 'greeting', 'csv', 'rag', 'llm',
+    'partial' (see fallback_answer) or 'fallback'
+    """
+    if is_greeting(user_message):
+        greeting_response = get_groq_response(user_message, is_greeting=True, deadline=deadline)
+        if greeting_response:
+            return greeting_response, 'greeting'
+    
+    csv_response = get_csv_tier_answer(user_message, deadline)
+    if csv_response:
+        return csv_response, 'csv'
+    
+    # Both remaining tiers call Groq, so try a paraphrase of an answered question first
+    query_vector = embed_message(user_message, deadline)
+    if query_vector is not None:
+        cached = semantic_cache.lookup(query_vector)
+        if cached:
+            return cached
+    
+    partial = None
+    handbook_context = get_handbook_context(user_message, deadline)
+    if handbook_context:
+        groq_response = get_groq_response(user_message, context=handbook_context, deadline=deadline)
+        if groq_response and not is_weak_response(groq_response):
+            if query_vector is not None:
+                semantic_cache.add(query_vector, groq_response, 'rag')
+            return groq_response, 'rag'
+        partial = groq_response
+    
+    groq_response = get_groq_response(user_message, deadline=deadline)
+    if groq_response and not is_weak_response(groq_response):
+        if query_vector is not None:
+            semantic_cache.add(query_vector, groq_response, 'llm')
+        return groq_response, 'llm'
+    
+    return fallback_answer(partial or groq_response, deadline)
+
+def fallback_answer(partial=None, deadline=None):
+    """
+    Answer when no tier produced a good one
+    If the deadline cut a stage short, a weak Groq reply (partial) is sent
+    instead of the canned message, since a better tier may never have run.
+    Returns: (response, tier) with tier 'partial' or 'fallback'
+    """
+    if deadline is not None and deadline.cut_stages:
+        metrics.increment('deadline.expired_requests')
+        if partial:
+            metrics.increment('deadline.partial_answers')
+            return partial, 'partial'
+    return FALLBACK_MESSAGE, 'fallback'
+
+def get_csv_tier_answer(user_message, deadline=None):
+    """CSV answer when it is confident and not weak, otherwise None"""
+    if deadline is not None and not deadline.allows('csv'):
+        return None
+    try:
+        result = get_response(user_message)
+        if isinstance(result, tuple):
+            csv_response, csv_confidence = result
+            if csv_response and csv_confidence >= CSV_CONFIDENCE_THRESHOLD and not is_weak_response(csv_response):
+                return csv_response
+    except:
+        pass
+    return None
+
+def get_csv_tier_answers(user_messages):
+    """Batch get_csv_tier_answer: the messages are scored together (chat.find_csv_answers)"""
+    try:
+        results = find_csv_answers(user_messages)
+    except Exception as e:
+        print(f" Batch CSV lookup failed: {e}")
+        return [None for _ in user_messages]
+    return [answer if answer and confidence >= CSV_CONFIDENCE_THRESHOLD and not is_weak_response(answer) else None
+            for answer, confidence in results]
+
+def embed_messages(messages):
+    """Batch embed_message: the messages not in the query cache are encoded in one call"""
+    if not messages or warmup.is_warming('embeddings'):
+        return [None for _ in messages]
+    try:
+        embeddings_model = get_embedding_model()
+        if embeddings_model:
+            return embeddings_model.embed_queries(list(messages))
+    except Exception as e:
+        print(f" Could not embed messages: {e}")
+    return [None for _ in messages]
+
+def get_handbook_context(user_message, deadline=None):
+    """Handbook passages for the RAG tier, or None when nothing useful was found"""
+    try:
+        handbook_context, rag_confidence, citations = get_rag_context(user_message, deadline)
+        if handbook_context and len(handbook_context.strip()) > 10:
+            return handbook_context
+    except:
+        pass
+    return None
+
+def stream_answer(user_message, deadline=None):
+    """
+    Streaming version of the get_smart_response pipeline, same tier order
+    Yields ('token', text) events, then a final ('done', tier) event.
+    Groq tiers stream token by token; cached and CSV answers arrive whole.
+    A streamed answer can't be taken back, so weak Groq replies are sent
+    as-is but kept out of the caches, and so are replies the deadline cut
+    off mid-stream (tier 'partial').
+    """
+    if deadline is None:
+        deadline = request_deadline()
+    
+    cached = response_cache.get(user_message)
+    if cached:
+        yield 'token', cached[0]
+        yield 'done', cached[1]
+        return
+    
+    if is_greeting(user_message):
+        tier = yield from _stream_groq_tier(user_message, 'greeting', None, deadline)
+        if tier:
+            yield 'done', tier
+            return
+    
+    csv_response = get_csv_tier_answer(user_message, deadline)
+    if csv_response:
+        response_cache.put(user_message, csv_response, 'csv')
+        yield 'token', csv_response
+        yield 'done', 'csv'
+        return
+    
+    query_vector = embed_message(user_message, deadline)
+    if query_vector is not None:
+        cached = semantic_cache.lookup(query_vector)
+        if cached:
+            yield 'token', cached[0]
+            yield 'done', cached[1]
+            return
+    
+    groq_tiers = [('llm', None)]
+    handbook_context = get_handbook_context(user_message, deadline)
+    if handbook_context:
+        groq_tiers.insert(0, ('rag', handbook_context))
+    
+    for tier, context in groq_tiers:
+        done_tier = yield from _stream_groq_tier(user_message, tier, context, deadline, query_vector)
+        if done_tier:
+            yield 'done', done_tier
+            return
+    
+    yield 'token', FALLBACK_MESSAGE
+    yield 'done', 'fallback'
+
+def _stream_groq_tier(user_message, tier, context, deadline, query_vector=None):
+    """
+    Stream one Groq tier of stream_answer and cache a good reply
+    Yields ('token', text) events.
+    Returns: the tier to report, 'partial' when the deadline cut the reply
+    off, or None when Groq sent nothing
+    """
+    if deadline is not None and not deadline.allows(tier):
+        return None
+    stage_deadline = deadline.for_stage(tier) if deadline is not None else None
+    
+    parts = []
+    for fragment in stream_groq_response(user_message, context=context,
+                                         is_greeting=tier == 'greeting', deadline=stage_deadline):
+        parts.append(fragment)
+        yield 'token', fragment
+    
+    if stage_deadline is not None and stage_deadline.expired:
+        deadline.cut_short(tier)
+        if parts:
+            metrics.increment('deadline.partial_answers')
+            return 'partial'
+    if not parts:
+        return None
+    
+    groq_response = ''.join(parts).strip()
+    if tier == 'greeting':
+        response_cache.put(user_message, groq_response, tier)
+    elif not is_weak_response(groq_response):
+        response_cache.put(user_message, groq_response, tier)
+        if query_vector is not None:
+            semantic_cache.add(query_vector, groq_response, tier)
+    return tier
+
+def coalesce_timeout(deadline):
+    """How long a coalesced request waits for the leader: until its own deadline"""
+    return deadline.remaining() if deadline is not None else None
+
+def coalesce_fallback(deadline):
+    """Answer for a coalesced request whose deadline ended before the leader's answer"""
+    deadline.cut_short('coalesce')
+    return fallback_answer(deadline=deadline)
+
+def answer_and_cache(user_message, deadline):
+    """
+    Answer a message that missed the response cache and cache the answer
+    Returns: (response, tier) without contact links
+    """
+    if SPECULATIVE_TIERS:
+        from async_pipeline import answer_message_speculative, run_in_background_loop
+        base_response, tier = run_in_background_loop(answer_message_speculative(user_message, deadline=deadline))
+    else:
+        base_response, tier = answer_message(user_message, deadline)
+    # Don't pin the canned fallback or a cut-short answer: the next attempt may do better
+    if tier not in UNCACHED_TIERS:
+        response_cache.put(user_message, base_response, tier)
+    return base_response, tier
+
+def get_smart_response(user_message, deadline=None):
+    """
+    Answer a chat message, with contact links added
+    deadline: deadline.Deadline for the whole request; a new one of
+    REQUEST_DEADLINE seconds when not given
+    """
+    if deadline is None:
+        deadline = request_deadline()
+    
+    cached = response_cache.get(user_message)
+    if cached:
+        base_response, tier = cached
+    elif COALESCE_REQUESTS:
+        # Cached before the leader lets go, so a later request finds it in the cache.
+        # A request that joined late waits only until its own deadline.
+        try:
+            base_response, tier = in_flight.do(normalize_message(user_message), answer_and_cache,
+                                               user_message, deadline, timeout=coalesce_timeout(deadline))
+        except FollowerTimeout:
+            base_response, tier = coalesce_fallback(deadline)
+    else:
+        base_response, tier = answer_and_cache(user_message, deadline)
+    
+    return add_contact_link(base_response, user_message)
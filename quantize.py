@@ -0,0 +1,124 @@
+"""
+Compact storage for embedding matrices
+A matrix is kept as float16, or as int8 with one float32 scale per row
+(symmetric scalar quantization: row ~= codes * scale). Searches scan the
+compact copy in blocks, so no full-size float32 temporary is allocated,
+and the shortlist they return is re-scored against the float32 matrix,
+which stays on disk memory-mapped and is only read for those few rows.
+"""
+import os
+
+import numpy as np
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+# How the handbook index and the CSV question embeddings are kept in memory
+VECTOR_PRECISION = os.getenv('VECTOR_PRECISION', 'float32')
+
+# Rows upcast to float32 at a time while scanning
+SCAN_BLOCK = 8192
+
+# Candidates kept per result for the full-precision re-score
+RESCORE_FACTOR = int(os.getenv('VECTOR_RESCORE_FACTOR', '8'))
+
+
+def quantize(matrix, precision):
+    """
+    Compact copy of a float32 matrix
+    Returns: (codes, scales) where scales is None except for int8
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if precision == 'float16':
+        return matrix.astype(np.float16), None
+    if precision == 'int8':
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"unknown precision: {precision!r}")
+
+
+def dequantize(codes, scales=None):
+    rows = np.asarray(codes, dtype=np.float32)
+    return rows * scales[:, None] if scales is not None else rows
+
+
+def approximate_dots(codes, scales, queries):
+    """
+    queries @ matrix.T from the compact copy, scanned SCAN_BLOCK rows at a time
+    queries: (n, dim) float32
+    Returns: (n, rows) float32
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    dots = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), SCAN_BLOCK):
+        block = np.asarray(codes[start:start + SCAN_BLOCK], dtype=np.float32)
+        dots[:, start:start + len(block)] = queries @ block.T
+    if scales is not None:
+        dots *= scales
+    return dots
+
+
+def shortlist(scores, k, factor=None):
+    """Indices of the k * factor (default RESCORE_FACTOR) lowest scores in each row (unordered)"""
+    count = min(k * (factor or RESCORE_FACTOR), scores.shape[1])
+    if count == scores.shape[1]:
+        return np.tile(np.arange(count), (len(scores), 1))
+    return np.argpartition(scores, count - 1, axis=1)[:, :count]
+
+
+def nearest(matrix, row_norms, compact, query, k, factor=None):
+    """
+    (row, squared L2 distance) of the k rows nearest query, nearest first
+    row_norms: ||row||^2 of every row of matrix
+    compact: (codes, scales) to shortlist from, or None to scan matrix itself
+    factor: shortlist size as a multiple of k (default RESCORE_FACTOR)
+    """
+    query = np.asarray(query, dtype=np.float32)
+    k = min(k, len(row_norms))
+    if k == 0:
+        return []
+
+    if compact is None:
+        rows = np.arange(len(row_norms))
+        distances = row_norms - 2.0 * (matrix @ query)
+    else:
+        approximate = row_norms - 2.0 * approximate_dots(*compact, query[None])[0]
+        rows = np.sort(shortlist(approximate[None], k, factor)[0])
+        distances = row_norms[rows] - 2.0 * (np.asarray(matrix[rows], dtype=np.float32) @ query)
+
+    top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(k)
+    top = top[np.argsort(distances[top], kind='stable')]
+    query_norm = float(query @ query)
+    # Rounding can leave an identical vector slightly below zero
+    return [(int(rows[i]), max(float(distances[i]) + query_norm, 0.0)) for i in top]
+
+
+def save_quantized(path_stem, matrix, precision):
+    """Write <path_stem>.<precision>.npy (and .scales.npy for int8) next to the float32 matrix"""
+    codes, scales = quantize(matrix, precision)
+    _save(f"{path_stem}.{precision}.npy", codes)
+    if scales is not None:
+        _save(f"{path_stem}.{precision}.scales.npy", scales)
+
+
+def load_quantized(path_stem, precision, rows):
+    """
+    (codes, scales) saved by save_quantized, or None when missing or not rows long
+    Loaded into memory: the compact copy is what the process keeps resident
+    """
+    try:
+        codes = np.load(f"{path_stem}.{precision}.npy")
+        scales = np.load(f"{path_stem}.{precision}.scales.npy") if precision == 'int8' else None
+    except (OSError, ValueError):
+        return None
+    if len(codes) != rows or (scales is not None and len(scales) != rows):
+        return None
+    return codes, scales
+
+
+def _save(path, array):
+    # Temporary name first, so another worker never loads a partial file
+    temp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(temp_path, array)
+    os.replace(temp_path, path)
@@ -0,0 +1,188 @@
+"""
+Two-level cache for answers from get_smart_response
+Level 1 is a bounded in-process LRU with a TTL; level 2 is a SQLite store
+that survives restarts and is shared by every worker process on the host.
+Entries are keyed on the normalized message and remember the answering tier.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Invalidations in another worker reach this worker's memory level within
+# this many seconds, so it is kept short even when the disk TTL is long
+MEMORY_TTL = 300
+
+
+def normalize_message(message):
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    message = re.sub(r'\s+', ' ', message.lower()).strip()
+    return message.rstrip('?!. ')
+
+
+class ResponseCache:
+    def __init__(self, db_path='response_cache.db', max_entries=1024, ttl=3600, tier_ttls=None):
+        """
+        max_entries: size of the in-memory LRU
+        ttl: default lifetime of an entry in seconds
+        tier_ttls: optional per-tier lifetimes, e.g. {'llm': 600}
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.tier_ttls = tier_ttls or {}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._puts = 0
+        self._init_db()
+
+    def _connection(self):
+        """One connection per thread, reused across requests"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def after_fork(self):
+        """In a forked worker: SQLite connections must not be shared with the parent"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _init_db(self):
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                tier TEXT NOT NULL,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_tier ON response_cache (tier)')
+        conn.commit()
+
+    def get(self, message):
+        """
+        Look up a cached answer
+        Returns: (response, tier) or None
+        """
+        key = normalize_message(message)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, tier, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    metrics.increment('cache.memory_hits')
+                    return response, tier
+                del self._memory[key]
+
+        try:
+            row = self._connection().execute(
+                'SELECT response, tier, expires_at FROM response_cache WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f" Response cache read error: {e}")
+            row = None
+
+        if row is None:
+            metrics.increment('cache.misses')
+            return None
+
+        response, tier, expires_at = row
+        self._remember(key, response, tier, min(expires_at, now + MEMORY_TTL))
+        metrics.increment('cache.disk_hits')
+        return response, tier
+
+    def put(self, message, response, tier):
+        """Store an answer in both levels"""
+        key = normalize_message(message)
+        now = time.time()
+        expires_at = now + self.tier_ttls.get(tier, self.ttl)
+
+        self._remember(key, response, tier, min(expires_at, now + MEMORY_TTL))
+
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, tier, response, expires_at) VALUES (?, ?, ?, ?)',
+                (key, tier, response, expires_at)
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f" Response cache write error: {e}")
+
+    def _remember(self, key, response, tier, expires_at):
+        with self._lock:
+            self._memory[key] = (response, tier, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                metrics.increment('cache.evictions')
+
+    def invalidate(self, message=None, tier=None):
+        """
+        Drop cached answers for one message, one tier, or everything
+        Returns: number of entries removed from the disk store
+        """
+        key = normalize_message(message) if message else None
+
+        with self._lock:
+            for cached_key in list(self._memory):
+                if (key is None or cached_key == key) and (tier is None or self._memory[cached_key][1] == tier):
+                    del self._memory[cached_key]
+
+        conditions, params = [], []
+        if key is not None:
+            conditions.append('key = ?')
+            params.append(key)
+        if tier is not None:
+            conditions.append('tier = ?')
+            params.append(tier)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        try:
+            conn = self._connection()
+            removed = conn.execute(f'DELETE FROM response_cache{where}', params).rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f" Response cache invalidate error: {e}")
+            removed = 0
+        metrics.increment('cache.invalidations')
+        return removed
+
+    def stats(self):
+        """Hit/miss counters plus current sizes of both levels"""
+        with self._lock:
+            memory_entries = len(self._memory)
+        try:
+            disk_entries = self._connection().execute(
+                'SELECT COUNT(*) FROM response_cache WHERE expires_at > ?', (time.time(),)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            disk_entries = None
+
+        hits = metrics.get_counter('cache.memory_hits') + metrics.get_counter('cache.disk_hits')
+        lookups = hits + metrics.get_counter('cache.misses')
+        return {
+            "memory_hits": metrics.get_counter('cache.memory_hits'),
+            "disk_hits": metrics.get_counter('cache.disk_hits'),
+            "misses": metrics.get_counter('cache.misses'),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "evictions": metrics.get_counter('cache.evictions'),
+            "memory_entries": memory_entries,
+            "disk_entries": disk_entries
+        }
@@ -0,0 +1,99 @@
+"""
+Semantic cache for LLM-generated answers
+Stores the MiniLM embedding of each question answered by the Groq tiers and
+returns the stored answer when a new question is close enough in cosine
+similarity, so paraphrased repeats skip the Groq round-trip.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+
+class SemanticCache:
+    def __init__(self, threshold=0.85, max_entries=512, ttl=3600):
+        """
+        threshold: minimum cosine similarity for a hit
+        max_entries: least recently used entries are evicted beyond this
+        ttl: lifetime of an entry in seconds
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectors = None
+        # slot in self._vectors -> (response, tier, expires_at), in LRU order
+        self._entries = OrderedDict()
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_vector):
+        """
+        Find the closest cached question
+        Returns: (response, tier) or None
+        """
+        query_vector = self._normalize(query_vector)
+        now = time.time()
+
+        with self._lock:
+            if not self._entries:
+                metrics.increment('semantic_cache.misses')
+                return None
+
+            slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+            similarities = self._vectors[slots] @ query_vector
+
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.threshold:
+                    break
+                slot = int(slots[position])
+                response, tier, expires_at = self._entries[slot]
+                if expires_at <= now:
+                    self._release(slot)
+                    metrics.increment('semantic_cache.expired')
+                    continue
+
+                self._entries.move_to_end(slot)
+                metrics.increment('semantic_cache.hits')
+                print(f" Semantic cache hit (similarity: {similarities[position]:.2f}, tier: {tier})")
+                return response, tier
+
+        metrics.increment('semantic_cache.misses')
+        return None
+
+    def add(self, query_vector, response, tier):
+        """Remember an answer for the question with this embedding"""
+        query_vector = self._normalize(query_vector)
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, query_vector.shape[0]), dtype=np.float32)
+
+            if not self._free_slots:
+                oldest_slot = next(iter(self._entries))
+                self._release(oldest_slot)
+                metrics.increment('semantic_cache.evictions')
+
+            slot = self._free_slots.pop()
+            self._vectors[slot] = query_vector
+            self._entries[slot] = (response, tier, time.time() + self.ttl)
+
+    def _release(self, slot):
+        del self._entries[slot]
+        self._free_slots.append(slot)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def __len__(self):
+        return len(self._entries)
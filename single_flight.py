@@ -0,0 +1,129 @@
+"""
+Request coalescing (single flight) for identical concurrent questions
+When many people ask the same thing at once, the first request (the leader)
+computes the answer and the others with the same key (followers) wait for
+it and get the same result, so the tiers and Groq run once. An exception
+raised by the computation is raised in every waiting request, and nothing
+is remembered once it finishes: the next request computes afresh, so a
+failure is not served to later requests. Lasting reuse is the response
+cache's job.
+
+Followers can be given a timeout (their own deadline, which may end
+before the leader's) and stop waiting with FollowerTimeout when it passes.
+
+Metrics, under the given prefix: .leaders, .followers and
+.follower_timeouts counters, the .ratio gauge (share of requests that were
+coalesced) and the .in_flight gauge (keys being computed).
+"""
+import asyncio
+import threading
+
+import metrics
+
+
+class FollowerTimeout(Exception):
+    """A follower stopped waiting before the leader's result arrived"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name='coalesce'):
+        """name: metrics prefix"""
+        self.name = name
+        self._calls = {}
+        # key -> task computing it, for callers on an event loop
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._followers = 0
+
+    def _count(self, leader):
+        with self._lock:
+            if leader:
+                self._leaders += 1
+            else:
+                self._followers += 1
+            ratio = self._followers / (self._leaders + self._followers)
+        metrics.increment(f'{self.name}.leaders' if leader else f'{self.name}.followers')
+        metrics.set_gauge(f'{self.name}.ratio', round(ratio, 4))
+
+    def _in_flight_changed(self):
+        """Call holding self._lock"""
+        metrics.set_gauge(f'{self.name}.in_flight', len(self._calls) + len(self._tasks))
+
+    def do(self, key, function, *args, timeout=None):
+        """
+        function(*args), unless a call for key is already running in another
+        thread; then wait for that one and return its result (or raise its exception)
+        timeout: seconds a follower waits before raising FollowerTimeout, None
+        to wait as long as the leader runs; the leader is not affected
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._in_flight_changed()
+        self._count(leader)
+
+        if not leader:
+            if not call.done.wait(timeout):
+                self._timed_out(key, timeout)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self._in_flight_changed()
+            call.done.set()
+
+    async def do_async(self, key, coroutine_function, *args, timeout=None):
+        """
+        do() for coroutines: callers on the same event loop await one task
+        The task is shielded, so a caller that is cancelled (client gone) or
+        times out doesn't cancel the answer the others are waiting for.
+        """
+        with self._lock:
+            task = self._tasks.get(key)
+            leader = task is None
+            if leader:
+                task = self._tasks[key] = asyncio.ensure_future(coroutine_function(*args))
+                task.add_done_callback(lambda done: self._finished(key, done))
+                self._in_flight_changed()
+        self._count(leader)
+        if leader:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            # A TimeoutError raised by the task itself is its result, passed on like any error
+            if task.done():
+                raise
+        self._timed_out(key, timeout)
+
+    def _timed_out(self, key, timeout):
+        metrics.increment(f'{self.name}.follower_timeouts')
+        raise FollowerTimeout(f"no result for {key!r} within {timeout:.2f}s")
+
+    def _finished(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+                self._in_flight_changed()
+        # Retrieved here so an error nobody awaited any more isn't logged as unhandled
+        if not task.cancelled():
+            task.exception()
@@ -104,7 +104,7 @@ class Chatbox {
         }
     }
 
-    // Updated onSendButton with 3-second typing indicator
+    // Streams the reply from /chat/stream so tokens show up as they arrive
     async onSendButton(chatbox) {
         var textField = chatbox.querySelector('input');
         let text1 = textField.value
@@ -122,12 +122,13 @@ class Chatbox {
         textField.value = '';
         this.updateChatText(chatbox);
 
-        // Show typing indicator
-        const typingIndicator = this.showTypingIndicator(chatbox);
+        // Show typing indicator until the first token arrives
+        this.showTypingIndicator(chatbox);
+
+        let msg2 = null;
 
         try {
-            // Start API call but don't await it yet
-            const apiPromise = fetch('http://127.0.0.1:5000/predict', {
+            const response = await fetch('http://127.0.0.1:5000/chat/stream', {
                 method: 'POST',
                 body: JSON.stringify({ message: text1 }),
                 mode: 'cors',
@@ -136,34 +137,39 @@ class Chatbox {
                 },
             });
 
-            // Ensure typing indicator shows for at least 3 seconds
-            const minDelayPromise = new Promise(resolve => setTimeout(resolve, 3000));
+            if (!response.ok || !response.body) {
+                throw new Error(`Stream failed with status ${response.status}`);
+            }
 
-            // Wait for both API response and minimum delay
-            const [response] = await Promise.all([apiPromise, minDelayPromise]);
-            const result = await response.json();
-            
-            // Hide typing indicator
-            this.hideTypingIndicator();
-            
-            // Add bot response
-            let msg2 = { name: "Support Desk", message: result.answer };
-            this.messages.push(msg2);
-            this.updateChatText(chatbox);
+            await this.readEventStream(response, (event, data) => {
+                if (event === 'token' || event === 'contact' || event === 'error') {
+                    if (msg2 === null) {
+                        // First token: swap the typing indicator for the reply
+                        this.hideTypingIndicator();
+                        msg2 = { name: "Support Desk", message: "" };
+                        this.messages.push(msg2);
+                    }
+                    msg2.message += event === 'contact' ? data.html : data.text;
+                    this.updateChatText(chatbox);
+                }
+            });
+
+            if (msg2 === null) {
+                throw new Error('Stream ended without a reply');
+            }
 
         } catch (error) {
             console.error('Error:', error);
             
-            // Ensure minimum delay even on error
-            await new Promise(resolve => setTimeout(resolve, 3000));
-            
             // Hide typing indicator
             this.hideTypingIndicator();
             
-            // Add error message
-            let errorMsg = { name: "Support Desk", message: "Sorry, I encountered an error. Please try again." };
-            this.messages.push(errorMsg);
-            this.updateChatText(chatbox);
+            // Add error message unless part of the reply already arrived
+            if (msg2 === null) {
+                let errorMsg = { name: "Support Desk", message: "Sorry, I encountered an error. Please try again." };
+                this.messages.push(errorMsg);
+                this.updateChatText(chatbox);
+            }
             
         } finally {
             // Re-enable input
@@ -171,6 +177,42 @@ class Chatbox {
         }
     }
 
+    // Parse a text/event-stream response, calling onEvent(event, data) per event
+    async readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+
+                if (data) {
+                    onEvent(event, JSON.parse(data));
+                }
+            }
+        }
+    }
+
     updateChatText(chatbox) {
         var html = '';
         // Remove .reverse() to show messages in chronological order
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import chat
+
+
+class WrongShortlist:
+    """A TF-IDF matcher stand-in whose shortlist never holds the right question"""
+    def top_k(self, query, k):
+        return [len(chat.csv_qa_pairs) - 1], [1.0]
+
+    def top_k_batch(self, queries, k):
+        return [self.top_k(query, k) for query in queries]
+
+
+@pytest.fixture
+def csv_tier(monkeypatch):
+    # CSV_FILE_PATH is relative to the repo; the semantic step is left out
+    monkeypatch.chdir(REPO_DIR)
+    monkeypatch.setattr(chat, 'csv_question_embeddings', None)
+    monkeypatch.setattr(chat, 'CSV_MATCHER', 'index')
+    chat.load_csv_tier()
+    return chat.csv_qa_pairs
+
+
+def test_batch_matches_single_lookups(csv_tier, monkeypatch):
+    """With the default matcher a batch /predict answers each message as a single request would"""
+    messages = [pair['question'] for pair in csv_tier[:20]] + [
+        "how do i reset my email password",
+        "the projector is not working",
+        "laptop won't charge",
+        "What is the meaning of life?",
+        "",
+    ]
+    expected = [chat.find_csv_answer(message) for message in messages]
+    assert chat.find_csv_answers(messages) == expected
+
+    # A loaded TF-IDF matcher is only used with CSV_MATCHER=tfidf
+    monkeypatch.setattr(chat, 'csv_matcher', WrongShortlist())
+    assert chat.find_csv_answers(messages) == expected
@@ -0,0 +1,98 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import handbook_index
+from handbook_index import indexed_chunk_ids, sync_index
+
+
+class FakeVectorStore:
+    """The part of the Chroma collection sync_index uses"""
+    def __init__(self):
+        self.documents = {}
+
+    def get(self, include=None):
+        return {"ids": list(self.documents)}
+
+    def add_documents(self, documents, ids):
+        self.documents.update(zip(ids, documents))
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.documents.pop(chunk_id, None)
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(handbook_index, 'TEXT_CACHE_DIR', str(tmp_path / "text_cache"))
+    pdf_dir = tmp_path / "handbooks"
+    pdf_dir.mkdir()
+    shutil.copy(os.path.join(REPO_DIR, "HandbookQA.pdf"), pdf_dir / "good.pdf")
+    return pdf_dir
+
+
+_extract_page_range = handbook_index._extract_page_range
+
+
+def failing_page_range(pdf_path, start, stop):
+    """Pool task that fails on one page range of policy.pdf"""
+    if os.path.basename(pdf_path) == "policy.pdf" and start == handbook_index.PAGES_PER_TASK:
+        raise ValueError("damaged page")
+    return _extract_page_range(pdf_path, start, stop)
+
+
+def stats_by_source(stats):
+    return {stat["source"]: stat for stat in stats}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_corrupt_pdf_is_skipped(corpus, tmp_path, workers):
+    (corpus / "bad.pdf").write_bytes(b"%PDF-1.4\nnot really a pdf")
+    vector_db = FakeVectorStore()
+
+    manifest, stats = sync_index(vector_db, str(tmp_path / "index"), [str(corpus / "bad.pdf"), str(corpus / "good.pdf")],
+                                 "test-model", workers=workers)
+
+    assert list(manifest["sources"]) == ["good.pdf"]
+    assert indexed_chunk_ids(manifest) and set(indexed_chunk_ids(manifest)) == set(vector_db.documents)
+    stats = stats_by_source(stats)
+    assert stats["good.pdf"]["added"] > 0 and "error" not in stats["good.pdf"]
+    assert stats["bad.pdf"]["error"] and stats["bad.pdf"]["added"] == 0
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pdf_that_turns_corrupt_keeps_its_vectors(corpus, tmp_path, workers):
+    shutil.copy(corpus / "good.pdf", corpus / "policy.pdf")
+    paths = [str(corpus / "good.pdf"), str(corpus / "policy.pdf")]
+    persist_dir = str(tmp_path / "index")
+    vector_db = FakeVectorStore()
+    before, _ = sync_index(vector_db, persist_dir, paths, "test-model", workers=workers)
+    policy_entry = before["sources"]["policy.pdf"]
+
+    # Truncated on disk: a new file hash, so it is read again and fails
+    data = (corpus / "policy.pdf").read_bytes()
+    (corpus / "policy.pdf").write_bytes(data[:len(data) // 3])
+    manifest, stats = sync_index(vector_db, persist_dir, paths, "test-model", workers=workers)
+
+    assert manifest["sources"]["policy.pdf"] == policy_entry
+    assert set(indexed_chunk_ids(manifest)) == set(vector_db.documents)
+    assert handbook_index.load_manifest(persist_dir) == manifest
+    assert "error" in stats_by_source(stats)["policy.pdf"]
+
+
+def test_failed_page_range_skips_only_that_pdf(corpus, tmp_path, monkeypatch):
+    shutil.copy(corpus / "good.pdf", corpus / "policy.pdf")
+    monkeypatch.setattr(handbook_index, '_extract_page_range', failing_page_range)
+    vector_db = FakeVectorStore()
+
+    manifest, stats = sync_index(vector_db, str(tmp_path / "index"), [str(corpus / "good.pdf"), str(corpus / "policy.pdf")],
+                                 "test-model", workers=2)
+
+    assert list(manifest["sources"]) == ["good.pdf"]
+    assert set(indexed_chunk_ids(manifest)) == set(vector_db.documents)
+    assert "damaged page" in stats_by_source(stats)["policy.pdf"]["error"]
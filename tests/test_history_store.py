@@ -0,0 +1,122 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from history_store import HistoryStore, encode_cursor
+
+# Importing app opens these; keep them out of the working tree
+_TEMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('CHAT_HISTORY_DB', os.path.join(_TEMP_DIR, 'chat_history.db'))
+os.environ.setdefault('RESPONSE_CACHE_DB', os.path.join(_TEMP_DIR, 'response_cache.db'))
+
+# 23 rows for alice in three timestamps, so pages end in the middle of a tie
+TIMESTAMPS = ['2026-01-01 09:00:00'] * 10 + ['2026-01-01 09:00:01'] * 8 + ['2026-01-01 09:00:02'] * 5
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(db_path=str(tmp_path / "history.db"))
+    with sqlite3.connect(store.db_path) as conn:
+        conn.executemany('INSERT INTO conversations (user_id, message, response, timestamp) VALUES (?, ?, ?, ?)',
+                         [('alice', f"message {i}", f"response {i}", timestamp)
+                          for i, timestamp in enumerate(TIMESTAMPS)])
+        conn.execute("INSERT INTO conversations (user_id, message, response, timestamp) "
+                     "VALUES ('bob', 'other user', '-', '2026-01-01 09:00:01')")
+    return store
+
+
+def newest_first():
+    return [f"message {i}" for i in sorted(range(len(TIMESTAMPS)), key=lambda i: (TIMESTAMPS[i], i), reverse=True)]
+
+
+def all_pages(store, limit):
+    messages, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = store.fetch('alice', limit, cursor)
+        messages += [row["message"] for row in rows]
+        pages += 1
+        if cursor is None:
+            return messages, pages
+
+
+@pytest.mark.parametrize("limit", [1, 3, 7, 10, 22, 23, 50])
+def test_pages_never_skip_or_repeat_tied_rows(store, limit):
+    messages, pages = all_pages(store, limit)
+    assert messages == newest_first()
+    assert pages == max(1, -(-len(TIMESTAMPS) // limit))
+
+
+def test_last_page_has_no_cursor(store):
+    rows, cursor = store.fetch('alice', len(TIMESTAMPS))
+    assert len(rows) == len(TIMESTAMPS) and cursor is None
+
+    rows, cursor = store.fetch('alice', 20)
+    assert cursor is not None
+    rows, cursor = store.fetch('alice', 20, cursor)
+    assert len(rows) == 3 and cursor is None
+
+    assert store.fetch('nobody', 5) == ([], None)
+
+
+def test_iter_pages_matches_fetch(store):
+    pages = list(store.iter_pages('alice', page_size=4))
+    assert [row["message"] for rows, _ in pages for row in rows] == newest_first()
+    assert pages[-1][1] is None
+
+    limited = list(store.iter_pages('alice', limit=6, page_size=4))
+    assert [row["message"] for rows, _ in limited for row in rows] == newest_first()[:6]
+    assert limited[-1][1] is not None
+
+
+@pytest.fixture
+def client(store, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'history', store)
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("query", [
+    "cursor=not-a-cursor", f"cursor={encode_cursor('2026-01-01', 'x')}", "cursor=%25%25",
+    "limit=0", "limit=-5", "limit=abc",
+    "format=ndjson&limit=0", "format=ndjson&cursor=not-a-cursor",
+])
+def test_bad_limit_or_cursor_is_400(client, query):
+    response = client.get(f"/chat/alice?{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid limit or cursor"}
+
+
+def test_json_pages_follow_the_cursor(client):
+    messages, cursor = [], None
+    while True:
+        body = client.get("/chat/alice", query_string={"limit": 4, **({"cursor": cursor} if cursor else {})}).get_json()
+        messages += [row["message"] for row in body["history"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert messages == newest_first()
+
+
+def test_ndjson_returns_the_same_rows_as_json(client):
+    json_rows = client.get("/chat/alice", query_string={"limit": 500}).get_json()["history"]
+
+    response = client.get("/chat/alice?format=ndjson")
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == json_rows
+
+    # With a limit, the rows so far and then the cursor to carry on from
+    lines = [json.loads(line) for line in client.get(
+        "/chat/alice", query_string={"limit": 10}, headers={"Accept": "application/x-ndjson"}
+    ).get_data(as_text=True).splitlines()]
+    assert lines[:-1] == json_rows[:10]
+    cursor = lines[-1]["next_cursor"]
+    rest = [json.loads(line) for line in client.get(
+        "/chat/alice", query_string={"format": "ndjson", "cursor": cursor}).get_data(as_text=True).splitlines()]
+    assert rest == json_rows[10:]
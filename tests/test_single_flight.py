@@ -0,0 +1,145 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from single_flight import FollowerTimeout, SingleFlight
+
+
+class Leader:
+    """A computation that blocks until released, counting its runs"""
+    def __init__(self, result="answer", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(10)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run_threads(flight, key, function, count, timeout=None):
+    """count concurrent flight.do calls, the first one started first; Returns: their results or exceptions"""
+    outcomes = [None] * count
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do(key, function, timeout=timeout if i else None)
+        except BaseException as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    threads[0].start()
+    function.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    return threads, outcomes
+
+
+def wait_for_followers(flight, count):
+    deadline = time.monotonic() + 5
+    while flight._followers < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert flight._followers == count
+
+
+def test_concurrent_calls_run_once():
+    flight, leader = SingleFlight('test'), Leader()
+    threads, outcomes = run_threads(flight, "q", leader, 10)
+    wait_for_followers(flight, 9)
+    leader.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert leader.calls == 1
+    assert outcomes == ["answer"] * 10
+
+
+def test_leader_error_reaches_every_follower():
+    flight, leader = SingleFlight('test'), Leader(error=ValueError("Groq down"))
+    threads, outcomes = run_threads(flight, "q", leader, 5)
+    wait_for_followers(flight, 4)
+    leader.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert leader.calls == 1
+    assert all(isinstance(outcome, ValueError) and str(outcome) == "Groq down" for outcome in outcomes)
+
+
+def test_follower_timeout_leaves_the_leader_running():
+    flight, leader = SingleFlight('test'), Leader()
+    threads, outcomes = run_threads(flight, "q", leader, 2, timeout=0.1)
+    threads[1].join(5)
+    assert isinstance(outcomes[1], FollowerTimeout)
+    assert threads[0].is_alive()
+
+    leader.release.set()
+    threads[0].join(5)
+    assert outcomes[0] == "answer"
+
+
+def test_key_is_released_after_the_call():
+    flight, leader = SingleFlight('test'), Leader(error=RuntimeError("first try fails"))
+    leader.release.set()
+    with pytest.raises(RuntimeError):
+        flight.do("q", leader)
+
+    leader.error = None
+    assert flight.do("q", leader) == "answer"
+    assert leader.calls == 2
+    assert not flight._calls
+
+
+def test_async_calls_run_once_and_share_errors():
+    async def scenario():
+        flight, calls = SingleFlight('test'), []
+
+        async def compute(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            if value == "fail":
+                raise ValueError(value)
+            return value.upper()
+
+        results = await asyncio.gather(*[flight.do_async("a", compute, "a") for _ in range(10)],
+                                       *[flight.do_async("f", compute, "fail") for _ in range(3)],
+                                       return_exceptions=True)
+        assert results[:10] == ["A"] * 10
+        assert all(isinstance(result, ValueError) for result in results[10:])
+        assert calls == ["a", "fail"]
+
+        # Released: the next call computes again
+        assert await flight.do_async("a", compute, "a") == "A"
+        assert calls == ["a", "fail", "a"] and not flight._tasks
+
+    asyncio.run(scenario())
+
+
+def test_async_follower_timeout_leaves_the_leader_running():
+    async def scenario():
+        flight = SingleFlight('test')
+
+        async def compute():
+            await asyncio.sleep(0.3)
+            return "answer"
+
+        leader = asyncio.ensure_future(flight.do_async("q", compute))
+        await asyncio.sleep(0)
+        with pytest.raises(FollowerTimeout):
+            await flight.do_async("q", compute, timeout=0.05)
+        assert not leader.done()
+        assert await leader == "answer"
+
+    asyncio.run(scenario())
@@ -0,0 +1,217 @@
+"""
+In-process vector indexes for handbook retrieval
+Chroma stays the store of record (build_index.py and sync_index write to
+it), but queries are served from its vectors exported next to it:
+- NumpyVectorIndex: exact search over a memory-mapped float32 matrix, one
+  matrix-vector product per query; right for the handbook's few hundred
+  chunks and fine up to tens of thousands
+- HnswVectorIndex: approximate search with hnswlib (installed with
+  chromadb), for corpora where a full scan gets slow
+Both expose similarity_search_with_score like langchain's Chroma, with the
+same distance (squared L2, lower is better), so get_rag_context can use
+either, or the Chroma store itself, unchanged.
+
+VECTOR_BACKEND picks one: 'numpy', 'hnsw', 'chroma', or 'auto' (numpy up
+to HNSW_MIN_CHUNKS chunks, hnsw above). With VECTOR_PRECISION float16 or
+int8 the NumPy index scans a compact copy and re-scores its shortlist in
+float32 (see quantize.py); hnswlib always keeps float32 vectors.
+"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from quantize import VECTOR_PRECISION, load_quantized, nearest, save_quantized
+
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'auto')
+HNSW_MIN_CHUNKS = int(os.getenv('HNSW_MIN_CHUNKS', '20000'))
+# Same graph settings as a default Chroma collection
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 100
+HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', '50'))
+
+VECTORS_DIR = "vectors"
+
+# Stands in for a langchain Document: get_rag_context only reads these two fields
+Passage = namedtuple('Passage', ['page_content', 'metadata'])
+
+
+def chunk_ids_hash(chunk_ids):
+    """Fingerprint of the indexed chunks, to tell whether an export is stale"""
+    return hashlib.sha256("\n".join(sorted(chunk_ids)).encode('utf-8')).hexdigest()[:16]
+
+
+def export_vectors(vector_db, persist_dir, chunk_ids):
+    """
+    Copy the collection's vectors, texts and metadata next to the Chroma store
+    chunk_ids: the ids the manifest says are indexed
+    Returns: the export directory
+    """
+    directory = os.path.join(persist_dir, VECTORS_DIR)
+    os.makedirs(directory, exist_ok=True)
+
+    collection = vector_db.get(ids=list(chunk_ids), include=["embeddings", "documents", "metadatas"])
+    matrix = np.asarray(collection["embeddings"], dtype=np.float32)
+
+    # Temporary names first, so a reader never maps a half-written file
+    temp_path = os.path.join(directory, f"embeddings.{os.getpid()}.tmp.npy")
+    np.save(temp_path, matrix)
+    os.replace(temp_path, os.path.join(directory, "embeddings.npy"))
+
+    info = {
+        "chunk_ids_hash": chunk_ids_hash(chunk_ids),
+        "ids": collection["ids"],
+        "documents": collection["documents"],
+        "metadatas": collection["metadatas"],
+    }
+    temp_path = os.path.join(directory, f"passages.{os.getpid()}.tmp.json")
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(info, file)
+    os.replace(temp_path, os.path.join(directory, "passages.json"))
+
+    # The HNSW graph and compact copies of the old vectors are rebuilt on first use
+    for name in os.listdir(directory):
+        if name == "hnsw.bin" or (name.startswith("embeddings.") and name != "embeddings.npy"):
+            os.remove(os.path.join(directory, name))
+
+    print(f" Exported {len(matrix)} vectors to {directory}")
+    return directory
+
+
+def load_passages(persist_dir, chunk_ids):
+    """(matrix, passages info) of an export matching chunk_ids, or None when missing or stale"""
+    directory = os.path.join(persist_dir, VECTORS_DIR)
+    try:
+        with open(os.path.join(directory, "passages.json"), encoding='utf-8') as file:
+            info = json.load(file)
+        matrix = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if info.get("chunk_ids_hash") != chunk_ids_hash(chunk_ids) or len(matrix) != len(info["ids"]):
+        return None
+    return matrix, info
+
+
+def load_compact(persist_dir, matrix, precision):
+    """(codes, scales) of the exported vectors at precision, written first if missing"""
+    path_stem = os.path.join(persist_dir, VECTORS_DIR, "embeddings")
+    compact = load_quantized(path_stem, precision, len(matrix))
+    if compact is None:
+        save_quantized(path_stem, matrix, precision)
+        compact = load_quantized(path_stem, precision, len(matrix))
+    return compact
+
+
+class NumpyVectorIndex:
+    def __init__(self, matrix, info, embedding_function, compact=None):
+        """
+        matrix: (chunks, dim) float32 vectors, typically memory-mapped read-only
+        info: ids, documents and metadatas in matrix row order
+        compact: (codes, scales) from quantize.py to scan instead of matrix;
+        only the shortlisted rows of matrix are read
+        """
+        self.matrix = matrix
+        self.compact = compact
+        self.ids = info["ids"]
+        self.passages = [Passage(document, metadata or {})
+                         for document, metadata in zip(info["documents"], info["metadatas"])]
+        self.embedding_function = embedding_function
+        # ||x||^2 per row, so a query costs one matrix-vector product
+        self.row_norms = np.einsum('ij,ij->i', matrix, matrix)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_vector, k=3):
+        """(row, squared L2 distance) of the k nearest rows, nearest first"""
+        return nearest(self.matrix, self.row_norms, self.compact, query_vector, k)
+
+    def resident_bytes(self):
+        """Vector bytes every query touches: the compact copy, or the whole float32 matrix"""
+        if self.compact is None:
+            return self.matrix.nbytes + self.row_norms.nbytes
+        codes, scales = self.compact
+        return codes.nbytes + (scales.nbytes if scales is not None else 0) + self.row_norms.nbytes
+
+    def similarity_search_with_score(self, query, k=3):
+        """Same contract as langchain's Chroma: [(passage, distance)], nearest first"""
+        query_vector = self.embedding_function.embed_query(query)
+        return [(self.passages[row], distance) for row, distance in self.search(query_vector, k)]
+
+
+class HnswVectorIndex(NumpyVectorIndex):
+    def __init__(self, matrix, info, embedding_function, index_path=None):
+        """
+        index_path: where the graph is saved; it is built from matrix when
+        the file is missing
+        """
+        super().__init__(matrix, info, embedding_function)
+        import hnswlib
+
+        self.graph = hnswlib.Index(space='l2', dim=matrix.shape[1])
+        if index_path and os.path.exists(index_path):
+            self.graph.load_index(index_path, max_elements=len(matrix))
+        else:
+            print(f" Building HNSW graph over {len(matrix)} vectors...")
+            self.graph.init_index(max_elements=len(matrix), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            self.graph.add_items(np.asarray(matrix), np.arange(len(matrix)))
+            if index_path:
+                temp_path = f"{index_path}.{os.getpid()}.tmp"
+                self.graph.save_index(temp_path)
+                os.replace(temp_path, index_path)
+        self.graph.set_ef(HNSW_EF_SEARCH)
+
+    def search(self, query_vector, k=3):
+        k = min(k, len(self))
+        if k == 0:
+            return []
+        rows, distances = self.graph.knn_query(np.asarray(query_vector, dtype=np.float32), k=k)
+        return [(int(row), float(distance)) for row, distance in zip(rows[0], distances[0])]
+
+
+def choose_backend(chunk_count, backend=None):
+    backend = backend or VECTOR_BACKEND
+    if backend == 'auto':
+        return 'hnsw' if chunk_count > HNSW_MIN_CHUNKS else 'numpy'
+    return backend
+
+
+def open_vector_index(vector_db, persist_dir, chunk_ids, embedding_function, backend=None,
+                      precision=None):
+    """
+    Index to serve queries from, exporting the vectors first if needed
+    Returns: a NumpyVectorIndex or HnswVectorIndex, or vector_db itself for
+    the 'chroma' backend (and whenever the export can't be used)
+    """
+    backend = choose_backend(len(chunk_ids), backend)
+    precision = precision or VECTOR_PRECISION
+    if backend == 'chroma':
+        return vector_db
+
+    try:
+        loaded = load_passages(persist_dir, chunk_ids)
+        if loaded is None:
+            export_vectors(vector_db, persist_dir, chunk_ids)
+            loaded = load_passages(persist_dir, chunk_ids)
+        matrix, info = loaded
+
+        if backend == 'hnsw':
+            try:
+                index_path = os.path.join(persist_dir, VECTORS_DIR, "hnsw.bin")
+                index = HnswVectorIndex(matrix, info, embedding_function, index_path)
+            except ImportError:
+                print(" hnswlib is not installed - using the exact NumPy index")
+                index = NumpyVectorIndex(matrix, info, embedding_function)
+        else:
+            compact = None if precision == 'float32' else load_compact(persist_dir, matrix, precision)
+            index = NumpyVectorIndex(matrix, info, embedding_function, compact)
+
+    except Exception as e:
+        print(f" Could not open the {backend} vector index, querying Chroma: {e}")
+        return vector_db
+
+    precision_note = f" ({precision}, re-scored in float32)" if getattr(index, 'compact', None) else ""
+    print(f" Serving {len(index)} vectors from the {type(index).__name__}{precision_note}")
+    return index
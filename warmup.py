@@ -0,0 +1,106 @@
+"""
+Background warm-up of the answer tiers
+Importing the app only sets things up; the CSV bank, MiniLM and the
+handbook index are loaded afterwards by a daemon thread, one step per
+tier, so the process answers from the tiers that are already warm (the
+CSV tier within a second or so) instead of blocking until all of them
+are. Tier states are reported at /ready.
+"""
+import os
+import threading
+import time
+
+import metrics
+
+# '0' runs the warm-up steps in the importing thread, before serving
+WARMUP_BACKGROUND = os.getenv('WARMUP_BACKGROUND', '1') == '1'
+
+PENDING, LOADING, READY, FAILED = 'pending', 'loading', 'ready', 'failed'
+
+_lock = threading.Lock()
+_tiers = {}
+_done = threading.Event()
+
+
+def _set(tier, **fields):
+    with _lock:
+        _tiers[tier].update(fields)
+
+
+def start(steps, background=None):
+    """
+    Load the tiers in order
+    steps: list of (tier, load) where load() returns truthy once the tier can serve
+    background: run in a daemon thread (default WARMUP_BACKGROUND)
+    Returns: the warm-up thread, or None when the steps ran inline
+    """
+    with _lock:
+        for tier, _ in steps:
+            _tiers[tier] = {"state": PENDING, "seconds": None, "error": None}
+    _done.clear()
+
+    if background is None:
+        background = WARMUP_BACKGROUND
+    if not background:
+        _run(steps)
+        return None
+
+    thread = threading.Thread(target=_run, args=(steps,), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def resume(steps, background=None):
+    """
+    Run again the steps still pending or loading, e.g. in a worker forked
+    while the parent's warm-up thread was busy (that thread isn't forked)
+    Returns: the warm-up thread, or None when nothing was left or it ran inline
+    """
+    unfinished = [(tier, load) for tier, load in steps if is_warming(tier)]
+    if not unfinished:
+        return None
+    print(f" Resuming warm-up of {', '.join(tier for tier, _ in unfinished)}")
+    return start(unfinished, background)
+
+
+def _run(steps):
+    started = time.perf_counter()
+    for tier, load in steps:
+        _set(tier, state=LOADING)
+        step_started = time.perf_counter()
+        try:
+            state = READY if load() else FAILED
+            error = None
+        except Exception as e:
+            print(f" Warm-up of {tier} failed: {e}")
+            state, error = FAILED, str(e)
+
+        seconds = round(time.perf_counter() - step_started, 3)
+        _set(tier, state=state, seconds=seconds, error=error)
+        metrics.set_gauge(f'warmup.{tier}_seconds', seconds)
+        print(f" Warm-up: {tier} {state} in {seconds:.2f}s")
+
+    metrics.set_gauge('warmup.total_seconds', round(time.perf_counter() - started, 3))
+    _done.set()
+
+
+def status():
+    """{tier: {"state": ..., "seconds": ...}} for every registered tier"""
+    with _lock:
+        return {tier: dict(info) for tier, info in _tiers.items()}
+
+
+def is_warm(tier):
+    with _lock:
+        return _tiers.get(tier, {}).get("state") == READY
+
+
+def is_warming(tier):
+    """Whether tier is still waiting for its warm-up step (False for unregistered tiers)"""
+    with _lock:
+        return _tiers.get(tier, {}).get("state") in (PENDING, LOADING)
+
+
+def wait(timeout=None):
+    """Wait until every step has run; False on timeout"""
+    return _done.wait(timeout)